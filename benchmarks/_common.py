@@ -0,0 +1,78 @@
+"""Общие утилиты нагрузочных скриптов: запуск сервера, подпись вебхуков, перцентили."""
+
+import asyncio
+import hashlib
+import os
+import socket
+import sys
+from contextlib import asynccontextmanager
+
+from src.core.config import settings
+
+HOST = "127.0.0.1"
+
+
+def sign_webhook(event: dict) -> dict:
+    """Подписывает событие так же, как это делает платежная система."""
+    message = "".join(str(event[key]) for key in sorted(event)) + settings.SECRET_KEY
+    return {**event, "signature": hashlib.sha256(message.encode()).hexdigest()}
+
+
+def percentiles(samples: list[float]) -> dict:
+    """p50/p95/p99/max в миллисекундах."""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def running_server(env: dict[str, str] | None = None, *sanic_args: str):
+    """Запускает src.main:app в отдельном процессе и ждет, пока он начнет слушать порт."""
+    port = free_port()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "sanic",
+        "src.main:app",
+        "--host",
+        HOST,
+        "--port",
+        str(port),
+        "--no-access-logs",
+        "--no-motd",
+        *(sanic_args or ("--single-process",)),
+        env={**os.environ, **(env or {})},
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(200):
+            try:
+                _, writer = await asyncio.open_connection(HOST, port)
+                writer.close()
+                break
+            except OSError:
+                await asyncio.sleep(0.05)
+        else:
+            raise RuntimeError("Server did not start")
+        yield HOST, port
+    finally:
+        process.terminate()
+        await process.wait()
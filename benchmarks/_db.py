@@ -0,0 +1,167 @@
+"""Одноразовая база для бенчмарков: создание, миграции, наполнение, удаление."""
+
+import asyncio
+import os
+import random
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import asyncpg
+
+from src.core.config import settings
+from src.core.security import hash_password
+
+SEED_PASSWORD = "bench-password"
+
+
+def postgres_dsn(database: str) -> str:
+    return (
+        f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
+        f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{database}"
+    )
+
+
+@asynccontextmanager
+async def disposable_database(keep: bool = False):
+    """
+    Создает пустую базу рядом с базой из .env и применяет к ней миграции.
+
+    Возвращает имя базы и переменные окружения, с которыми сервер и
+    alembic подключатся к ней вместо рабочей. По выходу база удаляется.
+    """
+    name = f"bench_{uuid.uuid4().hex[:12]}"
+    admin = await asyncpg.connect(postgres_dsn(settings.POSTGRES_DB))
+    await admin.execute(f'CREATE DATABASE "{name}"')
+    env = {"POSTGRES_DB": name}
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "alembic",
+            "upgrade",
+            "head",
+            env={**os.environ, **env},
+            stdout=asyncio.subprocess.DEVNULL,
+        )
+        if await process.wait():
+            raise RuntimeError("alembic upgrade head failed")
+        yield name, env
+    finally:
+        if not keep:
+            await admin.execute(f'DROP DATABASE "{name}" WITH (FORCE)')
+        await admin.close()
+
+
+@dataclass
+class Seeded:
+    """Что было создано: пользователи, их счета и транзакции платежей."""
+
+    users: list[tuple[int, str]] = field(default_factory=list)  # (id, email)
+    accounts: dict[int, list[int]] = field(default_factory=dict)  # user -> счета
+    payments: list[tuple[str, int, int, Decimal]] = field(default_factory=list)
+
+
+async def seed(
+    database: str,
+    users: int,
+    accounts_per_user: int,
+    payments_per_account: int,
+    history_days: int = 90,
+) -> Seeded:
+    """
+    Наполняет базу через COPY: users, accounts и payments.
+
+    У всех пользователей один пароль (bcrypt считается один раз), платежи
+    равномерно разбросаны по последним history_days дням, а балансы
+    счетов равны сумме их платежей.
+    """
+    # Миграция создает секции payments только от текущего месяца
+    since = datetime.now() - timedelta(days=history_days)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        "src.tools.partitions",
+        "ensure",
+        "--since",
+        since.date().isoformat(),
+        env={**os.environ, "POSTGRES_DB": database},
+        stdout=asyncio.subprocess.DEVNULL,
+    )
+    if await process.wait():
+        raise RuntimeError("creating payment partitions failed")
+    conn = await asyncpg.connect(postgres_dsn(database))
+    seeded = Seeded()
+    try:
+        password_hash = hash_password(SEED_PASSWORD)
+        await conn.copy_records_to_table(
+            "users",
+            columns=["email", "full_name", "hashed_password", "is_admin"],
+            records=(
+                (f"bench{i}@example.com", f"Bench User {i}", password_hash, False)
+                for i in range(users)
+            ),
+        )
+        seeded.users = [
+            tuple(row)
+            for row in await conn.fetch(
+                "SELECT id, email FROM users WHERE email LIKE 'bench%' ORDER BY id"
+            )
+        ]
+
+        await conn.copy_records_to_table(
+            "accounts",
+            columns=["user_id", "balance"],
+            records=(
+                (user_id, Decimal("0.00"))
+                for user_id, _ in seeded.users
+                for _ in range(accounts_per_user)
+            ),
+        )
+        for account_id, user_id in await conn.fetch(
+            "SELECT id, user_id FROM accounts WHERE user_id = ANY($1::int[])"
+            " ORDER BY id",
+            [user_id for user_id, _ in seeded.users],
+        ):
+            seeded.accounts.setdefault(user_id, []).append(account_id)
+
+        now = datetime.now()
+        rng = random.Random(0)
+        for user_id, account_ids in seeded.accounts.items():
+            for account_id in account_ids:
+                for _ in range(payments_per_account):
+                    amount = Decimal(rng.randint(100, 100_000)) / 100
+                    seeded.payments.append(
+                        (uuid.uuid4().hex, user_id, account_id, amount)
+                    )
+        span = timedelta(days=history_days).total_seconds()
+        await conn.copy_records_to_table(
+            "payments",
+            columns=["transaction_id", "amount", "account_id", "created_at"],
+            records=(
+                (
+                    tid,
+                    amount,
+                    account_id,
+                    now - timedelta(seconds=rng.random() * span),
+                )
+                for tid, _, account_id, amount in seeded.payments
+            ),
+        )
+        await conn.execute("""
+            INSERT INTO payment_transactions (transaction_id, account_id, created_at)
+            SELECT transaction_id, account_id, created_at FROM payments
+            """)
+        await conn.execute("""
+            UPDATE accounts a SET balance = p.total
+            FROM (SELECT account_id, sum(amount) AS total
+                  FROM payments GROUP BY account_id) p
+            WHERE a.id = p.account_id
+            """)
+        await conn.execute("ANALYZE")
+    finally:
+        await conn.close()
+    return seeded
@@ -0,0 +1,178 @@
+"""
+Бенчмарк конкурентных зачислений на один и тот же счет.
+
+Сравнивает атомарный путь PaymentService.process_webhook с прежним
+read-modify-write (прочитать Account, прибавить в Python, сохранить)
+и проверяет корректность: итоговый баланс должен вырасти ровно на сумму
+уникальных платежей, а повторы одной транзакции не должны давать ошибок.
+
+Запуск (нужна БД из .env с примененными миграциями):
+    python -m benchmarks.credit_contention --credits 2000 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import delete, insert, select
+
+from src.api.schemas import WebhookEvent
+from src.core.database import async_session_maker, engines
+from src.models.tables import (
+    Account,
+    AccountStripe,
+    Payment,
+    PaymentTransaction,
+    User,
+)
+from src.services.payments import PaymentService, WebhookStatus
+
+AMOUNT = Decimal("1.00")
+
+
+async def legacy_credit(session, data: dict) -> WebhookStatus:
+    """Прежний алгоритм process_webhook: SELECT, += в Python, INSERT."""
+    existing = await session.get(PaymentTransaction, data["transaction_id"])
+    if existing:
+        return WebhookStatus.DUPLICATE
+    account = await session.get(Account, data["account_id"])
+    account.folded_balance += Decimal(data["amount"])
+    session.add(account)
+    session.add(
+        PaymentTransaction(transaction_id=data["transaction_id"], account_id=account.id)
+    )
+    session.add(
+        Payment(
+            transaction_id=data["transaction_id"],
+            amount=Decimal(data["amount"]),
+            account_id=account.id,
+        )
+    )
+    await session.commit()
+    return WebhookStatus.ACCEPTED
+
+
+async def create_account() -> tuple[int, int]:
+    async with async_session_maker() as session:
+        user_id = (
+            await session.execute(
+                insert(User)
+                .values(
+                    email=f"bench-{uuid.uuid4().hex}@example.com",
+                    hashed_password="!",
+                    is_admin=False,
+                )
+                .returning(User.id)
+            )
+        ).scalar_one()
+        account_id = (
+            await session.execute(
+                insert(Account).values(user_id=user_id).returning(Account.id)
+            )
+        ).scalar_one()
+        await session.commit()
+    return user_id, account_id
+
+
+async def drop_account(user_id: int, account_id: int) -> None:
+    async with async_session_maker() as session:
+        await session.execute(delete(Payment).where(Payment.account_id == account_id))
+        await session.execute(
+            delete(PaymentTransaction).where(
+                PaymentTransaction.account_id == account_id
+            )
+        )
+        await session.execute(
+            delete(AccountStripe).where(AccountStripe.account_id == account_id)
+        )
+        await session.execute(delete(Account).where(Account.id == account_id))
+        await session.execute(delete(User).where(User.id == user_id))
+        await session.commit()
+
+
+async def run(mode: str, credits: int, concurrency: int, duplicates: float) -> dict:
+    user_id, account_id = await create_account()
+    prefix = uuid.uuid4().hex
+    unique = [f"{prefix}-{i}" for i in range(credits)]
+    # Часть транзакций отправляем дважды подряд, имитируя гонку повторов
+    retried = int(credits * duplicates)
+    queue = [
+        tid for i, tid in enumerate(unique) for _ in range(2 if i < retried else 1)
+    ]
+    work: asyncio.Queue[str] = asyncio.Queue()
+    for tid in queue:
+        work.put_nowait(tid)
+
+    outcomes = {status.value: 0 for status in WebhookStatus}
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while not work.empty():
+            tid = work.get_nowait()
+            data = {
+                "transaction_id": tid,
+                "user_id": user_id,
+                "account_id": account_id,
+                "amount": str(AMOUNT),
+            }
+            async with async_session_maker() as session:
+                try:
+                    if mode == "legacy":
+                        status = await legacy_credit(session, data)
+                    else:
+                        status = await PaymentService(session).process_webhook(
+                            WebhookEvent(tid, user_id, account_id, AMOUNT)
+                        )
+                    outcomes[status.value] += 1
+                except Exception:
+                    errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    async with async_session_maker() as session:
+        balance = await session.scalar(
+            select(Account.balance).where(Account.id == account_id)
+        )
+    await drop_account(user_id, account_id)
+
+    expected = AMOUNT * outcomes[WebhookStatus.ACCEPTED.value]
+    return {
+        "mode": mode,
+        "requests": len(queue),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(queue) / elapsed, 1),
+        "outcomes": outcomes,
+        "errors": errors,
+        "balance": str(balance),
+        "expected_balance": str(expected),
+        "lost_updates": int((expected - balance) / AMOUNT),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--credits", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--mode", choices=["atomic", "legacy", "both"], default="both")
+    args = parser.parse_args()
+
+    engines.start()
+    modes = ["legacy", "atomic"] if args.mode == "both" else [args.mode]
+    results = [
+        await run(mode, args.credits, args.concurrency, args.duplicates)
+        for mode in modes
+    ]
+    await engines.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
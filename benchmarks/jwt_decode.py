@@ -0,0 +1,51 @@
+"""
+Стоимость decode_access_token на запрос: холодный и теплый кэш claims.
+
+Холодный случай - каждый вызов с пустым кэшем (полная проверка HMAC
+и разбор JSON), теплый - повторные вызовы с тем же токеном, как при
+опросе /users/me/accounts одним клиентом. Отдельно меряется поток
+невалидных токенов (отрицательный кэш).
+
+Запуск:
+    python -m benchmarks.jwt_decode --iterations 20000
+"""
+
+import argparse
+import json
+import time
+from datetime import timedelta
+
+from src.core.security import claims_cache, create_access_token, decode_access_token
+
+
+def measure(iterations: int, token: str, cold: bool) -> float:
+    """Среднее время одного вызова в микросекундах."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if cold:
+            claims_cache.clear()
+        decode_access_token(token)
+    return round((time.perf_counter() - started) / iterations * 1e6, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token(
+        {"sub": "testuser@example.com"}, expires_delta=timedelta(minutes=30)
+    )
+    bad_token = token[:-4] + "AAAA"
+    results = {
+        "valid_cold_us": measure(args.iterations, token, cold=True),
+        "valid_warm_us": measure(args.iterations, token, cold=False),
+        "invalid_cold_us": measure(args.iterations, bad_token, cold=True),
+        "invalid_warm_us": measure(args.iterations, bad_token, cold=False),
+        "cache": claims_cache.stats(),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Задержка легких запросов во время шквала логинов.
+
+Пока несколько клиентов непрерывно логинятся (bcrypt), пробные клиенты
+опрашивают `GET /` и `POST /webhooks/payment`; для них считаются p50/p95/p99.
+Сервер запускается дважды: с bcrypt прямо в цикле событий
+(PASSWORD_HASHER_WORKERS=0, как было раньше) и с пулом.
+
+Запуск (нужна БД из .env с примененными миграциями):
+    python -m benchmarks.login_storm --duration 10 --logins 8 --hasher-workers 2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+from benchmarks._common import percentiles, running_server, sign_webhook
+from benchmarks._http import HttpClient
+
+LOGIN = {"email": "testuser@example.com", "password": "password"}
+
+
+async def storm(host: str, port: int, duration: float, logins: int, probes: int):
+    deadline = time.perf_counter() + duration
+    latencies: dict[str, list[float]] = {"/": [], "/webhooks/payment": []}
+    login_count = 0
+
+    async def login_loop() -> None:
+        nonlocal login_count
+        client = HttpClient(host, port)
+        while time.perf_counter() < deadline:
+            status, _ = await client.request("POST", "/users/login", LOGIN)
+            assert status == 200, status
+            login_count += 1
+        await client.close()
+
+    async def probe_loop(path: str) -> None:
+        client = HttpClient(host, port)
+        while time.perf_counter() < deadline:
+            if path == "/":
+                started = time.perf_counter()
+                await client.request("GET", "/")
+            else:
+                event = sign_webhook(
+                    {
+                        "transaction_id": f"storm-{uuid.uuid4().hex}",
+                        "user_id": 1,
+                        "account_id": 1,
+                        "amount": 1,
+                    }
+                )
+                started = time.perf_counter()
+                await client.request("POST", path, event)
+            latencies[path].append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+        await client.close()
+
+    await asyncio.gather(
+        *(login_loop() for _ in range(logins)),
+        *(probe_loop(path) for path in latencies for _ in range(probes)),
+    )
+    return {
+        "logins_per_second": round(login_count / duration, 1),
+        **{path: percentiles(samples) for path, samples in latencies.items()},
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--logins", type=int, default=8)
+    parser.add_argument("--probes", type=int, default=2)
+    parser.add_argument("--hasher-workers", type=int, default=2)
+    args = parser.parse_args()
+
+    results = []
+    for workers in (0, args.hasher_workers):
+        env = {"PASSWORD_HASHER_WORKERS": str(workers)}
+        async with running_server(env) as (host, port):
+            result = await storm(host, port, args.duration, args.logins, args.probes)
+        results.append({"hasher_workers": workers, **result})
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,169 @@
+"""
+Накладные расходы SQLAlchemyRepository и скорость пачечных операций.
+
+1. Python-часть одного вызова get_one_or_none(email=...): сборка
+   конструкции и расчет ее ключа для кэша компиляции - прежний путь
+   (select(...).filter_by(...) на каждый вызов) против готовой
+   конструкции репозитория; и полный вызов с запросом к БД.
+2. Строк в секунду для пачек из 1, 100 и 10 000 строк: create в цикле
+   против create_many, upsert_many (половина строк уже есть), get_many
+   и update_many.
+
+Все изменения делаются в транзакции, которая откатывается.
+
+Запуск (нужна БД из .env с примененными миграциями):
+    python -m benchmarks.repository --repeat 3
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from sqlalchemy import select
+
+from src.core.database import async_session_maker, engines
+from src.models.tables import User
+from src.services.repository import SQLAlchemyRepository
+
+SIZES = (1, 100, 10_000)
+
+
+async def legacy_get_one_or_none(session, **filter_by):
+    """Прежний get_one_or_none: новая конструкция на каждый вызов."""
+    stmt = select(User).filter_by(**filter_by)
+    result = await session.execute(stmt)
+    return result.scalar_one_or_none()
+
+
+def python_overhead(calls: int) -> dict:
+    """Микросекунды на сборку конструкции и ее ключа кэша, без БД."""
+    repo = SQLAlchemyRepository(User, session=None)
+
+    def legacy() -> None:
+        select(User).filter_by(email="user@example.com")._generate_cache_key()
+
+    def cached() -> None:
+        stmt, _ = repo._filtered("select", {"email": "user@example.com"})
+        stmt._generate_cache_key()
+
+    result = {}
+    for name, call in (("legacy_us", legacy), ("cached_us", cached)):
+        started = time.perf_counter()
+        for _ in range(calls):
+            call()
+        result[name] = round((time.perf_counter() - started) / calls * 1e6, 2)
+    return result
+
+
+async def roundtrip(calls: int) -> dict:
+    """Микросекунды на полный вызов get_one_or_none(email=...) с БД."""
+    result = {}
+    async with async_session_maker() as session:
+        repo = SQLAlchemyRepository(User, session)
+        email = await session.scalar(select(User.email).limit(1))
+        cases = {
+            "legacy_us": lambda: legacy_get_one_or_none(session, email=email),
+            "cached_us": lambda: repo.get_one_or_none(email=email),
+        }
+        for name, call in cases.items():
+            await call()  # прогрев: подготовленный запрос asyncpg
+            started = time.perf_counter()
+            for _ in range(calls):
+                await call()
+            result[name] = round((time.perf_counter() - started) / calls * 1e6, 2)
+    return result
+
+
+def user_rows(size: int, tag: str) -> list[dict]:
+    return [
+        {"email": f"bench-{tag}-{i}@example.com", "hashed_password": "x"}
+        for i in range(size)
+    ]
+
+
+async def measure(size: int, operation: Callable) -> int:
+    """
+    Строк в секунду для operation над size строками. operation сама
+    готовит данные и возвращает время только измеряемой части; все
+    изменения откатываются.
+    """
+    async with async_session_maker() as session:
+        repo = SQLAlchemyRepository(User, session)
+        seconds = await operation(repo, uuid.uuid4().hex[:8])
+        await session.rollback()
+    return round(size / seconds)
+
+
+def operations(size: int) -> dict[str, Callable[..., Awaitable[float]]]:
+    async def timed(call: Awaitable) -> float:
+        started = time.perf_counter()
+        await call
+        return time.perf_counter() - started
+
+    async def create_loop(repo, tag):
+        started = time.perf_counter()
+        for row in user_rows(size, tag):
+            await repo.create(**row)
+        return time.perf_counter() - started
+
+    async def create_many(repo, tag):
+        return await timed(repo.create_many(user_rows(size, tag)))
+
+    async def create_many_no_returning(repo, tag):
+        return await timed(repo.create_many(user_rows(size, tag), returning=False))
+
+    async def upsert_many(repo, tag):
+        rows = user_rows(size, tag)
+        await repo.create_many(rows[: size // 2], returning=False)
+        return await timed(repo.upsert_many(rows, ["email"], ["full_name"]))
+
+    async def get_many(repo, tag):
+        users = await repo.create_many(user_rows(size, tag))
+        ids = [user.id for user in users]
+        repo.session.expunge_all()
+        return await timed(repo.get_many(ids))
+
+    async def update_many(repo, tag):
+        users = await repo.create_many(user_rows(size, tag))
+        rows = [
+            {"id": user.id, "full_name": f"Bench {i}"} for i, user in enumerate(users)
+        ]
+        return await timed(repo.update_many(rows))
+
+    return {
+        "create_loop": create_loop,
+        "create_many": create_many,
+        "create_many_no_returning": create_many_no_returning,
+        "upsert_many": upsert_many,
+        "get_many": get_many,
+        "update_many": update_many,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    engines.start()
+    report = {
+        "python_overhead": python_overhead(args.calls * 10),
+        "roundtrip": await roundtrip(args.calls),
+        "rows_per_second": {},
+    }
+    for size in SIZES:
+        for name, operation in operations(size).items():
+            if name == "create_loop" and size > 100:
+                continue  # 10 000 отдельных INSERT ничего нового не покажут
+            runs = [await measure(size, operation) for _ in range(args.repeat)]
+            report["rows_per_second"][f"{name}[{size}]"] = max(runs)
+    await engines.dispose()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
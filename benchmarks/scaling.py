@@ -0,0 +1,124 @@
+"""
+Масштабирование пропускной способности по числу воркеров Sanic.
+
+Создает и наполняет одноразовую базу (как benchmarks.suite), затем для
+каждого числа воркеров из --workers запускает сервер и нагружает
+выбранные сценарии. В JSON - пропускная способность, задержки и
+ускорение относительно первого прогона.
+
+Генератор нагрузки работает в --clients процессах на той же машине и
+тоже занимает ядра: чтобы увидеть рост до N воркеров, ядер нужно больше
+N. С --max-connections пулы воркеров делятся этим бюджетом
+(DB_MAX_CONNECTIONS), иначе у каждого свой DB_POOL_SIZE.
+
+Запуск:
+    python -m benchmarks.scaling --workers 1,2,4 --scenario me --duration 10
+    python -m benchmarks.scaling --scenario webhook_unique --max-connections 100
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks._common import running_server
+from benchmarks._db import Seeded, disposable_database, seed
+from benchmarks.suite import build_scenarios, drive
+
+
+def drive_process(
+    seeded: Seeded, name: str, host: str, port: int, args: argparse.Namespace
+) -> dict:
+    """Одна доля нагрузки: свой цикл событий в отдельном процессе."""
+    scenario = next(s for s in build_scenarios(seeded) if s.name == name)
+    return asyncio.run(
+        drive(
+            host,
+            port,
+            scenario,
+            args.concurrency // args.clients,
+            args.duration,
+            args.warmup,
+        )
+    )
+
+
+async def load(
+    pool: ProcessPoolExecutor,
+    seeded: Seeded,
+    name: str,
+    host: str,
+    port: int,
+    args: argparse.Namespace,
+) -> dict:
+    loop = asyncio.get_running_loop()
+    parts = await asyncio.gather(
+        *(
+            loop.run_in_executor(pool, drive_process, seeded, name, host, port, args)
+            for _ in range(args.clients)
+        )
+    )
+    return {
+        "requests": sum(part["requests"] for part in parts),
+        "errors": sum(part["errors"] for part in parts),
+        "throughput_rps": round(sum(part["throughput_rps"] for part in parts), 1),
+        # Перцентили процессов не складываются - худший из них
+        "p95_ms": max(part["latency"].get("p95_ms", 0) for part in parts),
+        "p99_ms": max(part["latency"].get("p99_ms", 0) for part in parts),
+    }
+
+
+async def main() -> None:
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--workers",
+        default=",".join(str(n) for n in sorted({1, 2, cores} - {0})),
+        help="числа воркеров через запятую (по умолчанию 1, 2 и число ядер)",
+    )
+    parser.add_argument("--scenario", action="append", help="по умолчанию - me")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--clients", type=int, default=2, help="процессов нагрузки")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--max-connections", type=int, default=0)
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=5.0,
+        help="пауза после старта: порт открывает первый воркер, не последний",
+    )
+    args = parser.parse_args()
+
+    names = args.scenario or ["me"]
+    results = {"cores": cores, "runs": []}
+    context = multiprocessing.get_context("spawn")
+    async with disposable_database() as (database, env):
+        seeded = await seed(database, args.users, 2, 20)
+        env = {**env, "DB_MAX_CONNECTIONS": str(args.max_connections)}
+        with ProcessPoolExecutor(args.clients, mp_context=context) as pool:
+            for workers in (int(n) for n in args.workers.split(",")):
+                sanic_args = ("--workers", str(workers))
+                async with running_server(env, *sanic_args) as (host, port):
+                    await asyncio.sleep(args.settle)
+                    for name in names:
+                        print(f"{workers} workers: {name}...", file=sys.stderr)
+                        result = await load(pool, seeded, name, host, port, args)
+                        results["runs"].append(
+                            {"workers": workers, "scenario": name, **result}
+                        )
+
+    for name in names:
+        runs = [run for run in results["runs"] if run["scenario"] == name]
+        base = runs[0]["throughput_rps"] or 1
+        for run in runs:
+            run["speedup"] = round(run["throughput_rps"] / base, 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
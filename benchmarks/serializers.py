@@ -0,0 +1,116 @@
+"""
+Стоимость сериализации ответов: схемы Pydantic против src.api.serializers.
+
+Старый путь - model_validate -> model_dump -> sanic json (ujson), новый -
+заранее собранный TypeAdapter.dump_json прямо из строк. Для каждой схемы
+(AccountPublic, UserWithAccounts, PaymentPublic) меряются списки из 1, 100
+и 10 000 объектов; результат - среднее время в микросекундах на список.
+
+Запуск:
+    python -m benchmarks.serializers --repeat 5
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Callable
+
+from sanic.response import json_dumps
+
+from src.api.schemas import AccountPublic, PaymentPublic, UserWithAccounts
+from src.api.serializers import dump_accounts, dump_payments_page, dump_users_page
+
+SIZES = (1, 100, 10_000)
+
+
+def make_account(i: int) -> SimpleNamespace:
+    return SimpleNamespace(id=i, balance=Decimal("1234.56"))
+
+
+def make_user(i: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=i,
+        email=f"user{i}@example.com",
+        full_name=f"User {i}",
+        accounts=[make_account(i * 2), make_account(i * 2 + 1)],
+    )
+
+
+def make_payment(i: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=i,
+        transaction_id=f"tx-{i:032d}",
+        amount=Decimal("99.95"),
+        account_id=1,
+        created_at=datetime(2025, 1, 1, 12, 0, 0),
+    )
+
+
+def legacy_accounts(accounts: list) -> bytes:
+    data = [AccountPublic.model_validate(a).model_dump() for a in accounts]
+    return json_dumps(data).encode()
+
+
+def legacy_users(users: list) -> bytes:
+    items = [UserWithAccounts.model_validate(u).model_dump() for u in users]
+    return json_dumps({"items": items, "next_after": None}).encode()
+
+
+def legacy_payments(payments: list) -> bytes:
+    items = [PaymentPublic.model_validate(p).model_dump(mode="json") for p in payments]
+    return json_dumps({"items": items, "next_cursor": None}).encode()
+
+
+CASES: dict[str, tuple[Callable, Callable, Callable]] = {
+    "AccountPublic": (make_account, legacy_accounts, dump_accounts),
+    "UserWithAccounts": (
+        make_user,
+        legacy_users,
+        lambda users: dump_users_page(users, None),
+    ),
+    "PaymentPublic": (
+        make_payment,
+        legacy_payments,
+        lambda payments: dump_payments_page(payments, None),
+    ),
+}
+
+
+def measure(encode: Callable[[list], bytes], objects: list, repeat: int) -> float:
+    """Лучшее из repeat время одного вызова в микросекундах."""
+    iterations = max(1, 10_000 // len(objects))
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            encode(objects)
+        best = min(best, (time.perf_counter() - started) / iterations)
+    return round(best * 1e6, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for name, (factory, legacy, fast) in CASES.items():
+        for size in SIZES:
+            objects = [factory(i) for i in range(size)]
+            # Оба пути должны давать один и тот же JSON
+            assert json.loads(legacy(objects)) == json.loads(fast(objects)), name
+            legacy_us = measure(legacy, objects, args.repeat)
+            fast_us = measure(fast, objects, args.repeat)
+            results[f"{name}[{size}]"] = {
+                "legacy_us": legacy_us,
+                "fast_us": fast_us,
+                "speedup": round(legacy_us / fast_us, 2),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Пропускная способность зачислений на один горячий счет в зависимости
+от числа полос (Account.stripes).
+
+Для каждого значения --stripes создается счет, на него параллельно
+отправляются --credits уникальных зачислений через
+PaymentService.process_webhook, после чего полосы сворачиваются и
+проверяется, что баланс вырос ровно на сумму зачислений.
+
+Нагрузка идет из --processes процессов: сборка и компиляция запроса
+зачисления стоят заметного CPU, и один процесс упирается в себя раньше,
+чем в блокировку строки счета. Каждый процесс держит --concurrency
+одновременных зачислений (пул соединений должен быть не меньше, см.
+DB_POOL_SIZE/DB_MAX_OVERFLOW).
+
+Запуск (нужна БД из .env с примененными миграциями):
+    python -m benchmarks.striped_credits --stripes 1,2,4,8,16 --processes 4
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import select
+
+from benchmarks.credit_contention import AMOUNT, create_account, drop_account
+from src.api.schemas import WebhookEvent
+from src.core.database import async_session_maker, engines
+from src.models.tables import Account
+from src.services.payments import PaymentService, WebhookStatus
+from src.services.stripes import StripeService
+
+
+async def credit_all(
+    user_id: int, account_id: int, credits: int, concurrency: int
+) -> tuple[int, int]:
+    """Зачисляет credits уникальных платежей; возвращает (accepted, errors)."""
+    engines.start()
+    work: asyncio.Queue[str] = asyncio.Queue()
+    for _ in range(credits):
+        work.put_nowait(uuid.uuid4().hex)
+    accepted = errors = 0
+
+    async def worker() -> None:
+        nonlocal accepted, errors
+        while not work.empty():
+            event = WebhookEvent(work.get_nowait(), user_id, account_id, AMOUNT)
+            async with async_session_maker() as session:
+                try:
+                    status = await PaymentService(session).process_webhook(event)
+                    accepted += status is WebhookStatus.ACCEPTED
+                except Exception:
+                    errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await engines.dispose()
+    return accepted, errors
+
+
+def credit_process(*args) -> tuple[int, int]:
+    return asyncio.run(credit_all(*args))
+
+
+async def run(
+    pool: ProcessPoolExecutor,
+    stripes: int,
+    credits: int,
+    processes: int,
+    concurrency: int,
+) -> dict:
+    user_id, account_id = await create_account()
+    async with async_session_maker() as session:
+        await StripeService(session).set_stripes(account_id, stripes)
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(
+            loop.run_in_executor(
+                pool,
+                credit_process,
+                user_id,
+                account_id,
+                credits // processes,
+                concurrency,
+            )
+            for _ in range(processes)
+        )
+    )
+    elapsed = time.perf_counter() - started
+    accepted = sum(a for a, _ in results)
+    errors = sum(e for _, e in results)
+    credits = credits // processes * processes
+
+    async with async_session_maker() as session:
+        balance = await session.scalar(
+            select(Account.balance).where(Account.id == account_id)
+        )
+        # Свернутый баланс должен совпасть с суммой полос до сворачивания
+        await StripeService(session).set_stripes(account_id, 1)
+        folded = await session.scalar(
+            select(Account.folded_balance).where(Account.id == account_id)
+        )
+    await drop_account(user_id, account_id)
+
+    return {
+        "stripes": stripes,
+        "credits": credits,
+        "processes": processes,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "credits_per_second": round(credits / elapsed, 1),
+        "errors": errors,
+        "balance_ok": balance == folded == AMOUNT * accepted == AMOUNT * credits,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--stripes", default="1,2,4,8,16")
+    parser.add_argument("--credits", type=int, default=4000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    engines.start()
+    # spawn, а не fork: процессы не должны наследовать соединения пула
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(args.processes, mp_context=context) as pool:
+        results = [
+            await run(
+                pool, int(stripes), args.credits, args.processes, args.concurrency
+            )
+            for stripes in args.stripes.split(",")
+        ]
+    base = results[0]["credits_per_second"]
+    for result in results:
+        result["speedup"] = round(result["credits_per_second"] / base, 2)
+    await engines.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
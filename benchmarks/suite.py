@@ -0,0 +1,285 @@
+"""
+Нагрузочный набор сценариев API на одноразовой базе.
+
+Создает временную базу рядом с базой из .env, применяет миграции,
+наполняет ее пользователями, счетами и платежами, запускает сервер
+и по очереди нагружает сценарии с заданной конкурентностью:
+
+    webhook_unique      - зачисления с новыми transaction_id на случайные счета
+    webhook_duplicate   - повторы уже зачисленных транзакций
+    webhook_contention  - новые зачисления на один и тот же счет
+    login               - POST /users/login (bcrypt)
+    me, me_accounts, me_payments - чтение от имени случайных пользователей
+    admin_users         - страница GET /users/ от администратора
+
+Перед нагрузкой проверяется, что вебхук со слишком длинным
+transaction_id отвергается: 400 от /webhooks/payment и статус rejected
+для этого события в пачке, где остальные события зачисляются.
+
+Результат - JSON с пропускной способностью и p50/p95/p99 для каждого
+сценария. С --baseline результаты сравниваются с сохраненным прогоном,
+и при деградации сверх --max-regression скрипт завершается с кодом 1.
+
+Запуск:
+    python -m benchmarks.suite --users 1000 --duration 10 --output bench.json
+    python -m benchmarks.suite --baseline bench.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+from benchmarks._common import percentiles, running_server, sign_webhook
+from benchmarks._db import SEED_PASSWORD, Seeded, disposable_database, seed
+from benchmarks._http import HttpClient
+from src.api.schemas import TRANSACTION_ID_MAX_LENGTH
+from src.core.security import create_access_token
+
+ADMIN_EMAIL = "admin@example.com"  # создается начальной миграцией
+
+# (method, path, body, headers)
+Request = tuple[str, str, object, dict[str, str] | None]
+
+
+@dataclass
+class Scenario:
+    name: str
+    make_request: Callable[[random.Random], Request]
+
+
+def build_scenarios(seeded: Seeded) -> list[Scenario]:
+    owners = [
+        (user_id, account_id)
+        for user_id, account_ids in seeded.accounts.items()
+        for account_id in account_ids
+    ]
+    tokens = {
+        user_id: {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+        for user_id, email in seeded.users
+    }
+    user_ids = list(tokens)
+    emails = [email for _, email in seeded.users]
+    admin = {"Authorization": f"Bearer {create_access_token({'sub': ADMIN_EMAIL})}"}
+    hot_user, hot_account = owners[0]
+
+    def credit(user_id: int, account_id: int, tid: str, amount: object) -> Request:
+        event = {
+            "transaction_id": tid,
+            "user_id": user_id,
+            "account_id": account_id,
+            "amount": str(amount),
+        }
+        return "POST", "/webhooks/payment", sign_webhook(event), None
+
+    def webhook_unique(rng: random.Random) -> Request:
+        return credit(*rng.choice(owners), uuid.uuid4().hex, "1.00")
+
+    def webhook_duplicate(rng: random.Random) -> Request:
+        tid, user_id, account_id, amount = rng.choice(seeded.payments)
+        return credit(user_id, account_id, tid, amount)
+
+    def webhook_contention(rng: random.Random) -> Request:
+        return credit(hot_user, hot_account, uuid.uuid4().hex, "1.00")
+
+    def login(rng: random.Random) -> Request:
+        body = {"email": rng.choice(emails), "password": SEED_PASSWORD}
+        return "POST", "/users/login", body, None
+
+    def me(rng: random.Random) -> Request:
+        return "GET", "/users/me", None, tokens[rng.choice(user_ids)]
+
+    def me_accounts(rng: random.Random) -> Request:
+        return "GET", "/users/me/accounts", None, tokens[rng.choice(user_ids)]
+
+    def me_payments(rng: random.Random) -> Request:
+        return "GET", "/users/me/payments", None, tokens[rng.choice(user_ids)]
+
+    def admin_users(rng: random.Random) -> Request:
+        after = rng.choice(user_ids) - 1
+        return "GET", f"/users/?limit=100&after={after}", None, admin
+
+    return [
+        Scenario(func.__name__, func)
+        for func in (
+            webhook_unique,
+            webhook_duplicate,
+            webhook_contention,
+            login,
+            me,
+            me_accounts,
+            me_payments,
+            admin_users,
+        )
+    ]
+
+
+async def check_long_transaction_id(host: str, port: int, seeded: Seeded) -> None:
+    """Слишком длинный transaction_id - 400 и rejected, а не 500."""
+    user_id, account_ids = next(iter(seeded.accounts.items()))
+
+    def event(tid: str) -> dict:
+        # id и сумма - числа JSON, как в обычном событии
+        return sign_webhook(
+            {
+                "transaction_id": tid,
+                "user_id": user_id,
+                "account_id": account_ids[0],
+                "amount": 1,
+            }
+        )
+
+    long_tid = "x" * (TRANSACTION_ID_MAX_LENGTH + 1)
+    client = HttpClient(host, port)
+    try:
+        status, _ = await client.request("POST", "/webhooks/payment", event(long_tid))
+        assert status == 400, status
+        batch = [event(uuid.uuid4().hex), event(long_tid)]
+        status, body = await client.request("POST", "/webhooks/payments/batch", batch)
+        assert status == 200, status
+        results = [result["status"] for result in json.loads(body)["results"]]
+        assert results == ["accepted", "rejected"], results
+    finally:
+        await client.close()
+
+
+async def drive(
+    host: str,
+    port: int,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> dict:
+    """Держит concurrency keep-alive соединений занятыми в течение duration."""
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    errors = 0
+    recording = False
+    deadline = time.perf_counter() + warmup + duration
+
+    async def client(seed_value: int) -> None:
+        nonlocal errors
+        rng = random.Random(seed_value)
+        http = HttpClient(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body, headers = scenario.make_request(rng)
+                started = time.perf_counter()
+                try:
+                    status, _ = await http.request(method, path, body, headers)
+                except (OSError, asyncio.IncompleteReadError):
+                    status = 0
+                elapsed = time.perf_counter() - started
+                if not recording:
+                    continue
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if not 200 <= status < 300:
+                    errors += 1
+        finally:
+            await http.close()
+
+    tasks = [asyncio.create_task(client(i)) for i in range(concurrency)]
+    await asyncio.sleep(warmup)
+    recording = True
+    started = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "latency": percentiles(latencies),
+    }
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> dict:
+    """Отношения к базовому прогону и список деградаций сверх порога."""
+    comparison, regressions = {}, []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous or not previous["requests"] or not current["requests"]:
+            continue
+        throughput = current["throughput_rps"] / previous["throughput_rps"]
+        p95 = current["latency"]["p95_ms"] / max(previous["latency"]["p95_ms"], 0.01)
+        comparison[name] = {
+            "throughput_ratio": round(throughput, 3),
+            "p95_ratio": round(p95, 3),
+        }
+        if throughput < 1 - max_regression:
+            regressions.append(f"{name}: throughput x{throughput:.2f}")
+        if p95 > 1 + max_regression:
+            regressions.append(f"{name}: p95 x{p95:.2f}")
+    return {"scenarios": comparison, "regressions": regressions}
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--accounts-per-user", type=int, default=2)
+    parser.add_argument("--payments-per-account", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--scenario", action="append", help="по умолчанию - все")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="файл для JSON (по умолчанию stdout)")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--keep-db", action="store_true")
+    args = parser.parse_args()
+
+    sanic_args = ("--single-process",)
+    if args.workers > 1:
+        sanic_args = ("--workers", str(args.workers))
+
+    results = {
+        "params": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "baseline", "keep_db")
+        },
+        "scenarios": {},
+    }
+    async with disposable_database(keep=args.keep_db) as (database, env):
+        seeded = await seed(
+            database, args.users, args.accounts_per_user, args.payments_per_account
+        )
+        results["params"]["database"] = database
+        scenarios = [
+            s
+            for s in build_scenarios(seeded)
+            if not args.scenario or s.name in args.scenario
+        ]
+        async with running_server(env, *sanic_args) as (host, port):
+            await check_long_transaction_id(host, port, seeded)
+            for scenario in scenarios:
+                print(f"running {scenario.name}...", file=sys.stderr)
+                results["scenarios"][scenario.name] = await drive(
+                    host, port, scenario, args.concurrency, args.duration, args.warmup
+                )
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["comparison"] = compare(results, json.load(f), args.max_regression)
+        exit_code = 1 if results["comparison"]["regressions"] else 0
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,128 @@
+"""
+Задержка первых запросов воркера без прогрева пула и с ним.
+
+На одноразовой базе (как benchmarks.suite) сервер запускается заново
+для каждого сценария и каждого повтора: с DB_POOL_WARM_CONNECTIONS=0
+(холодный старт - соединения открываются и запросы готовятся первыми
+запросами) и с прогревом. Прогретый сервер нагружается после того, как
+GET /ready ответил 200. Первые запросы - --burst одновременных запросов
+сразу после старта:
+
+    me       - GET /users/me разных пользователей (промах кэша principal)
+    webhook  - POST /webhooks/payment с новыми transaction_id
+
+Результат - JSON с p50/p95/max этих первых запросов для обоих режимов.
+
+Запуск:
+    python -m benchmarks.warmup --burst 4 --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+
+from benchmarks._common import percentiles, running_server, sign_webhook
+from benchmarks._db import Seeded, disposable_database, seed
+from benchmarks._http import HttpClient
+from src.core.security import create_access_token
+
+
+async def wait_ready(host: str, port: int, timeout: float = 30) -> float:
+    """Ждет 200 от /ready; возвращает, сколько секунд это заняло."""
+    started = time.perf_counter()
+    client = HttpClient(host, port)
+    try:
+        while time.perf_counter() - started < timeout:
+            status, _ = await client.request("GET", "/ready")
+            if status == 200:
+                return time.perf_counter() - started
+            await asyncio.sleep(0.02)
+    finally:
+        await client.close()
+    raise RuntimeError("Server did not become ready")
+
+
+def first_requests(seeded: Seeded, scenario: str, burst: int, rng: random.Random):
+    """burst запросов, каждый - первый в своем соединении."""
+    if scenario == "me":
+        for user_id, email in rng.sample(seeded.users, burst):
+            token = create_access_token({"sub": email})
+            yield "GET", "/users/me", None, {"Authorization": f"Bearer {token}"}
+        return
+    owners = [
+        (user_id, account_id)
+        for user_id, account_ids in seeded.accounts.items()
+        for account_id in account_ids
+    ]
+    for user_id, account_id in rng.sample(owners, burst):
+        event = {
+            "transaction_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "account_id": account_id,
+            "amount": "1.00",
+        }
+        yield "POST", "/webhooks/payment", sign_webhook(event), None
+
+
+async def measure(host: str, port: int, requests: list) -> list[float]:
+    async def one(method, path, body, headers) -> float:
+        client = HttpClient(host, port)
+        try:
+            started = time.perf_counter()
+            status, _ = await client.request(method, path, body, headers)
+            elapsed = time.perf_counter() - started
+        finally:
+            await client.close()
+        assert 200 <= status < 300, status
+        return elapsed
+
+    return list(await asyncio.gather(*(one(*request) for request in requests)))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--burst", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--warm-connections",
+        type=int,
+        default=4,
+        help="DB_POOL_WARM_CONNECTIONS прогретого сервера",
+    )
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    modes = {"cold": 0, "warm": args.warm_connections}
+    results: dict[str, dict] = {mode: {} for mode in modes}
+    rng = random.Random(0)
+    async with disposable_database() as (database, env):
+        seeded = await seed(database, args.users, 2, 5)
+        for scenario in ("me", "webhook"):
+            samples = {mode: [] for mode in modes}
+            ready = {mode: [] for mode in modes}
+            for _ in range(args.repeat):
+                for mode, connections in modes.items():
+                    print(f"{scenario}: {mode}...", file=sys.stderr)
+                    server_env = {
+                        **env,
+                        "DB_POOL_WARM_CONNECTIONS": str(connections),
+                        "DB_POOL_SIZE": str(max(args.burst, connections)),
+                    }
+                    requests = list(first_requests(seeded, scenario, args.burst, rng))
+                    async with running_server(server_env) as (host, port):
+                        ready[mode].append(await wait_ready(host, port))
+                        samples[mode] += await measure(host, port, requests)
+            for mode in modes:
+                results[mode][scenario] = {
+                    "ready_after_ms": round(max(ready[mode]) * 1000, 1),
+                    "first_requests": percentiles(samples[mode]),
+                }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
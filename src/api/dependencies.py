@@ -6,18 +6,23 @@ from sanic.exceptions import Unauthorized, Forbidden
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.security import decode_access_token
-from src.models.tables import User
+from src.services.principals import Principal, principal_cache
 from src.services.users import UserService
 
 
-def protected(admin_only: bool = False):
+def protected(admin_only: bool = False, read_only: bool = False):
+    """
+    Требует валидный токен; пользователь - в request.ctx.user.
+
+    read_only=True - обработчик только читает: его запросы к БД могут
+    идти на реплику (см. src/core/routing.py). Если пользователя нет в
+    кэше воркера, весь запрос остается в основной базе.
+    """
+
     def decorator(f: Callable):
         @wraps(f)
         async def decorated_function(request: Request, *args, **kwargs):
-            # 1. Получаем сессию из контекста
-            session: AsyncSession = request.ctx.session
-
-            # 2. Проверяем токен
+            # 1. Проверяем токен
             auth_header = request.headers.get("Authorization")
             if not auth_header or not auth_header.startswith("Bearer "):
                 raise Unauthorized("Authorization header is missing or invalid")
@@ -27,25 +32,29 @@ def protected(admin_only: bool = False):
             if not token_data or not token_data.get("sub"):
                 raise Unauthorized("Invalid token")
 
-            # 3. Находим пользователя
+            # 2. Находим пользователя (обычно - в кэше воркера, без запроса к БД).
+            # При промахе сессия запроса открывается здесь, еще в основной
+            # базе: на реплике только что созданного пользователя может не быть
             email = token_data["sub"]
-            user_service = UserService(session)
-
-            user: User | None = await user_service.get_user_by_email(email=email)
+            user: Principal | None = principal_cache.get(email)
+            if user is None:
+                session: AsyncSession = request.ctx.session
+                user = await UserService(session).load_principal(email=email)
 
             if user is None:
                 raise Unauthorized("User not found")
 
-            # 4. Проверяем права администратора, если требуется
+            # 3. Проверяем права администратора, если требуется
             # --- ИСПРАВЛЕНО (еще раз!) ---
             # Используем явное сравнение, чтобы помочь Pylance
             if admin_only and user.is_admin is False:
                 raise Forbidden("You do not have permission to access this resource")
 
-            # 5. КЛАДЕМ пользователя в контекст запроса
+            # 4. КЛАДЕМ пользователя в контекст запроса
             request.ctx.user = user
+            request.ctx.read_only = read_only
 
-            # 6. Вызываем оригинальный обработчик роута
+            # 5. Вызываем оригинальный обработчик роута
             response = await f(request, *args, **kwargs)
             return response
 
@@ -1,5 +1,41 @@
+from datetime import datetime
 from decimal import Decimal
-from pydantic import BaseModel, ConfigDict, EmailStr
+from typing import Annotated, NamedTuple
+
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    ConfigDict,
+    EmailStr,
+    Field,
+    PlainSerializer,
+    with_config,
+)
+from typing_extensions import TypedDict
+
+# Денежные суммы в JSON отдаются числами, как и раньше через ujson
+MoneyOut = Annotated[
+    Decimal, PlainSerializer(float, return_type=float, when_used="json")
+]
+
+_CENT = Decimal("0.01")
+_MONEY_LIMIT = Decimal(10) ** 8  # Numeric(10, 2)
+# CHECK на payment_transactions.transaction_id; заодно держит payload
+# NOTIFY с transaction_id (src/services/dedup.py) далеко от 8000 байт
+TRANSACTION_ID_MAX_LENGTH = 255
+
+
+def check_money(value: Decimal) -> Decimal:
+    # Дешевле, чем max_digits/decimal_places в Field
+    if not value.is_finite() or abs(value) >= _MONEY_LIMIT:
+        raise ValueError("amount is out of range")
+    if value != value.quantize(_CENT):
+        raise ValueError("amount must have at most 2 decimal places")
+    return value
+
+
+# Входящие суммы: ограничения колонки Money проверяются до запроса в БД
+MoneyIn = Annotated[Decimal, AfterValidator(check_money)]
 
 
 # --- Базовые схемы для моделей SQLAlchemy ---
@@ -12,7 +48,7 @@ class OrmBase(BaseModel):
 # --- Схемы для сущности Account ---
 class AccountPublic(OrmBase):
     id: int
-    balance: Decimal
+    balance: MoneyOut
 
 
 # --- Схемы для сущности User ---
@@ -33,6 +69,24 @@ class UserWithAccounts(UserPublic):
     accounts: list[AccountPublic] = []
 
 
+# Полосы горячего счета (см. Account.stripes)
+class AccountStripesUpdate(BaseModel):
+    # Больше полос - меньше конкуренции за строку, но дороже чтение баланса
+    stripes: int = Field(ge=1, le=64)
+
+
+class AccountStripes(AccountPublic):
+    user_id: int
+    stripes: int
+
+
+# Баланс счета на момент времени (см. LedgerService.balance_at)
+class AccountBalanceAt(BaseModel):
+    account_id: int
+    at: datetime
+    balance: MoneyOut
+
+
 class UserUpdate(BaseModel):
     email: EmailStr | None = None
     password: str | None = None
@@ -43,8 +97,31 @@ class UserUpdate(BaseModel):
 class PaymentPublic(OrmBase):
     id: int
     transaction_id: str
+    amount: MoneyOut
+    account_id: int
+    created_at: datetime
+
+
+# --- Схемы для вебхуков ---
+class WebhookEvent(NamedTuple):
+    """Проверенное событие платежной системы (без подписи)."""
+
+    transaction_id: str
+    user_id: int
+    account_id: int
     amount: Decimal
+
+
+# Схема входящего события; лишние поля (signature) игнорируются.
+# Как и раньше, числовой transaction_id приводится к строке
+@with_config(ConfigDict(coerce_numbers_to_str=True))
+class WebhookEventIn(TypedDict):
+    transaction_id: Annotated[
+        str, Field(min_length=1, max_length=TRANSACTION_ID_MAX_LENGTH)
+    ]
+    user_id: int
     account_id: int
+    amount: MoneyIn
 
 
 # --- Схемы для аутентификации ---
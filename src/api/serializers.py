@@ -0,0 +1,112 @@
+"""
+Быстрая сериализация ответов на чтение.
+
+Вместо model_validate -> model_dump -> json (три прохода по каждому
+объекту) строки из БД перекладываются в словари и кодируются в bytes
+заранее собранными TypeAdapter'ами. Валидации нет: данные пришли из БД
+и уже соответствуют схеме. Формат JSON совпадает со схемами из
+src.api.schemas, включая суммы-числа (MoneyOut).
+"""
+
+from datetime import datetime
+from typing import Any, Iterable, TypedDict
+
+from pydantic import TypeAdapter
+from sanic.response import HTTPResponse
+
+from src.api.schemas import MoneyOut
+
+
+# Структуры повторяют публичные схемы (AccountPublic, UserPublic и т.д.)
+class AccountOut(TypedDict):
+    id: int
+    balance: MoneyOut
+
+
+class UserOut(TypedDict):
+    id: int
+    email: str
+    full_name: str | None
+
+
+class UserWithAccountsOut(UserOut):
+    accounts: list[AccountOut]
+
+
+class PaymentOut(TypedDict):
+    id: int
+    transaction_id: str
+    amount: MoneyOut
+    account_id: int
+    created_at: datetime
+
+
+class UsersPage(TypedDict):
+    items: list[UserWithAccountsOut]
+    next_after: int | None
+
+
+class PaymentsPage(TypedDict):
+    items: list[PaymentOut]
+    next_cursor: str | None
+
+
+_user = TypeAdapter(UserOut)
+_user_with_accounts = TypeAdapter(UserWithAccountsOut)
+_accounts = TypeAdapter(list[AccountOut])
+_users_page = TypeAdapter(UsersPage)
+_payments_page = TypeAdapter(PaymentsPage)
+
+
+def _account(account: Any) -> AccountOut:
+    return {"id": account.id, "balance": account.balance}
+
+
+def _payment(payment: Any) -> PaymentOut:
+    return {
+        "id": payment.id,
+        "transaction_id": payment.transaction_id,
+        "amount": payment.amount,
+        "account_id": payment.account_id,
+        "created_at": payment.created_at,
+    }
+
+
+def dump_user(user: Any) -> bytes:
+    """Пользователь (ORM-объект, Principal или строка) в JSON."""
+    return _user.dump_json(
+        {"id": user.id, "email": user.email, "full_name": user.full_name}
+    )
+
+
+def dump_accounts(accounts: Iterable[Any]) -> bytes:
+    return _accounts.dump_json([_account(account) for account in accounts])
+
+
+def dump_user_with_accounts(user: UserWithAccountsOut) -> bytes:
+    """Одна строка потока NDJSON (словарь из stream_users_with_accounts)."""
+    return _user_with_accounts.dump_json(user)
+
+
+def dump_users_page(users: Iterable[Any], next_after: int | None) -> bytes:
+    items: list[UserWithAccountsOut] = [
+        {
+            "id": user.id,
+            "email": user.email,
+            "full_name": user.full_name,
+            "accounts": [_account(account) for account in user.accounts],
+        }
+        for user in users
+    ]
+    return _users_page.dump_json({"items": items, "next_after": next_after})
+
+
+def dump_payments_page(payments: Iterable[Any], next_cursor: str | None) -> bytes:
+    return _payments_page.dump_json(
+        {"items": [_payment(p) for p in payments], "next_cursor": next_cursor}
+    )
+
+
+def json_bytes(body: bytes, status: int = 200) -> HTTPResponse:
+    """Ответ с уже закодированным JSON, без повторной сериализации."""
+    return HTTPResponse(body, status=status, content_type="application/json")
@@ -1,24 +1,49 @@
-from datetime import timedelta
+import base64
+import binascii
+from datetime import datetime, timedelta, timezone
 from sanic import Blueprint, Request, json
-from sanic.exceptions import Unauthorized, NotFound
+from sanic.exceptions import InvalidUsage, Unauthorized, NotFound
 from sqlalchemy.ext.asyncio import AsyncSession  # <--- ДОБАВЛЕНО
 
 from src.api.dependencies import protected
 from src.api.schemas import (  # <--- ВСЕ СХЕМЫ СОБРАНЫ ВМЕСТЕ
-    AccountPublic,
+    AccountBalanceAt,
+    AccountStripes,
+    AccountStripesUpdate,
     UserCreate,
-    UserPublic,
     UserUpdate,
-    UserWithAccounts,
 )
-from src.core.security import create_access_token, verify_password
-from src.models.tables import User
+from src.api.serializers import (
+    dump_accounts,
+    dump_payments_page,
+    dump_user,
+    dump_user_with_accounts,
+    dump_users_page,
+    json_bytes,
+)
+from src.core.routing import read_router
+from src.core.security import (
+    claims_cache,
+    create_access_token,
+    verify_password_async,
+)
+from src.services.balances import balance_cache
+from src.services.dedup import recent_transactions
+from src.services.ledger import LedgerService
+from src.services.payments import PaymentService
+from src.services.principals import Principal, principal_cache
+from src.services.stripes import StripeService
 from src.services.users import UserService
 
 # Создаем Blueprint для пользователей
 # url_prefix добавит '/users' ко всем роутам в этом файле
 users_bp = Blueprint("users", url_prefix="/users")
 
+USERS_PAGE_DEFAULT_LIMIT = 100
+USERS_PAGE_MAX_LIMIT = 1000
+PAYMENTS_PAGE_DEFAULT_LIMIT = 50
+PAYMENTS_PAGE_MAX_LIMIT = 500
+
 
 # --- Эндпоинт для авторизации ---
 @users_bp.post("/login")
@@ -34,7 +59,7 @@ async def login_for_access_token(request: Request):  # Убираем session
     user_service = UserService(session)
     user = await user_service.get_user_by_email(email=email)
 
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password_async(password, user.hashed_password):
         raise Unauthorized("Incorrect email or password")
 
     # Создаем токен
@@ -49,47 +74,159 @@ async def login_for_access_token(request: Request):  # Убираем session
 
 
 @users_bp.get("/me")
-@protected()  # <--- ПРИМЕНЯЕМ ДЕКОРАТОР
+@protected(read_only=True)  # <--- ПРИМЕНЯЕМ ДЕКОРАТОР
 async def read_users_me(request: Request):
     # Берем пользователя прямо из контекста
-    current_user: User = request.ctx.user
+    current_user: Principal = request.ctx.user
 
-    response_data = UserPublic.model_validate(current_user)
-    return json(response_data.model_dump())
+    return json_bytes(dump_user(current_user))
 
 
 @users_bp.get("/me/accounts")
-@protected()  # <--- ПРИМЕНЯЕМ ДЕКОРАТОР
+@protected(read_only=True)  # <--- ПРИМЕНЯЕМ ДЕКОРАТОР
 async def read_my_accounts(request: Request):
-    current_user: User = request.ctx.user
-
-    accounts_data = [AccountPublic.model_validate(acc) for acc in current_user.accounts]
-    return json([acc.model_dump() for acc in accounts_data])
+    current_user: Principal = request.ctx.user
+    accounts = await UserService(request.ctx.session).get_user_balances(current_user.id)
+    return json_bytes(dump_accounts(accounts))
 
 
 @users_bp.get("/me/payments")
-@protected()  # <--- ПРИМЕНЯЕМ ДЕКОРАТОР
+@protected(read_only=True)  # <--- ПРИМЕНЯЕМ ДЕКОРАТОР
 async def read_my_payments(request: Request):
-    current_user: User = request.ctx.user
+    """
+    История платежей текущего пользователя, от новых к старым.
+
+    Параметры: limit, cursor (next_cursor из предыдущего ответа),
+    from/to (ISO-дата или дата-время, to не включается), account_id.
+    """
+    current_user: Principal = request.ctx.user
+
+    try:
+        limit = int(request.args.get("limit", PAYMENTS_PAGE_DEFAULT_LIMIT))
+        account_id = request.args.get("account_id")
+        account_id = int(account_id) if account_id is not None else None
+        date_from = _parse_datetime(request.args.get("from"))
+        date_to = _parse_datetime(request.args.get("to"))
+        cursor = request.args.get("cursor")
+        before = _decode_payments_cursor(cursor) if cursor else None
+    except ValueError:
+        raise InvalidUsage("Invalid pagination or filter parameters")
+    if not 1 <= limit <= PAYMENTS_PAGE_MAX_LIMIT:
+        raise InvalidUsage(f"limit must be between 1 and {PAYMENTS_PAGE_MAX_LIMIT}")
+
+    payment_service = PaymentService(request.ctx.session)
+    payments = await payment_service.get_user_payments(
+        current_user.id,
+        limit=limit,
+        before=before,
+        date_from=date_from,
+        date_to=date_to,
+        account_id=account_id,
+    )
+    next_cursor = None
+    if len(payments) == limit:
+        next_cursor = _encode_payments_cursor(payments[-1].created_at, payments[-1].id)
+    return json_bytes(dump_payments_page(payments, next_cursor))
+
+
+@users_bp.get("/me/accounts/<account_id:int>/balance")
+@protected(read_only=True)
+async def read_my_balance_at(request: Request, account_id: int):
+    """
+    Баланс счета текущего пользователя на момент at (ISO-дата или
+    дата-время; по умолчанию - сейчас).
+    """
+    current_user: Principal = request.ctx.user
+    try:
+        at = _parse_datetime(request.args.get("at"))
+    except ValueError:
+        raise InvalidUsage("Invalid 'at' parameter")
+    if at is None:
+        at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    balance = await LedgerService(request.ctx.session).balance_at(
+        current_user.id, account_id, at
+    )
+    if balance is None:
+        raise NotFound("Account not found")
+    body = AccountBalanceAt(account_id=account_id, at=at, balance=balance)
+    return json_bytes(body.model_dump_json().encode())
+
+
+def _parse_datetime(value: str | None) -> datetime | None:
+    """ISO-дата/время в наивное UTC-время, как хранится payments.created_at."""
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _encode_payments_cursor(created_at: datetime, payment_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{payment_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
 
-    all_payments = []
-    for account in current_user.accounts:
-        all_payments.extend(account.payments)
 
-    return json([p.id for p in all_payments])
+def _decode_payments_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        created_at, payment_id = base64.urlsafe_b64decode(cursor).decode().split("|")
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Malformed cursor") from e
+    return datetime.fromisoformat(created_at), int(payment_id)
 
 
 # --- Эндпоинты для Админа ---
 
 
 @users_bp.get("/")
-@protected(admin_only=True)
+@protected(admin_only=True, read_only=True)
 async def get_all_users(request: Request):
+    """
+    Список пользователей со счетами.
+
+    По умолчанию - страница: ?limit=N&after=<id последнего пользователя>,
+    в ответе next_after для следующей страницы (null - страниц больше нет).
+    С ?format=ndjson - все пользователи потоком, по одному JSON на строку.
+    """
+    if request.args.get("format") == "ndjson":
+        # Своя сессия: response-middleware закрывает request.ctx.session
+        # еще при отправке заголовков, а курсор нужен до конца потока
+        async with request.ctx.open_session() as session:
+            response = await request.respond(content_type="application/x-ndjson")
+            async for user in UserService(session).stream_users_with_accounts():
+                await response.send(dump_user_with_accounts(user) + b"\n")
+            await response.eof()
+        return
+
+    try:
+        limit = int(request.args.get("limit", USERS_PAGE_DEFAULT_LIMIT))
+        after = request.args.get("after")
+        after = int(after) if after is not None else None
+    except ValueError:
+        raise InvalidUsage("limit and after must be integers")
+    if not 1 <= limit <= USERS_PAGE_MAX_LIMIT:
+        raise InvalidUsage(f"limit must be between 1 and {USERS_PAGE_MAX_LIMIT}")
+
     user_service = UserService(request.ctx.session)
-    users = await user_service.get_all_users()
-    # Конвертируем пользователей и их счета в Pydantic-схемы
-    response_data = [UserWithAccounts.model_validate(u) for u in users]
-    return json([user.model_dump() for user in response_data])
+    users = await user_service.get_all_users(limit=limit, after=after)
+    next_after = users[-1].id if len(users) == limit else None
+    return json_bytes(dump_users_page(users, next_after))
+
+
+@users_bp.get("/cache/stats")
+@protected(admin_only=True)
+async def get_cache_stats(request: Request):
+    """Счетчики кэшей текущего воркера."""
+    return json(
+        {
+            "principals": principal_cache.stats(),
+            "jwt_claims": claims_cache.stats(),
+            "balances": balance_cache.stats(),
+            "recent_transactions": recent_transactions.stats(),
+            "read_router": read_router.stats(),
+        }
+    )
 
 
 @users_bp.post("/")
@@ -103,10 +240,10 @@ async def create_new_user(request: Request):
         return json({"error": "Email already registered"}, status=400)
 
     new_user = await user_service.create_user(**user_data.model_dump())
-    return json(UserPublic.model_validate(new_user).model_dump(), status=201)
+    return json_bytes(dump_user(new_user), status=201)
 
 
-@users_bp.patch("/{user_id:int}")
+@users_bp.patch("/<user_id:int>")
 @protected(admin_only=True)
 async def update_existing_user(request: Request, user_id: int):
     update_data = UserUpdate.model_validate(request.json)
@@ -114,10 +251,10 @@ async def update_existing_user(request: Request, user_id: int):
     updated_user = await user_service.update_user(user_id, update_data)
     if not updated_user:
         raise NotFound(f"User with id {user_id} not found")
-    return json(UserPublic.model_validate(updated_user).model_dump())
+    return json_bytes(dump_user(updated_user))
 
 
-@users_bp.delete("/{user_id:int}")
+@users_bp.delete("/<user_id:int>")
 @protected(admin_only=True)
 async def delete_existing_user(request: Request, user_id: int):
     user_service = UserService(request.ctx.session)
@@ -128,3 +265,15 @@ async def delete_existing_user(request: Request, user_id: int):
 
     await user_service.delete_user(user_id)
     return json({}, status=204)  # 204 No Content - успешное удаление
+
+
+@users_bp.put("/accounts/<account_id:int>/stripes")
+@protected(admin_only=True)
+async def update_account_stripes(request: Request, account_id: int):
+    """Включает (stripes > 1) или выключает полосы для горячего счета."""
+    update_data = AccountStripesUpdate.model_validate(request.json)
+    stripe_service = StripeService(request.ctx.session)
+    account = await stripe_service.set_stripes(account_id, update_data.stripes)
+    if account is None:
+        raise NotFound(f"Account with id {account_id} not found")
+    return json_bytes(AccountStripes.model_validate(account).model_dump_json().encode())
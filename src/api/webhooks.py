@@ -1,10 +1,33 @@
+import logging
+
 from sanic import Blueprint, Request, json
-from sanic.exceptions import InvalidUsage, ServerError
+from sanic.exceptions import InvalidUsage, NotFound, ServerError
+
+from src.api.dependencies import protected
+from src.core.config import settings
+from src.core.metrics import webhook_events
+from src.services.dedup import already_committed
+from src.services.payments import (
+    InvalidSignature,
+    MalformedEvent,
+    PaymentService,
+    WebhookStatus,
+    normalize_event,
+    parse_webhook,
+)
 
-from src.services.payments import PaymentService
+logger = logging.getLogger(__name__)
 
 webhook_bp = Blueprint("webhooks", url_prefix="/webhooks")
 
+# Исход события для метрики webhook_events_total
+OUTCOMES = {
+    WebhookStatus.ACCEPTED.value: "credited",
+    WebhookStatus.DUPLICATE.value: "duplicate",
+    WebhookStatus.INVALID_SIGNATURE.value: "bad_signature",
+    WebhookStatus.REJECTED.value: "rejected",
+}
+
 
 @webhook_bp.post("/payment")
 async def handle_payment_webhook(request: Request):
@@ -12,20 +35,75 @@ async def handle_payment_webhook(request: Request):
     if not payload:
         raise InvalidUsage("Empty payload")
 
-    payment_service = PaymentService(request.ctx.session)
-
-    # 1. Проверить подпись
-    if not payment_service.verify_signature(
-        payload.copy()
-    ):  # передаем копию, т.к. функция меняет dict
+    # 1. Проверить подпись и типы полей (до обращения к БД)
+    try:
+        event = parse_webhook(payload)
+    except InvalidSignature:
+        webhook_events.inc("bad_signature")
         raise InvalidUsage("Invalid signature")
+    except MalformedEvent:
+        webhook_events.inc("rejected")
+        raise InvalidUsage("Malformed payload")
+
+    # 2. Повтор недавно зачисленного платежа - отвечаем, не трогая БД
+    if already_committed(event):
+        webhook_events.inc("duplicate")
+        return json({"status": "ok"})
+
+    if settings.WEBHOOK_INGEST_ENABLED:
+        # 3. Режим отложенной записи: событие пишется в журнал, а в БД
+        # попадет фоновыми задачами (см. src/services/ingest.py)
+        await request.app.ctx.webhook_ingest.submit(normalize_event(event))
+        webhook_events.inc("queued")
+        return json({"status": "ok"})
 
+    payment_service = PaymentService(request.ctx.session)
     try:
-        # 2. Обработать вебхук
-        await payment_service.process_webhook(payload)
-    except Exception as e:
+        # 3. Обработать вебхук
+        status = await payment_service.process_webhook(event)
+    except Exception:
         # Логируем ошибку и возвращаем 500
-        print(f"Error processing webhook: {e}")
+        logger.exception("Error processing webhook")
+        webhook_events.inc("failed")
         raise ServerError("Failed to process payment")
 
+    webhook_events.inc(OUTCOMES[status.value])
+    if status is WebhookStatus.REJECTED:
+        raise InvalidUsage("Account does not belong to user")
+
     return json({"status": "ok"})
+
+
+@webhook_bp.post("/payments/batch")
+async def handle_payment_webhooks_batch(request: Request):
+    payloads = request.json
+    if not payloads or not isinstance(payloads, list):
+        raise InvalidUsage("Expected a non-empty list of events")
+    if len(payloads) > settings.WEBHOOK_BATCH_MAX_SIZE:
+        raise InvalidUsage(
+            f"Batch is too large (max {settings.WEBHOOK_BATCH_MAX_SIZE} events)"
+        )
+
+    payment_service = PaymentService(request.ctx.session)
+
+    try:
+        # Подписи проверяются внутри, для каждого события отдельно
+        results = await payment_service.process_webhooks_batch(payloads)
+    except Exception:
+        logger.exception("Error processing webhook batch")
+        webhook_events.inc("failed", amount=len(payloads))
+        raise ServerError("Failed to process payments")
+
+    for result in results:
+        webhook_events.inc(OUTCOMES[result["status"]])
+
+    return json({"results": results})
+
+
+@webhook_bp.get("/ingest/stats")
+@protected(admin_only=True)
+async def webhook_ingest_stats(request: Request):
+    """Глубина очереди и отставание фоновой записи вебхуков."""
+    if not settings.WEBHOOK_INGEST_ENABLED:
+        raise NotFound("Webhook ingest mode is disabled")
+    return json(request.app.ctx.webhook_ingest.stats())
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -9,19 +11,145 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str
     POSTGRES_PORT: int
 
+    # Пул соединений SQLAlchemy/asyncpg
+    DB_ECHO: bool = False  # логировать каждый SQL-запрос (только для отладки)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_PRE_PING: bool = False
+    DB_POOL_RECYCLE: int = -1  # секунд; -1 - не пересоздавать соединения
+    DB_STATEMENT_CACHE_SIZE: int = 100  # подготовленных запросов на соединение
+    # Бюджет соединений: max_connections Postgres минус резерв (миграции,
+    # инструменты, psql) делится между воркерами сервера, и пул каждого
+    # урезается до своей доли. 0 - пулы по DB_POOL_SIZE/DB_MAX_OVERFLOW
+    DB_MAX_CONNECTIONS: int = 0
+    DB_RESERVED_CONNECTIONS: int = 10
+    # Прогрев при старте воркера: столько соединений пула (не больше
+    # pool_size) открываются заранее, и на каждом готовятся горячие запросы
+    # (src/core/warmup.py). До конца прогрева GET /ready отвечает 503
+    DB_POOL_WARM_CONNECTIONS: int = 2
+    # Учет SQL на HTTP-запрос: медленные запросы пишутся в лог, а повтор
+    # одного и того же запроса больше LIMIT раз (N+1) - предупреждение
+    # (warn), ошибка 500 (raise) или ничего (off)
+    DB_SLOW_QUERY_MS: float = 200
+    DB_REPEATED_QUERY_LIMIT: int = 20
+    DB_REPEATED_QUERY_MODE: Literal["warn", "raise", "off"] = "warn"
+
+    # Реплика для чтения (пустой хост - реплики нет). Те же пользователь и
+    # пароль, база по умолчанию - POSTGRES_DB. Запросы, объявленные только
+    # для чтения (protected(read_only=True)), идут на реплику, кроме
+    # запросов пользователя в течение READ_YOUR_WRITES_SECONDS после его
+    # записи и периодов, когда отставание реплики больше этого окна
+    REPLICA_POSTGRES_HOST: str = ""
+    REPLICA_POSTGRES_PORT: int = 5432
+    REPLICA_POSTGRES_DB: str = ""
+    REPLICA_POOL_SIZE: int = 5
+    REPLICA_MAX_OVERFLOW: int = 10
+    REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = 1
+    READ_YOUR_WRITES_SECONDS: float = 5
+    READ_YOUR_WRITES_CACHE_SIZE: int = 100_000
+
+    # Запуск через python -m src.main: число процессов-воркеров (0 - по
+    # числу ядер). SERVER_DEBUG - один воркер с отладкой и автоперезагрузкой
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: int = 1
+    SERVER_DEBUG: bool = False
+    SERVER_ACCESS_LOG: bool = False
+
+    # Метрики Prometheus: каталог снимков воркеров и период их сброса
+    METRICS_DIR: str = "var/metrics"
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 1
+
     # Webhook secret
     SECRET_KEY: str
+    # Максимальное число событий в одном пакетном вебхуке
+    WEBHOOK_BATCH_MAX_SIZE: int = 1000
+
+    # Режим отложенной записи вебхуков: ответ после fsync в журнал,
+    # запись в Postgres - фоновыми задачами
+    WEBHOOK_INGEST_ENABLED: bool = False
+    WEBHOOK_JOURNAL_PATH: str = "var/webhooks.journal"
+    WEBHOOK_JOURNAL_FSYNC_INTERVAL_MS: int = 5
+    WEBHOOK_JOURNAL_MAX_BYTES: int = 64 * 1024 * 1024
+    WEBHOOK_DRAIN_WORKERS: int = 2
+    WEBHOOK_DRAIN_BATCH_SIZE: int = 500
+    # События, отвергнутые Postgres (нет секции, гонка внешнего ключа),
+    # откладываются в <WEBHOOK_JOURNAL_PATH>.dead и повторяются с этим периодом
+    WEBHOOK_DEAD_LETTER_RETRY_SECONDS: float = 60
 
     # JWT settings
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    # Кэш проверенных токенов: положительные записи живут до exp токена,
+    # отрицательные - JWT_NEGATIVE_CACHE_TTL_SECONDS
+    JWT_CACHE_SIZE: int = 10_000
+    JWT_NEGATIVE_CACHE_TTL_SECONDS: float = 5
+
+    # Хеширование паролей: стоимость bcrypt и размер пула на воркер
+    # (0 - хешировать прямо в цикле событий)
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASHER_WORKERS: int = 2
+
+    # Кэш аутентифицированных пользователей для protected()
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60
+    # Рассылать инвалидации другим воркерам через Postgres LISTEN/NOTIFY
+    PRINCIPAL_CACHE_NOTIFY: bool = False
+
+    # Кэш балансов счетов по пользователю для /users/me/accounts.
+    # Без NOTIFY другие воркеры увидят зачисление только по истечении TTL
+    BALANCE_CACHE_SIZE: int = 10_000
+    BALANCE_CACHE_TTL_SECONDS: float = 30
+    BALANCE_CACHE_NOTIFY: bool = False
+
+    # Недавно зачисленные transaction_id в памяти воркера: повторы вебхуков
+    # отвечаются без обращения к БД. Запись - около 200 байт, так что
+    # 100_000 записей - порядка 20 МБ на воркер; 0 - отключить.
+    # С DEDUP_NOTIFY воркеры сообщают друг другу о зачислениях
+    DEDUP_CACHE_SIZE: int = 100_000
+    DEDUP_WINDOW_SECONDS: float = 3600
+    DEDUP_NOTIFY: bool = False
+
+    # Сворачивание полос горячих счетов (account_stripes) в accounts:
+    # период фоновой задачи воркера (0 - не сворачивать) и полос за проход
+    STRIPES_FOLD_INTERVAL_SECONDS: float = 5
+    STRIPES_FOLD_BATCH_SIZE: int = 1000
+
+    # Режим журнала: зачисление - только INSERT в payments, строка счета не
+    # меняется, а баланс = последний снимок + платежи после него.
+    # Снимки (balance_snapshots) пишутся только в этом режиме, одним
+    # воркером раз в LEDGER_SNAPSHOT_INTERVAL_SECONDS (0 - не писать), и
+    # покрывают платежи старше LEDGER_SETTLE_SECONDS: created_at - время
+    # начала транзакции, и более свежие платежи еще могут быть не закоммичены.
+    # Обратный переход в обычный режим требует пересчета accounts.balance
+    LEDGER_MODE: bool = False
+    LEDGER_SNAPSHOT_INTERVAL_SECONDS: float = 3600
+    LEDGER_SETTLE_SECONDS: float = 60
+    LEDGER_SNAPSHOT_BATCH_SIZE: int = 1000
+
+    # Месячные секции payments: держать созданными на столько месяцев
+    # вперед (проверка раз в PAYMENTS_PARTITIONS_CHECK_INTERVAL_SECONDS,
+    # 0 - только вручную, см. src/tools/partitions.py). Платеж без своей
+    # секции попадает в секцию по умолчанию, и проверка создает его месяц
+    PAYMENTS_PARTITIONS_AHEAD: int = 3
+    PAYMENTS_PARTITIONS_CHECK_INTERVAL_SECONDS: float = 3600
+    PAYMENTS_PARTITIONS_LOCK_TIMEOUT_MS: int = 5000
 
     @property
     def database_url_asyncpg(self) -> str:
         """Асинхронный URL для подключения к базе данных."""
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def replica_url_asyncpg(self) -> str | None:
+        """URL реплики для чтения или None, если она не настроена."""
+        if not self.REPLICA_POSTGRES_HOST:
+            return None
+        database = self.REPLICA_POSTGRES_DB or self.POSTGRES_DB
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.REPLICA_POSTGRES_HOST}:{self.REPLICA_POSTGRES_PORT}/{database}"
+
     # Указываем Pydantic, что нужно читать переменные из .env файла
     model_config = SettingsConfigDict(env_file=".env")
 
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from sanic import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.core.database import db_usage
+from src.core.routing import read_router
+
+
+class RequestContext(SimpleNamespace):
+    """
+    Контекст запроса (request.ctx) с ленивой сессией БД.
+
+    Сессия создается при первом обращении к request.ctx.session, поэтому
+    health check и запросы, отклоненные до работы с БД, не трогают ни
+    сессию, ни пул соединений. У запросов с read_only (см. protected())
+    сессия открывается на реплике, если ReadRouter это допускает.
+    """
+
+    _session: AsyncSession | None = None
+    read_only: bool = False
+
+    @property
+    def session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self.open_session()
+            db_usage.sessions_opened += 1
+        return self._session
+
+    def open_session(self) -> AsyncSession:
+        """Новая сессия в той же базе, что выбрана для запроса."""
+        user = getattr(self, "user", None)
+        maker = read_router.session_maker(
+            self.read_only, user.id if user is not None else None
+        )
+        return maker()
+
+    async def close_session(self) -> None:
+        """Закрывает сессию, только если она была открыта."""
+        if self._session is None:
+            return
+        if self._session.info.get("connection_used"):
+            db_usage.connections_used += 1
+        await self._session.close()
+        self._session = None
+
+
+class AppRequest(Request):
+    @staticmethod
+    def make_context() -> RequestContext:
+        return RequestContext()
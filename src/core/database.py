@@ -1,22 +1,181 @@
+import time
 from typing import AsyncGenerator
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import Select, TextualSelect, bindparam, column, event, text
+from sqlalchemy.dialects.postgresql.base import PGDialect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from .config import settings
+from .metrics import (
+    db_pool_checked_out,
+    db_pool_overflow,
+    db_pool_size,
+    db_pool_wait,
+    db_query_duration,
+    registry,
+)
+from .querylog import record_query
 
 
-# Создаем асинхронный "движок" для SQLAlchemy на основе URL из наших настроек
-async_engine = create_async_engine(
-    settings.database_url_asyncpg,
-    echo=True,  # Включаем логирование SQL-запросов. Полезно для отладки.
-)
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий ожидание свободного соединения (и открытие нового)."""
+
+    # Метка пула в метриках; класс, а не атрибут экземпляра - пул
+    # пересоздается (dispose) тем же классом
+    label = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_wait.observe(self.label, value=time.perf_counter() - started)
+
+
+class ReplicaQueuePool(TimedQueuePool):
+    label = "replica"
+
+
+def _create_engine(
+    url: str, pool_size: int, max_overflow: int, poolclass: type[TimedQueuePool]
+) -> AsyncEngine:
+    return create_async_engine(
+        make_url(url).update_query_dict(
+            # Размер LRU-кэша подготовленных запросов asyncpg на каждое соединение
+            {"prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)}
+        ),
+        echo=settings.DB_ECHO,  # Логирование SQL-запросов. Полезно для отладки.
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        poolclass=poolclass,
+    )
+
+
+def pool_budget(
+    pool_size: int, max_overflow: int, workers: int, reserved: int = 0
+) -> tuple[int, int]:
+    """
+    pool_size и max_overflow одного воркера с учетом DB_MAX_CONNECTIONS.
+
+    Соединения сервера (max_connections минус DB_RESERVED_CONNECTIONS)
+    делятся поровну между воркерами; из доли воркера вычитаются reserved
+    соединений вне пула (LISTEN), остаток ограничивает сначала pool_size,
+    затем max_overflow. Без DB_MAX_CONNECTIONS настройки берутся как есть.
+    """
+    if not settings.DB_MAX_CONNECTIONS:
+        return pool_size, max_overflow
+    available = settings.DB_MAX_CONNECTIONS - settings.DB_RESERVED_CONNECTIONS
+    share = available // workers - reserved
+    if share < 1:
+        raise ValueError(
+            f"DB_MAX_CONNECTIONS={settings.DB_MAX_CONNECTIONS} is not enough"
+            f" for {workers} workers"
+        )
+    pool_size = min(pool_size, share)
+    return pool_size, min(max_overflow, share - pool_size)
 
-# Создаем фабрику асинхронных сессий
+
+def compiled_text(stmt: Select) -> TextualSelect:
+    """
+    Один раз компилирует SELECT в text() с теми же параметрами и колонками.
+
+    Конструкции с pg insert ... ON CONFLICT SQLAlchemy не кэширует и
+    компилирует заново при каждом выполнении; готовый text() кэшируется
+    как обычно. Значения передаются при выполнении по именам bindparam().
+    """
+    compiled = stmt.compile(dialect=PGDialect(paramstyle="named"))
+    # Константы (каналы NOTIFY, форматы) остаются со своими значениями
+    binds = {
+        name: bindparam(name, bind.value, type_=bind.type, required=bind.required)
+        for bind, name in compiled.bind_names.items()
+    }
+    columns = [column(c.key, c.type) for c in stmt.selected_columns]
+    return text(compiled.string).bindparams(*binds.values()).columns(*columns)
+
+
+# Фабрики сессий; движки к ним привязывает engines.start()
 async_session_maker = async_sessionmaker(
-    bind=async_engine,
     class_=AsyncSession,
     expire_on_commit=False,  # Важно для асинхронного кода
 )
 
+# Реплика для чтения (None - не настроена), см. src/core/routing.py
+replica_session_maker: async_sessionmaker[AsyncSession] | None = None
+if settings.replica_url_asyncpg:
+    replica_session_maker = async_sessionmaker(
+        class_=AsyncSession,
+        expire_on_commit=False,
+    )
+
+
+class Engines:
+    """
+    Движки основной базы и реплики текущего процесса.
+
+    При импорте модуля движков нет: воркер сервера создает их в
+    before_server_start, а инструменты и бенчмарки - при запуске, так что
+    пул никогда не переходит в другой процесс. dispose() закрывает
+    соединения пулов.
+    """
+
+    def __init__(self):
+        self.primary: AsyncEngine | None = None
+        self.replica: AsyncEngine | None = None
+
+    def start(self, workers: int = 1, reserved: int = 0) -> AsyncEngine:
+        """
+        Создает движки (повторный вызов возвращает уже созданный) с пулом,
+        урезанным до доли воркера (см. pool_budget).
+        """
+        if self.primary is not None:
+            return self.primary
+        pool_size, max_overflow = pool_budget(
+            settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW, workers, reserved
+        )
+        self.primary = _create_engine(
+            settings.database_url_asyncpg, pool_size, max_overflow, TimedQueuePool
+        )
+        async_session_maker.configure(bind=self.primary)
+        if replica_session_maker is not None:
+            # Реплика - отдельный сервер, но max_connections на standby
+            # не меньше, чем на основной базе
+            pool_size, max_overflow = pool_budget(
+                settings.REPLICA_POOL_SIZE, settings.REPLICA_MAX_OVERFLOW, workers
+            )
+            self.replica = _create_engine(
+                settings.replica_url_asyncpg,
+                pool_size,
+                max_overflow,
+                ReplicaQueuePool,
+            )
+            replica_session_maker.configure(bind=self.replica)
+        for engine in self.all():
+            sync_engine = engine.sync_engine
+            event.listen(sync_engine, "before_cursor_execute", _start_query_timer)
+            event.listen(sync_engine, "after_cursor_execute", _observe_query)
+            event.listen(sync_engine, "handle_error", _drop_query_timer)
+        return self.primary
+
+    def all(self) -> list[AsyncEngine]:
+        return [engine for engine in (self.primary, self.replica) if engine]
+
+    async def dispose(self) -> None:
+        for engine in self.all():
+            await engine.dispose()
+        self.primary = self.replica = None
+
+
+engines = Engines()
+
 
 # Базовый класс для всех наших моделей SQLAlchemy
 class Base(DeclarativeBase):  # <--- НОВЫЙ, ТИПИЗИРОВАННЫЙ СПОСОБ
@@ -28,3 +187,75 @@ class Base(DeclarativeBase):  # <--- НОВЫЙ, ТИПИЗИРОВАННЫЙ С
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
+
+
+class DbUsage:
+    """Счетчики использования БД запросами текущего воркера."""
+
+    def __init__(self):
+        self.requests = 0  # всего обработанных запросов
+        self.sessions_opened = 0  # запросов, создавших сессию
+        self.connections_used = 0  # запросов, взявших соединение из пула
+
+    def report(self) -> dict:
+        report = {
+            "requests": self.requests,
+            "sessions_opened": self.sessions_opened,
+            "connections_used": self.connections_used,
+            "connection_ratio": (
+                round(self.connections_used / self.requests, 4) if self.requests else 0.0
+            ),
+            "pool": _pool_report(engines.primary),
+        }
+        if engines.replica is not None:
+            report["replica_pool"] = _pool_report(engines.replica)
+        return report
+
+
+def _pool_report(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checked_in": pool.checkedin(),
+    }
+
+
+db_usage = DbUsage()
+
+
+@event.listens_for(Session, "after_begin")
+def _mark_connection_used(session, transaction, connection):
+    """Сессия впервые взяла соединение (начала транзакцию)."""
+    session.info["connection_used"] = True
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _observe_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement else ""
+    db_query_duration.observe(operation, value=elapsed)
+    record_query(statement, elapsed)
+
+
+def _drop_query_timer(exception_context):
+    # after_cursor_execute не вызывается для упавшего запроса
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def _collect_pool_metrics() -> None:
+    for engine in engines.all():
+        pool = engine.pool
+        db_pool_size.set(pool.label, value=pool.size())
+        db_pool_checked_out.set(pool.label, value=pool.checkedout())
+        db_pool_overflow.set(pool.label, value=max(pool.overflow(), 0))
+
+
+registry.add_collector(_collect_pool_metrics)
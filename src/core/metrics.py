@@ -0,0 +1,297 @@
+import asyncio
+import json
+import os
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Literal
+
+from src.core.config import settings
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    kind = "untyped"
+    merge = "sum"  # сведение значений воркеров, см. Gauge
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: dict[tuple[str, ...], object] = {}
+
+    def dump(self) -> list:
+        return [[list(key), value] for key, value in self.values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        merge: Literal["sum", "max"] = "sum",
+    ):
+        super().__init__(name, documentation, labels)
+        # Как сводить значения воркеров: sum - у каждого своя доля (пул,
+        # запросы в работе), max - все измеряют одно и то же (реплика, БД)
+        self.merge = merge
+
+    def set(self, *labels: str, value: float) -> None:
+        self.values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+
+    def observe(self, *labels: str, value: float) -> None:
+        # [счетчики по корзинам (последняя - +Inf), сумма]; накопительные
+        # значения считаются только при выводе
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса в формате Prometheus с агрегацией по воркерам.
+
+    Каждый воркер считает метрики у себя в памяти (без блокировок и IPC)
+    и периодически сбрасывает снимок в <directory>/<pid>.json. /metrics
+    в любом воркере складывает снимки всех процессов: счетчики и
+    гистограммы суммируются (в том числе от завершившихся воркеров),
+    а значения gauge берутся только от живых процессов и складываются
+    или сводятся к максимуму (Gauge.merge).
+    """
+
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.metrics: dict[str, Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self._register(Counter(name, documentation, tuple(labels)))
+
+    def gauge(self, name: str, documentation: str, labels=(), merge="sum") -> Gauge:
+        return self._register(Gauge(name, documentation, tuple(labels), merge))
+
+    def histogram(
+        self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, tuple(labels), buckets))
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        """Функция, обновляющая gauge'и перед каждым снимком."""
+        self._collectors.append(collect)
+
+    def snapshot(self) -> dict:
+        for collect in self._collectors:
+            collect()
+        return {name: metric.dump() for name, metric in self.metrics.items()}
+
+    def write_snapshot(self) -> None:
+        self._write(json.dumps(self.snapshot()))
+
+    def _write(self, data: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(data)
+        os.replace(tmp, path)
+
+    def reset(self) -> None:
+        """Удаляет снимки прошлого запуска (вызывается в главном процессе)."""
+        if self.directory.exists():
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
+
+    async def flush_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            # Снимок - в цикле событий (метрики меняются только в нем),
+            # запись файла - в потоке
+            await asyncio.to_thread(self._write, json.dumps(self.snapshot()))
+
+    async def collect(self) -> str:
+        """Текст для /metrics: свежий снимок своего процесса плюс снимки соседей."""
+        # Снимок - в цикле событий, запись и чтение файлов - в потоке
+        return await asyncio.to_thread(self._collect, json.dumps(self.snapshot()))
+
+    def _collect(self, own: str) -> str:
+        self._write(own)
+        merged: dict[str, dict[tuple, object]] = {name: {} for name in self.metrics}
+        for path in self.directory.glob("*.json"):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue  # файл удален или перезаписывается прямо сейчас
+            alive = _is_alive(int(path.stem))
+            for name, values in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                target = merged[name]
+                for labels, value in values:
+                    _merge(target, tuple(labels), value, metric.merge)
+        return "".join(
+            _render(metric, merged[name]) for name, metric in self.metrics.items()
+        )
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(target: dict, labels: tuple, value, mode: str = "sum") -> None:
+    current = target.get(labels)
+    if current is None:
+        target[labels] = value
+    elif mode == "max":
+        target[labels] = max(current, value)
+    elif isinstance(value, list):
+        counts = [a + b for a, b in zip(current[0], value[0])]
+        target[labels] = [counts, current[1] + value[1]]
+    else:
+        target[labels] = current + value
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _render(metric: Metric, values: dict) -> str:
+    lines = [
+        f"# HELP {metric.name} {metric.documentation}",
+        f"# TYPE {metric.name} {metric.kind}",
+    ]
+    for key, value in sorted(values.items()):
+        if metric.kind != "histogram":
+            lines.append(f"{metric.name}{_labels(metric.labels, key)} {value}")
+            continue
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip((*metric.buckets, "+Inf"), counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(
+                f"{metric.name}_bucket{_labels(metric.labels, key, le)} {cumulative}"
+            )
+        lines.append(f"{metric.name}_sum{_labels(metric.labels, key)} {total}")
+        lines.append(f"{metric.name}_count{_labels(metric.labels, key)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry(settings.METRICS_DIR)
+
+http_requests = registry.counter(
+    "http_requests_total",
+    "HTTP requests by route and status",
+    ("method", "route", "status"),
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds",
+    "Time from request to response headers",
+    ("method", "route"),
+)
+http_in_flight = registry.gauge(
+    "http_requests_in_flight", "Requests being processed right now"
+)
+webhook_events = registry.counter(
+    "webhook_events_total", "Payment webhook events by outcome", ("outcome",)
+)
+webhook_dedup_hits = registry.counter(
+    "webhook_dedup_hits_total",
+    "Duplicate webhooks answered from memory without a DB round trip",
+)
+# Фоновая запись вебхуков из журнала (src/services/ingest.py)
+webhook_ingest_depth = registry.gauge(
+    "webhook_ingest_depth", "Journaled webhook events not yet applied to the database"
+)
+webhook_ingest_failed_batches = registry.counter(
+    "webhook_ingest_failed_batches_total",
+    "Attempts to apply a journaled batch that failed and will be retried",
+)
+webhook_ingest_dead_lettered = registry.counter(
+    "webhook_ingest_dead_lettered_total",
+    "Journaled webhook events rejected by the database and deferred for retry",
+)
+webhook_ingest_dead_letters = registry.gauge(
+    "webhook_ingest_dead_letters", "Webhook events waiting in the dead-letter journal"
+)
+# Проверяет каждый воркер (src/services/partitions.py), а секции в БД общие
+payments_partitions_missing = registry.gauge(
+    "payments_partitions_missing",
+    "Payment partitions the keeper has not created yet"
+    " (within PAYMENTS_PARTITIONS_AHEAD or holding rows in the DEFAULT partition)",
+    merge="max",
+)
+# Метка pool: primary или replica (см. src/core/database.py)
+db_pool_checked_out = registry.gauge(
+    "db_pool_checked_out", "Connections checked out of the pool", ("pool",)
+)
+db_pool_overflow = registry.gauge(
+    "db_pool_overflow", "Connections opened above pool_size", ("pool",)
+)
+db_pool_size = registry.gauge("db_pool_size", "Configured pool size", ("pool",))
+db_pool_wait = registry.histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection", ("pool",)
+)
+db_read_routes = registry.counter(
+    "db_read_routes_total",
+    "Sessions of read-only requests by target database and reason",
+    ("target", "reason"),
+)
+# Отставание измеряет каждый воркер; -1 - реплика недоступна для всех
+db_replica_lag = registry.gauge(
+    "db_replica_lag_seconds",
+    "Replication lag of the read replica, max over workers (-1 if unreachable)",
+    merge="max",
+)
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("operation",)
+)
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import Callable
+
+import asyncpg
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NotifyListener:
+    """
+    Подписка на каналы Postgres LISTEN/NOTIFY через отдельное соединение.
+
+    Используется для межворкерной инвалидации кэшей: транзакция, изменившая
+    данные, вызывает pg_notify(), и каждый воркер получает уведомление
+    после коммита. Пока соединение потеряно, уведомления пропадают, поэтому
+    после каждого подключения вызываются on_reset-обработчики (обычно - сброс кэша).
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._callbacks: dict[str, Callable[[str], None]] = {}
+        self._resets: list[Callable[[], None]] = []
+        self._task: asyncio.Task | None = None
+        self._connected = asyncio.Event()
+
+    def subscribe(
+        self,
+        channel: str,
+        callback: Callable[[str], None],
+        on_reset: Callable[[], None] | None = None,
+    ) -> None:
+        self._callbacks[channel] = callback
+        if on_reset is not None:
+            self._resets.append(on_reset)
+
+    async def start(self) -> None:
+        if self._callbacks and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        delay = 0.5
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                for channel in self._callbacks:
+                    await connection.add_listener(channel, self._dispatch)
+                # Уведомления, пришедшие, пока мы не слушали, потеряны
+                # (при первом подключении кэши еще пусты - сброс ничего
+                # не стоит)
+                for reset in self._resets:
+                    reset()
+                delay = 0.5
+                await closed.wait()
+                logger.warning("LISTEN connection lost, reconnecting")
+            except Exception as e:
+                # Любая ошибка (подключение, add_listener, обработчик сброса)
+                # не должна останавливать подписку
+                logger.warning("LISTEN connection failed: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10.0)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+
+    def _dispatch(self, connection, pid, channel: str, payload: str) -> None:
+        try:
+            self._callbacks[channel](payload)
+        except Exception:
+            logger.exception("NOTIFY handler for %s failed", channel)
+
+
+notify_listener = NotifyListener(settings.database_url_asyncpg.replace("+asyncpg", ""))
@@ -0,0 +1,76 @@
+import logging
+import re
+from contextvars import ContextVar
+from functools import lru_cache
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERAL = re.compile(
+    r"'(?:[^']|'')*'"  # строки
+    r"|\$\d+"  # параметры asyncpg
+    r"|%\(\w+\)s|%s"  # параметры в стиле pyformat
+    r"|\b\d+(?:\.\d+)?\b"  # числа
+)
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+
+class RepeatedQueryError(RuntimeError):
+    """Запрос выполнил один и тот же SQL больше DB_REPEATED_QUERY_LIMIT раз."""
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(statement: str) -> str:
+    """
+    Форма запроса без значений: литералы и параметры заменены на ?,
+    списки IN (...) и многострочные VALUES свернуты в один элемент.
+    """
+    shape = _LITERAL.sub("?", _WHITESPACE.sub(" ", statement).strip())
+    return _ROWS.sub("(?)", _LIST.sub("(?)", shape))
+
+
+class QueryStats:
+    """SQL-запросы, выполненные в рамках одного HTTP-запроса."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: dict[str, int] = {}
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.seconds += elapsed
+        if settings.DB_REPEATED_QUERY_MODE == "off":
+            return
+        shape = normalize_sql(statement)
+        repeats = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        # Сообщаем один раз на форму запроса, при первом превышении лимита
+        if repeats == settings.DB_REPEATED_QUERY_LIMIT + 1:
+            message = (
+                f"{self.label} ran the same statement more than "
+                f"{settings.DB_REPEATED_QUERY_LIMIT} times (N+1?): {shape}"
+            )
+            if settings.DB_REPEATED_QUERY_MODE == "raise":
+                raise RepeatedQueryError(message)
+            logger.warning(message)
+
+
+# Счетчики текущего HTTP-запроса; None вне запросов (фоновые задачи)
+current_query_stats: ContextVar[QueryStats | None] = ContextVar(
+    "current_query_stats", default=None
+)
+
+
+def record_query(statement: str, elapsed: float) -> None:
+    """Вызывается после каждого SQL-запроса (см. src/core/database.py)."""
+    if elapsed * 1000 >= settings.DB_SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query (%.1f ms): %s", elapsed * 1000, normalize_sql(statement)
+        )
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed)
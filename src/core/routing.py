@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from typing import Iterable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.core.database import async_session_maker, engines, replica_session_maker
+from src.core.metrics import db_read_routes, db_replica_lag
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики: 0, если она догнала полученный WAL (при простое
+# основной БД время последней транзакции не меняется) или если это не
+# standby вовсе (заменитель реплики в тестах)
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END
+    """)
+
+
+class ReadRouter:
+    """
+    Выбор базы для сессии запроса, объявленного только для чтения.
+
+    Такой запрос идет на реплику, кроме двух случаев: пользователь сам
+    что-то записал меньше window секунд назад (read-your-writes) или
+    реплика отстает больше чем на window (или не отвечает). Записи
+    отмечаются в памяти воркера - своими коммитами и уведомлениями
+    других воркеров (BALANCE_CACHE_NOTIFY, PRINCIPAL_CACHE_NOTIFY).
+    """
+
+    def __init__(self, replica: async_sessionmaker | None, window: float, maxsize: int):
+        self.replica = replica
+        self.window = window
+        self._writers: TTLCache[int, bool] = TTLCache(maxsize=maxsize, ttl=window)
+        self.replica_healthy = replica is not None
+
+    def mark_written(self, user_ids: Iterable[int]) -> None:
+        if self.replica is None:
+            return
+        for user_id in user_ids:
+            self._writers.set(user_id, True)
+
+    def session_maker(
+        self, read_only: bool, user_id: int | None = None
+    ) -> async_sessionmaker[AsyncSession]:
+        """Фабрика сессий для запроса: реплики или основной базы."""
+        if not read_only or self.replica is None:
+            return async_session_maker
+        if not self.replica_healthy:
+            db_read_routes.inc("primary", "replica_lag")
+            return async_session_maker
+        if user_id is not None and self._writers.peek(user_id):
+            db_read_routes.inc("primary", "read_your_writes")
+            return async_session_maker
+        db_read_routes.inc("replica", "read_only")
+        return self.replica
+
+    async def check_replica_periodically(self, interval: float) -> None:
+        """Фоновая задача воркера: следит за отставанием реплики."""
+        while True:
+            try:
+                async with engines.replica.connect() as conn:
+                    lag = float(await conn.scalar(REPLICA_LAG_QUERY) or 0)
+            except Exception as e:
+                lag = None
+                logger.warning("Read replica is unavailable: %s", e)
+            healthy = lag is not None and lag <= self.window
+            if healthy != self.replica_healthy:
+                logger.warning(
+                    "Read replica %s (lag: %s s)",
+                    "is back" if healthy else "is off, reads go to primary",
+                    lag,
+                )
+            self.replica_healthy = healthy
+            db_replica_lag.set(value=lag if lag is not None else -1)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        return {
+            "replica": self.replica is not None,
+            "replica_healthy": self.replica_healthy,
+            "window_seconds": self.window,
+            "recent_writers": len(self._writers),
+        }
+
+
+read_router = ReadRouter(
+    replica_session_maker,
+    window=settings.READ_YOUR_WRITES_SECONDS,
+    maxsize=settings.READ_YOUR_WRITES_CACHE_SIZE,
+)
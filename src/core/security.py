@@ -1,16 +1,36 @@
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
 import bcrypt
 from jose import jwt, JWTError
 
+from src.core.cache import TTLCache
 from src.core.config import settings
 
+logger = logging.getLogger(__name__)
 
-def hash_password(password: str) -> str:
+# Пул для bcrypt: живет все время работы воркера (см. start_password_hasher)
+_password_executor: Executor | None = None
+
+# Проверенные claims по sha256 токена. Запись живет не дольше exp токена;
+# неудачные проверки кэшируются ненадолго, чтобы поток мусорных токенов
+# не стоил по HMAC на каждый запрос.
+claims_cache: TTLCache[bytes, dict[str, Any]] = TTLCache(
+    maxsize=settings.JWT_CACHE_SIZE, ttl=settings.JWT_NEGATIVE_CACHE_TTL_SECONDS
+)
+_INVALID_TOKEN: dict[str, Any] = {}
+
+
+def hash_password(password: str, rounds: int | None = None) -> str:
     """Хеширует пароль с использованием bcrypt."""
     pwd_bytes = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS)
     hashed_password = bcrypt.hashpw(pwd_bytes, salt)
     return hashed_password.decode("utf-8")
 
@@ -22,6 +42,56 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password_byte_enc, hashed_password_byte_enc)
 
 
+def start_password_hasher() -> None:
+    """
+    Создает пул для bcrypt на время жизни воркера.
+
+    Воркеры Sanic - демонические процессы и не могут порождать дочерние,
+    поэтому в них используется пул потоков: bcrypt отпускает GIL на время
+    хеширования, так что цикл событий все равно не блокируется.
+    При PASSWORD_HASHER_WORKERS=0 хеширование выполняется прямо в цикле.
+    """
+    global _password_executor
+    workers = settings.PASSWORD_HASHER_WORKERS
+    if workers <= 0 or _password_executor is not None:
+        return
+    if multiprocessing.current_process().daemon:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bcrypt"
+        )
+    else:
+        _password_executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+
+def shutdown_password_hasher() -> None:
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password, вынесенный из цикла событий в пул."""
+    if _password_executor is None:
+        return hash_password(password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_executor, hash_password, password, settings.BCRYPT_ROUNDS
+    )
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password, вынесенный из цикла событий в пул."""
+    if _password_executor is None:
+        return verify_password(plain_password, hashed_password)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_executor, verify_password, plain_password, hashed_password
+    )
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """Создает JWT токен."""
     to_encode = data.copy()
@@ -38,14 +108,30 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
 
 
 def decode_access_token(token: str) -> dict[str, Any] | None:
-    """Декодирует JWT токен."""
+    """
+    Декодирует JWT токен.
+
+    Результат берется из claims_cache, если токен уже проверялся;
+    возвращаемый dict общий для всех запросов и не должен изменяться.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    cached = claims_cache.get(key)
+    if cached is not None:
+        return None if cached is _INVALID_TOKEN else cached
+
     try:
         payload = jwt.decode(
             token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM]
         )
-        return payload
     except JWTError as e:
-        # ----> ВОТ НАШ ОТЛАДОЧНЫЙ КОД <----
-        print(f"!!! JWT Error: {e}")
-        # ----------------------------------
+        logger.debug("JWT Error: %s", e)
+        claims_cache.set(key, _INVALID_TOKEN)
         return None
+
+    exp = payload.get("exp")
+    if exp is None:
+        # Без exp нечем ограничить срок - кэшируем так же недолго, как отказы
+        claims_cache.set(key, payload)
+    elif exp > time.time():
+        claims_cache.set(key, payload, ttl=exp - time.time())
+    return payload
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Iterator
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.sql import Executable
+
+logger = logging.getLogger(__name__)
+
+
+class HotStatements:
+    """
+    Реестр горячих запросов, которые готовятся на соединениях пула заранее.
+
+    Сервисы регистрируют фабрику запроса под именем и значения параметров
+    для пробного выполнения; запрос с любыми значениями должен давать тот
+    же SQL (значения - bindparam), тогда asyncpg найдет его в своем кэше
+    подготовленных запросов. Пробное выполнение откатывается, поэтому
+    значения могут быть любыми, лишь бы запрос ничего не ждал.
+    """
+
+    def __init__(self):
+        self._statements: dict[str, tuple[Callable[[], Executable], dict]] = {}
+
+    def register(
+        self, name: str, build: Callable[[], Executable], params: dict | None = None
+    ) -> None:
+        self._statements[name] = (build, params or {})
+
+    def __len__(self) -> int:
+        return len(self._statements)
+
+    def __iter__(self) -> Iterator[tuple[Executable, dict]]:
+        for build, params in self._statements.values():
+            yield build(), params
+
+
+hot_statements = HotStatements()
+
+
+class PoolWarmup:
+    """
+    Прогрев пула воркера при старте.
+
+    Открывает connections соединений одновременно (TCP, аутентификация)
+    и на каждом выполняет запросы statements в транзакции, которая
+    откатывается: выполнение кладет их в кэш подготовленных запросов
+    соединения (prepared_statement_cache_size). После этого
+    соединения возвращаются в пул, и первые запросы воркера не платят ни
+    за подключение, ни за разбор и планирование SQL. Пока БД недоступна,
+    прогрев повторяется; ready - прогрев закончен.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        connections: int,
+        statements: HotStatements,
+        on_ready: Callable[[], None] | None = None,
+    ):
+        # Соединения сверх pool_size пул закрывает при возврате
+        self.connections = min(connections, engine.pool.size())
+        self.engine = engine
+        self.statements = statements
+        self.on_ready = on_ready
+        self.ready = False
+        self.seconds: float | None = None
+        self.prepared = 0
+
+    async def run(self) -> None:
+        delay = 0.5
+        started = time.perf_counter()
+        while True:
+            try:
+                await self._warm()
+                break
+            except Exception as e:
+                logger.warning("Pool warm-up failed: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10.0)
+        self.seconds = time.perf_counter() - started
+        self.ready = True
+        if self.on_ready is not None:
+            self.on_ready()
+
+    async def _warm(self) -> None:
+        if not self.connections:
+            return
+        # Соединение держится, пока не откроются все: иначе пул отдавал
+        # бы одно и то же
+        barrier = asyncio.Barrier(self.connections)
+
+        async def warm_connection() -> int:
+            try:
+                async with self.engine.connect() as conn:
+                    prepared = await self._prepare(conn)
+                    await barrier.wait()
+                    return prepared
+            except BaseException:
+                await barrier.abort()
+                raise
+
+        counts = await asyncio.gather(
+            *(warm_connection() for _ in range(self.connections))
+        )
+        self.prepared = sum(counts)
+
+    async def _prepare(self, conn: AsyncConnection) -> int:
+        prepared = 0
+        for statement, params in self.statements:
+            await conn.execute(statement, params)
+            prepared += 1
+        await conn.rollback()
+        return prepared
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "connections": self.connections,
+            "statements": len(self.statements),
+            "prepared": self.prepared,
+            "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+        }
@@ -1,31 +1,318 @@
+import asyncio
+import os
+import time
+from multiprocessing import Value
+
 from sanic import Sanic
-from sanic.response import json
+from sanic.response import json, text
 
 # Импортируем нашу "фабрику" сессий
-from src.core.database import async_session_maker
+from src.core.config import settings
+from src.core.context import AppRequest
+from src.core.database import async_session_maker, db_usage, engines
+from src.core.metrics import (
+    http_in_flight,
+    http_request_duration,
+    http_requests,
+    registry,
+)
+from src.core.notify import notify_listener
+from src.core.querylog import QueryStats, current_query_stats
+from src.core.routing import read_router
+from src.core.warmup import PoolWarmup, hot_statements
+from src.core.security import shutdown_password_hasher, start_password_hasher
+from src.api.dependencies import protected
 from src.api.users import users_bp
 from src.api.webhooks import webhook_bp
+from src.services.balances import listen_balance_changes
+from src.services.dedup import listen_committed_payments
+from src.services.ingest import WebhookIngest, WebhookJournal, journal_paths
+from src.services.ledger import snapshot_balances_periodically
+from src.services.partitions import PaymentPartitions, ensure_partitions_periodically
+from src.services.principals import listen_principal_invalidations
+from src.services.stripes import fold_stripes_periodically
 
-app = Sanic("PaymentApp")
+app = Sanic("PaymentApp", request_class=AppRequest)
+app.config.USE_UVLOOP = True
+app.config.ACCESS_LOG = settings.SERVER_ACCESS_LOG
 
 
-# --- Middleware для управления сессией БД ---
+# --- Движки БД: свои в каждом воркере ---
+@app.main_process_start
+async def share_worker_count(app, _):
+    # Воркерам нужно их общее число, чтобы поделить бюджет соединений
+    app.shared_ctx.workers = Value("i", app.state.workers)
+    # Сколько воркеров закончили прогрев пула - для /ready
+    app.shared_ctx.ready_workers = Value("i", 0)
+
+
+@app.before_server_start
+async def start_engines(app, _):
+    workers = getattr(app.shared_ctx, "workers", None)
+    listens = (
+        settings.PRINCIPAL_CACHE_NOTIFY
+        or settings.BALANCE_CACHE_NOTIFY
+        or settings.DEDUP_NOTIFY
+    )
+    engines.start(
+        workers=max(workers.value, 1) if workers is not None else 1,
+        reserved=1 if listens else 0,  # соединение notify_listener
+    )
+
+
+@app.after_server_stop
+async def dispose_engines(app, _):
+    # Слушатели after_server_stop идут в обратном порядке - этот последним
+    await engines.dispose()
+
+
+# --- Прогрев пула: соединения и подготовленные горячие запросы ---
+@app.before_server_start
+async def start_pool_warmup(app, _):
+    ready_workers = getattr(app.shared_ctx, "ready_workers", None)
+
+    def mark_ready() -> None:
+        if ready_workers is not None:
+            with ready_workers.get_lock():
+                ready_workers.value += 1
+
+    app.ctx.pool_warmup = PoolWarmup(
+        engines.primary,
+        settings.DB_POOL_WARM_CONNECTIONS,
+        hot_statements,
+        on_ready=mark_ready,
+    )
+    app.ctx.pool_warmup_task = asyncio.create_task(app.ctx.pool_warmup.run())
+
+
+@app.after_server_stop
+async def stop_pool_warmup(app, _):
+    app.ctx.pool_warmup_task.cancel()
+    ready_workers = getattr(app.shared_ctx, "ready_workers", None)
+    if ready_workers is not None and app.ctx.pool_warmup.ready:
+        with ready_workers.get_lock():
+            ready_workers.value -= 1
+
+
+# --- Метрики запросов ---
 @app.middleware("request")
-async def inject_session(request):
-    """
-    Создает сессию для каждого запроса и кладет ее в контекст.
-    """
-    request.ctx.session = async_session_maker()
-    request.ctx.session_ctx_token = request.ctx.session.info.get("ctx_token")
+async def start_request_timer(request):
+    request.ctx.started = time.perf_counter()
+    http_in_flight.inc()
+
+
+@app.middleware("response")
+async def observe_request(request, response):
+    if not hasattr(request.ctx, "started"):
+        return
+    http_in_flight.dec()
+    route = request.route.path if request.route else "unmatched"
+    http_requests.inc(request.method, route, str(response.status))
+    http_request_duration.observe(
+        request.method, route, value=time.perf_counter() - request.ctx.started
+    )
+
+
+# --- Учет SQL-запросов на HTTP-запрос (см. src/core/querylog.py) ---
+@app.middleware("request")
+async def start_query_stats(request):
+    request.ctx.queries = QueryStats(f"{request.method} {request.path}")
+    current_query_stats.set(request.ctx.queries)
 
 
+@app.middleware("response")
+async def add_query_headers(request, response):
+    queries = getattr(request.ctx, "queries", None)
+    if queries is not None and request.app.debug:
+        response.headers["X-DB-Queries"] = str(queries.count)
+        response.headers["X-DB-Time-Ms"] = f"{queries.seconds * 1000:.2f}"
+
+
+# --- Middleware для управления сессией БД ---
+# Сама сессия создается лениво при первом обращении к request.ctx.session
+# (см. src/core/context.py)
 @app.middleware("response")
 async def close_session(request, response):
     """
     Закрывает сессию после того, как ответ был сформирован.
     """
-    if hasattr(request.ctx, "session_ctx_token"):
-        await request.ctx.session.close()
+    db_usage.requests += 1
+    await request.ctx.close_session()
+
+
+# --- Пул для bcrypt на время жизни воркера ---
+@app.before_server_start
+async def start_hasher(app, _):
+    start_password_hasher()
+
+
+@app.after_server_stop
+async def stop_hasher(app, _):
+    shutdown_password_hasher()
+
+
+# --- Снимки метрик для агрегации по воркерам ---
+@app.main_process_start
+async def reset_metrics(app, _):
+    registry.reset()
+
+
+@app.before_server_start
+async def start_metrics_flusher(app, _):
+    app.ctx.metrics_flusher = asyncio.create_task(
+        registry.flush_periodically(settings.METRICS_FLUSH_INTERVAL_SECONDS)
+    )
+
+
+@app.after_server_stop
+async def stop_metrics_flusher(app, _):
+    app.ctx.metrics_flusher.cancel()
+    registry.write_snapshot()
+
+
+# --- Межворкерная инвалидация кэшей через LISTEN/NOTIFY ---
+@app.before_server_start
+async def start_notify_listener(app, _):
+    if settings.PRINCIPAL_CACHE_NOTIFY:
+        listen_principal_invalidations(notify_listener)
+    if settings.BALANCE_CACHE_NOTIFY:
+        listen_balance_changes(notify_listener)
+    if settings.DEDUP_NOTIFY:
+        listen_committed_payments(notify_listener)
+    await notify_listener.start()
+
+
+@app.after_server_stop
+async def stop_notify_listener(app, _):
+    await notify_listener.stop()
+
+
+# --- Фоновая запись вебхуков из журнала ---
+@app.before_server_start
+async def start_webhook_ingest(app, _):
+    if not settings.WEBHOOK_INGEST_ENABLED:
+        return
+    # У каждого воркера свой журнал, иначе записи перемешаются
+    path = settings.WEBHOOK_JOURNAL_PATH
+    worker_name = os.environ.get("SANIC_WORKER_NAME")
+    if worker_name:
+        path = f"{path}.{worker_name}"
+    journal = WebhookJournal(
+        path,
+        fsync_interval=settings.WEBHOOK_JOURNAL_FSYNC_INTERVAL_MS / 1000,
+        max_bytes=settings.WEBHOOK_JOURNAL_MAX_BYTES,
+    )
+    dead_letters = WebhookJournal(
+        f"{path}.dead",
+        fsync_interval=settings.WEBHOOK_JOURNAL_FSYNC_INTERVAL_MS / 1000,
+        max_bytes=settings.WEBHOOK_JOURNAL_MAX_BYTES,
+    )
+    rejected = WebhookJournal(
+        f"{path}.rejected",
+        fsync_interval=settings.WEBHOOK_JOURNAL_FSYNC_INTERVAL_MS / 1000,
+        max_bytes=settings.WEBHOOK_JOURNAL_MAX_BYTES,
+    )
+    app.ctx.webhook_ingest = WebhookIngest(
+        journal,
+        dead_letters,
+        rejected,
+        session_maker=async_session_maker,
+        workers=settings.WEBHOOK_DRAIN_WORKERS,
+        batch_size=min(
+            settings.WEBHOOK_DRAIN_BATCH_SIZE, settings.WEBHOOK_BATCH_MAX_SIZE
+        ),
+        retry_interval=settings.WEBHOOK_DEAD_LETTER_RETRY_SECONDS,
+    )
+    await app.ctx.webhook_ingest.start()
+    # Журналы воркеров, которых больше нет, забирает себе первый, кто их найдет
+    await app.ctx.webhook_ingest.adopt(journal_paths(settings.WEBHOOK_JOURNAL_PATH))
+
+
+@app.after_server_stop
+async def stop_webhook_ingest(app, _):
+    if hasattr(app.ctx, "webhook_ingest"):
+        await app.ctx.webhook_ingest.stop()
+
+
+# --- Сворачивание полос горячих счетов ---
+@app.before_server_start
+async def start_stripe_folder(app, _):
+    if settings.STRIPES_FOLD_INTERVAL_SECONDS > 0:
+        app.ctx.stripe_folder = asyncio.create_task(
+            fold_stripes_periodically(
+                async_session_maker,
+                settings.STRIPES_FOLD_INTERVAL_SECONDS,
+                settings.STRIPES_FOLD_BATCH_SIZE,
+            )
+        )
+
+
+@app.after_server_stop
+async def stop_stripe_folder(app, _):
+    if hasattr(app.ctx, "stripe_folder"):
+        app.ctx.stripe_folder.cancel()
+
+
+# --- Снимки балансов для режима журнала и баланса на момент времени ---
+@app.before_server_start
+async def start_balance_snapshots(app, _):
+    # Вне режима журнала баланс хранится в accounts, и проходы по всем
+    # счетам только нагружали бы БД
+    if settings.LEDGER_MODE and settings.LEDGER_SNAPSHOT_INTERVAL_SECONDS > 0:
+        app.ctx.balance_snapshots = asyncio.create_task(
+            snapshot_balances_periodically(
+                engines.primary,
+                async_session_maker,
+                settings.LEDGER_SNAPSHOT_INTERVAL_SECONDS,
+                settings.LEDGER_SETTLE_SECONDS,
+                settings.LEDGER_SNAPSHOT_BATCH_SIZE,
+            )
+        )
+
+
+@app.after_server_stop
+async def stop_balance_snapshots(app, _):
+    if hasattr(app.ctx, "balance_snapshots"):
+        app.ctx.balance_snapshots.cancel()
+
+
+# --- Месячные секции payments на несколько месяцев вперед ---
+@app.before_server_start
+async def start_partition_keeper(app, _):
+    if settings.PAYMENTS_PARTITIONS_CHECK_INTERVAL_SECONDS > 0:
+        partitions = PaymentPartitions(
+            engines.primary, settings.PAYMENTS_PARTITIONS_LOCK_TIMEOUT_MS
+        )
+        app.ctx.partition_keeper = asyncio.create_task(
+            ensure_partitions_periodically(
+                partitions,
+                settings.PAYMENTS_PARTITIONS_CHECK_INTERVAL_SECONDS,
+                settings.PAYMENTS_PARTITIONS_AHEAD,
+            )
+        )
+
+
+@app.after_server_stop
+async def stop_partition_keeper(app, _):
+    if hasattr(app.ctx, "partition_keeper"):
+        app.ctx.partition_keeper.cancel()
+
+
+# --- Отставание реплики для маршрутизации чтений ---
+@app.before_server_start
+async def start_replica_monitor(app, _):
+    if read_router.replica is not None:
+        app.ctx.replica_monitor = asyncio.create_task(
+            read_router.check_replica_periodically(
+                settings.REPLICA_LAG_CHECK_INTERVAL_SECONDS
+            )
+        )
+
+
+@app.after_server_stop
+async def stop_replica_monitor(app, _):
+    if hasattr(app.ctx, "replica_monitor"):
+        app.ctx.replica_monitor.cancel()
 
 
 # --- Регистрация Blueprints ---
@@ -38,5 +325,51 @@ async def health_check(request):
     return json({"status": "ok"})
 
 
+@app.get("/ready")
+async def readiness(request):
+    """
+    Готовность к трафику: 200, когда все воркеры закончили прогрев пула,
+    иначе 503. "/" - только проверка, что процесс жив.
+    """
+    warmup = request.app.ctx.pool_warmup
+    workers = getattr(request.app.shared_ctx, "workers", None)
+    ready_workers = getattr(request.app.shared_ctx, "ready_workers", None)
+    if workers is not None and ready_workers is not None:
+        ready = ready_workers.value >= workers.value
+    else:
+        ready = warmup.ready  # один процесс без главного (--single-process)
+    body = {"status": "ready" if ready else "warming_up", "worker": warmup.stats()}
+    return json(body, status=200 if ready else 503)
+
+
+@app.get("/stats/db")
+@protected(admin_only=True)
+async def db_stats(request):
+    """Сколько запросов воркера реально потребовали соединение из пула."""
+    return json(db_usage.report())
+
+
+@app.get("/metrics")
+async def metrics(request):
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    return text(
+        await registry.collect(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=True, auto_reload=True)
+    if settings.SERVER_DEBUG:
+        app.run(
+            host=settings.SERVER_HOST,
+            port=settings.SERVER_PORT,
+            debug=True,
+            auto_reload=True,
+        )
+    else:
+        app.run(
+            host=settings.SERVER_HOST,
+            port=settings.SERVER_PORT,
+            workers=settings.SERVER_WORKERS or os.cpu_count() or 1,
+            access_log=settings.SERVER_ACCESS_LOG,
+        )
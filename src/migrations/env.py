@@ -16,6 +16,7 @@ sys.path.insert(
 # --- А ТЕПЕРЬ ВСЕ ОСТАЛЬНЫЕ ИМПОРТЫ ---
 from src.core.config import settings
 from src.models.tables import Base
+from src.services.partitions import ARCHIVE_SCHEMA, is_partition
 
 # --- И ТОЛЬКО ПОТОМ ОСТАЛЬНОЙ КОД ---
 load_dotenv()  # Загружаем переменные окружения из .env
@@ -33,12 +34,29 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 
+def include_name(name, type_, parent_names) -> bool:
+    # Схема с отсоединенными секциями (src/tools/partitions.py detach)
+    return not (type_ == "schema" and name == ARCHIVE_SCHEMA)
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    # Секции payments создаются во время работы (src/services/partitions.py)
+    # и в Base.metadata их нет: autogenerate не должен предлагать их удалить
+    if type_ == "table":
+        table = name
+    else:
+        table = getattr(getattr(object, "table", None), "name", None)
+    return table is None or not is_partition(table)
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode."""
     url = settings.database_url_asyncpg.replace("+asyncpg", "")
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -65,7 +83,12 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            include_object=include_object,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,37 @@
+"""Limit transaction_id length in payment_transactions
+
+Revision ID: 0b5e7d3f9c28
+Revises: f2d6b8e4a170
+Create Date: 2026-10-18 19:40:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0b5e7d3f9c28"
+down_revision: Union[str, Sequence[str], None] = "f2d6b8e4a170"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONSTRAINT = "ck_payment_transactions_transaction_id_length"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # varchar(255) перезаписал бы таблицу; CHECK NOT VALID добавляется
+    # мгновенно, а VALIDATE в отдельной транзакции проверяет строки,
+    # не блокируя вставки
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"ALTER TABLE payment_transactions ADD CONSTRAINT {CONSTRAINT}"
+            " CHECK (char_length(transaction_id) <= 255) NOT VALID"
+        )
+        op.execute(f"ALTER TABLE payment_transactions VALIDATE CONSTRAINT {CONSTRAINT}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint(CONSTRAINT, "payment_transactions", type_="check")
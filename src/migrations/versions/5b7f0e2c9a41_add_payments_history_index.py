@@ -0,0 +1,42 @@
+"""Add covering index for payment history pagination
+
+Revision ID: 5b7f0e2c9a41
+Revises: 1c2e516a75cc
+Create Date: 2026-10-18 12:50:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b7f0e2c9a41"
+down_revision: Union[str, Sequence[str], None] = "1c2e516a75cc"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в payments, но не работает в транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_payments_account_id_created_at_id",
+            "payments",
+            ["account_id", "created_at", "id"],
+            unique=False,
+            postgresql_include=["transaction_id", "amount"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_payments_account_id_created_at_id",
+            table_name="payments",
+            postgresql_concurrently=True,
+        )
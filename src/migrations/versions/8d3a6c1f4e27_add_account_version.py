@@ -0,0 +1,33 @@
+"""Add version column to accounts
+
+Revision ID: 8d3a6c1f4e27
+Revises: 5b7f0e2c9a41
+Create Date: 2026-10-18 13:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d3a6c1f4e27"
+down_revision: Union[str, Sequence[str], None] = "5b7f0e2c9a41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Константный DEFAULT: столбец добавляется без перезаписи таблицы
+    op.add_column(
+        "accounts",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("accounts", "version")
@@ -0,0 +1,170 @@
+"""Partition payments by month of created_at
+
+Revision ID: a3f8d1c6b052
+Revises: e7b2f5a1c938
+Create Date: 2026-10-18 17:30:00.000000
+
+"""
+
+from datetime import datetime
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a3f8d1c6b052"
+down_revision: Union[str, Sequence[str], None] = "e7b2f5a1c938"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Сколько месяцев вперед создать сразу; дальше их создает
+# src/services/partitions.py (PAYMENTS_PARTITIONS_AHEAD)
+MONTHS_AHEAD = 3
+
+HISTORY_INDEX = "ix_payments_account_id_created_at_id"
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Миграция переписывает таблицу целиком и выполняется без нагрузки
+    op.rename_table("payments", "payments_legacy")
+    for name in ("payments_pkey", "ix_payments_id", HISTORY_INDEX):
+        op.execute(f"ALTER INDEX {name} RENAME TO {name}_legacy")
+
+    op.create_table(
+        "payments",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('payments_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("transaction_id", sa.String(), nullable=False),
+        sa.Column("amount", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["accounts.id"],
+        ),
+        sa.PrimaryKeyConstraint("id", "created_at"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+    op.create_index(
+        HISTORY_INDEX,
+        "payments",
+        ["account_id", "created_at", "id"],
+        unique=False,
+        postgresql_include=["transaction_id", "amount"],
+    )
+
+    # Секции от месяца самого старого платежа до MONTHS_AHEAD вперед.
+    # Секции по умолчанию нет: платеж вне секций - ошибка, а не тихий
+    # рост таблицы, которую потом не отсоединить без долгой блокировки
+    bind = op.get_bind()
+    first, current = bind.execute(sa.text("""
+        SELECT date_trunc('month', coalesce(min(created_at), localtimestamp)),
+               date_trunc('month', localtimestamp)
+        FROM payments_legacy
+        """)).one()
+    month = first
+    while month <= _add_months(current, MONTHS_AHEAD):
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE payments_{month:%Y_%m} PARTITION OF payments"
+            f" FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{upper:%Y-%m-%d}')"
+        )
+        month = upper
+
+    op.execute("""
+        INSERT INTO payments (id, transaction_id, amount, account_id, created_at)
+        SELECT id, transaction_id, amount, account_id, created_at
+        FROM payments_legacy
+        """)
+
+    op.create_table(
+        "payment_transactions",
+        sa.Column("transaction_id", sa.String(), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["accounts.id"],
+        ),
+        sa.PrimaryKeyConstraint("transaction_id"),
+    )
+    op.execute("""
+        INSERT INTO payment_transactions (transaction_id, account_id, created_at)
+        SELECT transaction_id, account_id, created_at FROM payments_legacy
+        """)
+
+    op.execute("ALTER SEQUENCE payments_id_seq OWNED BY payments.id")
+    op.drop_table("payments_legacy")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Отсоединенные секции (архив) обратно не возвращаются
+    op.rename_table("payments", "payments_partitioned")
+    op.execute(f"ALTER INDEX {HISTORY_INDEX} RENAME TO {HISTORY_INDEX}_partitioned")
+    op.execute("ALTER INDEX payments_pkey RENAME TO payments_partitioned_pkey")
+
+    op.create_table(
+        "payments",
+        sa.Column(
+            "id",
+            sa.Integer(),
+            server_default=sa.text("nextval('payments_id_seq'::regclass)"),
+            nullable=False,
+        ),
+        sa.Column("transaction_id", sa.String(), nullable=False),
+        sa.Column("amount", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["accounts.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute("""
+        INSERT INTO payments (id, transaction_id, amount, account_id, created_at)
+        SELECT id, transaction_id, amount, account_id, created_at
+        FROM payments_partitioned
+        """)
+    op.create_index(op.f("ix_payments_id"), "payments", ["id"], unique=False)
+    op.create_index(
+        op.f("ix_payments_transaction_id"), "payments", ["transaction_id"], unique=True
+    )
+    op.create_index(
+        HISTORY_INDEX,
+        "payments",
+        ["account_id", "created_at", "id"],
+        unique=False,
+        postgresql_include=["transaction_id", "amount"],
+    )
+    op.execute("ALTER SEQUENCE payments_id_seq OWNED BY payments.id")
+    op.drop_table("payment_transactions")
+    # Секции удаляются вместе с секционированной таблицей
+    op.drop_table("payments_partitioned")
@@ -0,0 +1,62 @@
+"""Add striped sub-balances for hot accounts
+
+Revision ID: c4e9a2d7b613
+Revises: 8d3a6c1f4e27
+Create Date: 2026-10-18 14:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e9a2d7b613"
+down_revision: Union[str, Sequence[str], None] = "8d3a6c1f4e27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Константный DEFAULT: столбец добавляется без перезаписи таблицы
+    op.add_column(
+        "accounts",
+        sa.Column("stripes", sa.SmallInteger(), server_default="1", nullable=False),
+    )
+    op.create_table(
+        "account_stripes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=False),
+        sa.Column("stripe", sa.SmallInteger(), nullable=False),
+        sa.Column(
+            "balance",
+            sa.Numeric(precision=10, scale=2),
+            server_default="0.00",
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["accounts.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("account_id", "stripe"),
+    )
+    op.create_index(
+        op.f("ix_account_stripes_id"), "account_stripes", ["id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Несвернутые полосы переносятся в accounts, чтобы не потерять деньги
+    op.execute("""
+        UPDATE accounts a SET balance = a.balance + s.total
+        FROM (SELECT account_id, sum(balance) AS total
+              FROM account_stripes GROUP BY account_id) s
+        WHERE a.id = s.account_id
+        """)
+    op.drop_index(op.f("ix_account_stripes_id"), table_name="account_stripes")
+    op.drop_table("account_stripes")
+    op.drop_column("accounts", "stripes")
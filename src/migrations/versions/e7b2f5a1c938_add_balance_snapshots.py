@@ -0,0 +1,65 @@
+"""Add balance snapshots for the append-only ledger mode
+
+Revision ID: e7b2f5a1c938
+Revises: c4e9a2d7b613
+Create Date: 2026-10-18 16:05:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e7b2f5a1c938"
+down_revision: Union[str, Sequence[str], None] = "c4e9a2d7b613"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "balance_snapshots",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=False),
+        sa.Column("as_of", sa.TIMESTAMP(), nullable=False),
+        sa.Column("balance", sa.Numeric(precision=10, scale=2), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["accounts.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_balance_snapshots_id"), "balance_snapshots", ["id"], unique=False
+    )
+    op.create_index(
+        "ix_balance_snapshots_account_id_as_of",
+        "balance_snapshots",
+        ["account_id", "as_of"],
+        unique=True,
+        postgresql_include=["balance"],
+    )
+    # Начальный снимок каждого счета: текущий полный баланс. Без него
+    # журнал считал бы баланс только по платежам и потерял бы остатки,
+    # внесенные не через payments. Миграция выполняется без нагрузки:
+    # незакоммиченный платеж с created_at < as_of в снимок бы не попал
+    op.execute("""
+        INSERT INTO balance_snapshots (account_id, as_of, balance)
+        SELECT a.id, localtimestamp, a.balance + coalesce(s.total, 0)
+        FROM accounts a
+        LEFT JOIN (SELECT account_id, sum(balance) AS total
+                   FROM account_stripes GROUP BY account_id) s
+            ON s.account_id = a.id
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        "ix_balance_snapshots_account_id_as_of", table_name="balance_snapshots"
+    )
+    op.drop_index(op.f("ix_balance_snapshots_id"), table_name="balance_snapshots")
+    op.drop_table("balance_snapshots")
@@ -0,0 +1,39 @@
+"""Add a DEFAULT partition to payments
+
+Revision ID: f2d6b8e4a170
+Revises: a3f8d1c6b052
+Create Date: 2026-10-18 19:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f2d6b8e4a170"
+down_revision: Union[str, Sequence[str], None] = "a3f8d1c6b052"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Платеж вне месячных секций больше не отменяет зачисление: он ждет
+    # в payments_default, пока src/services/partitions.py не создаст его
+    # месяц и не перенесет его туда
+    op.execute("CREATE TABLE payments_default PARTITION OF payments DEFAULT")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Платежи не удаляются молча: их месяцы сначала создает
+    # python -m src.tools.partitions ensure
+    rows = op.get_bind().scalar(sa.text("SELECT count(*) FROM payments_default"))
+    if rows:
+        raise RuntimeError(
+            f"payments_default holds {rows} payments;"
+            " run python -m src.tools.partitions ensure first"
+        )
+    op.execute("DROP TABLE payments_default")
@@ -1,9 +1,10 @@
 from decimal import Decimal
 import sqlalchemy as sa
 
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, column_property, mapped_column, relationship
 from sqlalchemy.sql import func
 
+from src.core.config import settings
 from src.core.database import Base
 
 Money = sa.Numeric(precision=10, scale=2)
@@ -34,10 +35,20 @@ class Account(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     # Вот ключевое изменение для Pylance!
     # Он теперь знает, что balance у экземпляра - это Decimal.
-    balance: Mapped[Decimal] = mapped_column(
-        Money, nullable=False, server_default="0.00"
+    # Столбец accounts.balance - свернутая часть баланса; полный баланс
+    # (с полосами из account_stripes) - Account.balance, см. ниже
+    folded_balance: Mapped[Decimal] = mapped_column(
+        "balance", Money, nullable=False, server_default="0.00"
+    )
+    # Число полос для горячих счетов: при stripes > 1 зачисления идут не в
+    # строку счета, а в одну из строк account_stripes (см. PaymentService)
+    stripes: Mapped[int] = mapped_column(
+        sa.SmallInteger, nullable=False, server_default="1"
     )
     user_id: Mapped[int] = mapped_column(sa.ForeignKey("users.id"), nullable=False)
+    # Растет при каждом изменении баланса; по нему кэши отбрасывают
+    # устаревшие обновления, пришедшие не по порядку
+    version: Mapped[int] = mapped_column(sa.Integer, nullable=False, server_default="0")
 
     user: Mapped["User"] = relationship(back_populates="accounts")
     payments: Mapped[list["Payment"]] = relationship(back_populates="account")
@@ -48,22 +59,168 @@ class Account(Base):
         )
 
 
+class AccountStripe(Base):
+    """Часть баланса горячего счета; сворачивается в accounts фоновой задачей."""
+
+    __tablename__ = "account_stripes"
+
+    account_id: Mapped[int] = mapped_column(
+        sa.ForeignKey("accounts.id"), nullable=False
+    )
+    stripe: Mapped[int] = mapped_column(sa.SmallInteger, nullable=False)
+    balance: Mapped[Decimal] = mapped_column(
+        Money, nullable=False, server_default="0.00"
+    )
+
+    __table_args__ = (sa.UniqueConstraint("account_id", "stripe"),)
+
+
 class Payment(Base):
+    """
+    Платеж. Таблица секционирована по месяцам created_at (payments_YYYY_MM,
+    см. src/services/partitions.py), поэтому ключ и все уникальные индексы
+    включают created_at; уникальность transaction_id держит
+    payment_transactions.
+    """
+
     __tablename__ = "payments"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    transaction_id: Mapped[str] = mapped_column(
-        sa.String, unique=True, index=True, nullable=False
-    )
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    transaction_id: Mapped[str] = mapped_column(sa.String, nullable=False)
     amount: Mapped[Decimal] = mapped_column(Money, nullable=False)
     account_id: Mapped[int] = mapped_column(
         sa.ForeignKey("accounts.id"), nullable=False
     )
     created_at: Mapped[sa.DateTime] = mapped_column(
-        sa.TIMESTAMP, server_default=func.now(), nullable=False
+        sa.TIMESTAMP, primary_key=True, server_default=func.now(), nullable=False
     )
 
     account: Mapped["Account"] = relationship(back_populates="payments")
 
+    __table_args__ = (
+        # История платежей по счету: keyset-пагинация по (created_at, id)
+        # без сортировки и, благодаря INCLUDE, без чтения самой таблицы
+        sa.Index(
+            "ix_payments_account_id_created_at_id",
+            "account_id",
+            "created_at",
+            "id",
+            postgresql_include=["transaction_id", "amount"],
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
     def __repr__(self):
         return f"<Payment(id={self.id}, transaction_id='{self.transaction_id}', amount={self.amount})>"
+
+
+class PaymentTransaction(Base):
+    """
+    Все когда-либо зачисленные transaction_id: глобальная уникальность
+    поверх секций payments. created_at совпадает с payments.created_at
+    (now() одной транзакции), по нему платеж находится в своей секции.
+    """
+
+    __tablename__ = "payment_transactions"
+
+    id = None
+    transaction_id: Mapped[str] = mapped_column(sa.String, primary_key=True)
+    account_id: Mapped[int] = mapped_column(
+        sa.ForeignKey("accounts.id"), nullable=False
+    )
+    created_at: Mapped[sa.DateTime] = mapped_column(
+        sa.TIMESTAMP, server_default=func.now(), nullable=False
+    )
+
+    __table_args__ = (
+        # CHECK, а не String(255): тип колонки не меняется без перезаписи
+        # таблицы; длину до запроса проверяет и WebhookEventIn
+        sa.CheckConstraint(
+            "char_length(transaction_id) <= 255",
+            name="ck_payment_transactions_transaction_id_length",
+        ),
+    )
+
+
+class BalanceSnapshot(Base):
+    """
+    Баланс счета на момент as_of: сумма всех платежей с created_at < as_of
+    (плюс начальный баланс). Пишется фоновой задачей, см. src/services/ledger.py.
+    """
+
+    __tablename__ = "balance_snapshots"
+
+    account_id: Mapped[int] = mapped_column(
+        sa.ForeignKey("accounts.id"), nullable=False
+    )
+    as_of: Mapped[sa.DateTime] = mapped_column(sa.TIMESTAMP, nullable=False)
+    balance: Mapped[Decimal] = mapped_column(Money, nullable=False)
+
+    __table_args__ = (
+        # Последний снимок счета на момент t - один спуск по индексу
+        sa.Index(
+            "ix_balance_snapshots_account_id_as_of",
+            "account_id",
+            "as_of",
+            unique=True,
+            postgresql_include=["balance"],
+        ),
+    )
+
+
+# Начало журнала для счета без снимков (константа, а не параметр:
+# asyncpg ждет для timestamp-параметра datetime, а не строку)
+NEGATIVE_INFINITY = sa.literal_column("'-infinity'::timestamp", sa.TIMESTAMP)
+
+
+def _latest_snapshot(column):
+    """Скалярный подзапрос: column последнего снимка счета."""
+    return (
+        sa.select(column)
+        .where(BalanceSnapshot.account_id == Account.id)
+        .order_by(BalanceSnapshot.as_of.desc())
+        .limit(1)
+        .correlate_except(BalanceSnapshot)
+        .scalar_subquery()
+    )
+
+
+def _ledger_balance():
+    """
+    Баланс по журналу: последний снимок плюс платежи после него. Сумма
+    платежей читается только из индекса ix_payments_account_id_created_at_id
+    (INCLUDE amount), снимок - из ix_balance_snapshots_account_id_as_of.
+    """
+    since = sa.func.coalesce(
+        _latest_snapshot(BalanceSnapshot.as_of),
+        NEGATIVE_INFINITY,
+    )
+    tail = (
+        sa.select(sa.func.sum(Payment.amount))
+        .where(Payment.account_id == Account.id, Payment.created_at >= since)
+        .correlate_except(Payment)
+        .scalar_subquery()
+    )
+    return sa.func.coalesce(
+        _latest_snapshot(BalanceSnapshot.balance), 0
+    ) + sa.func.coalesce(tail, 0)
+
+
+# Полный баланс счета. Все чтения баланса (ORM-объекты,
+# select(Account.balance), RETURNING) идут через это выражение.
+# В обычном режиме - свернутая часть плюс сумма полос (у счетов без полос
+# подзапрос - один пустой поиск по индексу); в режиме журнала
+# (LEDGER_MODE) строка счета не меняется, баланс считается по payments
+if settings.LEDGER_MODE:
+    Account.balance = column_property(_ledger_balance())
+else:
+    Account.balance = column_property(
+        Account.folded_balance
+        + sa.func.coalesce(
+            sa.select(sa.func.sum(AccountStripe.balance))
+            .where(AccountStripe.account_id == Account.id)
+            .correlate_except(AccountStripe)
+            .scalar_subquery(),
+            0,
+        )
+    )
@@ -0,0 +1,215 @@
+import time
+from decimal import Decimal
+from typing import Awaitable, Callable, Iterable, NamedTuple
+
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.core.notify import NotifyListener
+from src.core.routing import read_router
+
+# Канал для межворкерного обновления балансов.
+# payload: "<unix-время отправки>|<user_id>:<account_id>:<balance>:<version>;..."
+# (пустые balance и version - баланс неизвестен, запись сбрасывается)
+BALANCE_CHANNEL = "balance_changed"
+# Ограничение Postgres на размер payload - 8000 байт, оставляем запас
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+class AccountBalance(NamedTuple):
+    id: int
+    balance: Decimal
+    version: int
+
+
+class BalanceChange(NamedTuple):
+    """
+    Новый баланс счета после закоммиченной транзакции.
+
+    balance is None - баланс изменился, но неизвестен (зачисление в полосу
+    счета, см. Account.stripes): запись пользователя сбрасывается.
+    """
+
+    user_id: int
+    account_id: int
+    balance: Decimal | None
+    version: int
+
+
+class _Entry(NamedTuple):
+    accounts: tuple[AccountBalance, ...]
+    confirmed_at: float  # когда данные последний раз сверены с БД (monotonic)
+
+
+class BalanceCache:
+    """
+    Балансы счетов пользователя в памяти воркера.
+
+    Записи обновляются на месте по уведомлениям о зачислениях: обновление
+    применяется, только если его version больше закэшированной, поэтому
+    уведомления, пришедшие не по порядку, не откатывают баланс назад.
+    Уведомление о счете, которого нет в записи (новый счет), сбрасывает
+    запись целиком. TTL - страховка на случай потерянных уведомлений.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries: TTLCache[int, _Entry] = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Пользователи, чьи балансы сейчас читаются из БД, и число таких чтений
+        self._loading: dict[int, int] = {}
+        # ...и те из них, по которым за время чтения пришли изменения
+        self._dirty: set[int] = set()
+
+        self.updates_applied = 0
+        self.updates_outdated = 0
+        self.invalidations = 0
+        self._served_age_total = 0.0
+        self._served_age_max = 0.0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self._lag_count = 0
+
+    async def get_or_load(
+        self,
+        user_id: int,
+        loader: Callable[[], Awaitable[Iterable[AccountBalance]]],
+    ) -> tuple[AccountBalance, ...]:
+        """Балансы из кэша или, при промахе, через loader с сохранением."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            age = time.monotonic() - entry.confirmed_at
+            self._served_age_total += age
+            self._served_age_max = max(self._served_age_max, age)
+            return entry.accounts
+
+        self._loading[user_id] = self._loading.get(user_id, 0) + 1
+        try:
+            accounts = tuple(await loader())
+        finally:
+            self._loading[user_id] -= 1
+            dirty = user_id in self._dirty
+            if not self._loading[user_id]:
+                del self._loading[user_id]
+                self._dirty.discard(user_id)
+        # Прочитанный снимок мог устареть, пока шел запрос, - не кэшируем его
+        if not dirty:
+            self._entries.set(user_id, _Entry(accounts, time.monotonic()))
+        return accounts
+
+    def apply(self, changes: Iterable[BalanceChange], sent_at: float | None = None):
+        """Применяет изменения балансов (своего воркера или из NOTIFY)."""
+        if sent_at is not None:
+            lag = max(0.0, time.time() - sent_at)
+            self._lag_total += lag
+            self._lag_max = max(self._lag_max, lag)
+            self._lag_count += 1
+
+        now = time.monotonic()
+        for change in changes:
+            if change.balance is None:
+                self.invalidate(change.user_id)
+                continue
+            entry = self._entries.peek(change.user_id)
+            if entry is None:
+                if change.user_id in self._loading:
+                    self._dirty.add(change.user_id)
+                continue
+            accounts = list(entry.accounts)
+            for i, account in enumerate(accounts):
+                if account.id == change.account_id:
+                    break
+            else:
+                self.invalidate(change.user_id)
+                continue
+            if change.version <= account.version:
+                self.updates_outdated += 1
+                continue
+            accounts[i] = AccountBalance(
+                change.account_id, change.balance, change.version
+            )
+            self._entries.set(change.user_id, _Entry(tuple(accounts), now))
+            self.updates_applied += 1
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id)
+        if user_id in self._loading:
+            self._dirty.add(user_id)
+        self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._dirty.update(self._loading)
+
+    def stats(self) -> dict:
+        stats = self._entries.stats()
+        hits = self._entries.hits
+        stats.update(
+            {
+                "updates_applied": self.updates_applied,
+                "updates_outdated": self.updates_outdated,
+                "invalidations": self.invalidations,
+                # Возраст отданных из кэша данных с момента сверки с БД
+                "served_age_avg_ms": (
+                    round(self._served_age_total / hits * 1000, 3) if hits else 0.0
+                ),
+                "served_age_max_ms": round(self._served_age_max * 1000, 3),
+                # Задержка от отправки NOTIFY до применения в этом воркере
+                "notify_lag_avg_ms": (
+                    round(self._lag_total / self._lag_count * 1000, 3)
+                    if self._lag_count
+                    else 0.0
+                ),
+                "notify_lag_max_ms": round(self._lag_max * 1000, 3),
+            }
+        )
+        return stats
+
+
+balance_cache = BalanceCache(
+    maxsize=settings.BALANCE_CACHE_SIZE,
+    ttl=settings.BALANCE_CACHE_TTL_SECONDS,
+)
+
+
+def encode_changes(changes: list[BalanceChange]) -> list[str]:
+    """
+    Упаковывает изменения в payload'ы NOTIFY, не превышающие лимит.
+
+    Лимит Postgres - в байтах, поэтому и размер считается в байтах UTF-8.
+    Запись состоит только из чисел (десятки байт), так что отдельно
+    ограничивать ее длину не нужно.
+    """
+    header = f"{time.time():.6f}|"
+    payloads, items, size = [], [], len(header)
+    for c in changes:
+        if c.balance is None:
+            item = f"{c.user_id}:{c.account_id}::"
+        else:
+            item = f"{c.user_id}:{c.account_id}:{c.balance}:{c.version}"
+        length = len(item.encode())
+        if items and size + length + 1 > NOTIFY_PAYLOAD_LIMIT:
+            payloads.append(header + ";".join(items))
+            items, size = [], len(header)
+        items.append(item)
+        size += length + 1
+    if items:
+        payloads.append(header + ";".join(items))
+    return payloads
+
+
+def _on_notify(payload: str) -> None:
+    sent_at, _, body = payload.partition("|")
+    changes = []
+    for item in body.split(";"):
+        user_id, account_id, balance, version = item.split(":")
+        if not balance:
+            changes.append(BalanceChange(int(user_id), int(account_id), None, 0))
+            continue
+        changes.append(
+            BalanceChange(int(user_id), int(account_id), Decimal(balance), int(version))
+        )
+    balance_cache.apply(changes, sent_at=float(sent_at))
+    read_router.mark_written(change.user_id for change in changes)
+
+
+def listen_balance_changes(listener: NotifyListener) -> None:
+    """Подписывает кэш на зачисления, сделанные другими воркерами."""
+    listener.subscribe(BALANCE_CHANNEL, _on_notify, on_reset=balance_cache.clear)
@@ -0,0 +1,108 @@
+from typing import Iterable, NamedTuple
+
+from src.api.schemas import WebhookEvent
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.core.metrics import webhook_dedup_hits
+from src.core.notify import NotifyListener
+from src.services.balances import NOTIFY_PAYLOAD_LIMIT
+
+# Канал для межворкерного обмена зачисленными транзакциями.
+# payload: "<user_id>:<account_id>:<transaction_id>" по одной на строку
+TRANSACTION_CHANNEL = "payment_committed"
+
+
+class RecentPayment(NamedTuple):
+    """Транзакция, которая уже есть в payments (закоммичена)."""
+
+    transaction_id: str
+    user_id: int
+    account_id: int
+
+
+class RecentTransactions:
+    """
+    Недавно закоммиченные transaction_id в памяти воркера.
+
+    Отвечает только «точно уже зачислено»: запись появляется после
+    коммита платежа, а платежи не удаляются, поэтому попадание не бывает
+    ложным. Промах ничего не значит - событие идет в БД как обычно.
+    Повтор засчитывается, только если совпадают и пользователь, и счет:
+    для чужого счета БД ответила бы REJECTED, а не DUPLICATE.
+    """
+
+    def __init__(self, maxsize: int, window: float):
+        self._entries: TTLCache[str, tuple[int, int]] = TTLCache(
+            maxsize=maxsize, ttl=window
+        )
+
+    def seen(self, event: WebhookEvent) -> bool:
+        owner = self._entries.get(event.transaction_id)
+        return owner == (event.user_id, event.account_id)
+
+    def add(self, payments: Iterable[RecentPayment]) -> None:
+        for p in payments:
+            self._entries.set(p.transaction_id, (p.user_id, p.account_id))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        stats = self._entries.stats()
+        # hits - повторы, на которые ответили без обращения к БД
+        stats["window_seconds"] = self._entries.ttl
+        return stats
+
+
+recent_transactions = RecentTransactions(
+    maxsize=settings.DEDUP_CACHE_SIZE,
+    window=settings.DEDUP_WINDOW_SECONDS,
+)
+
+
+def already_committed(event: WebhookEvent) -> bool:
+    """Событие - повтор недавно зачисленного платежа (без запроса к БД)."""
+    if recent_transactions.seen(event):
+        webhook_dedup_hits.inc()
+        return True
+    return False
+
+
+def encode_payments(payments: list[RecentPayment]) -> list[str]:
+    """Упаковывает транзакции в payload'ы NOTIFY, не превышающие лимит."""
+    payloads, items, size = [], [], 0
+    for p in payments:
+        if "\n" in p.transaction_id:
+            continue  # не разобрать на приеме; такой повтор просто дойдет до БД
+        item = f"{p.user_id}:{p.account_id}:{p.transaction_id}"
+        # Лимит Postgres - в байтах; запись, которая одна не влезает в
+        # payload, не отправляется: pg_notify() отверг бы ее ошибкой
+        length = len(item.encode())
+        if length > NOTIFY_PAYLOAD_LIMIT:
+            continue
+        if items and size + length + 1 > NOTIFY_PAYLOAD_LIMIT:
+            payloads.append("\n".join(items))
+            items, size = [], 0
+        items.append(item)
+        size += length + 1
+    if items:
+        payloads.append("\n".join(items))
+    return payloads
+
+
+def _on_notify(payload: str) -> None:
+    payments = []
+    for item in payload.split("\n"):
+        user_id, account_id, tid = item.split(":", 2)
+        payments.append(RecentPayment(tid, int(user_id), int(account_id)))
+    recent_transactions.add(payments)
+
+
+def listen_committed_payments(listener: NotifyListener) -> None:
+    """
+    Подписывает фильтр на зачисления других воркеров.
+
+    Потерянные уведомления только снижают число попаданий, поэтому
+    при переподключении фильтр не сбрасывается.
+    """
+    listener.subscribe(TRANSACTION_CHANNEL, _on_notify)
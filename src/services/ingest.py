@@ -0,0 +1,528 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.core.metrics import (
+    registry,
+    webhook_events,
+    webhook_ingest_dead_letters,
+    webhook_ingest_dead_lettered,
+    webhook_ingest_depth,
+    webhook_ingest_failed_batches,
+)
+from src.services.payments import PaymentService, WebhookStatus
+
+logger = logging.getLogger(__name__)
+
+# Файлы рядом с журналом <path>: смещение, отложенные и отклоненные события
+_SIDECARS = ("checkpoint", "dead", "rejected")
+
+
+def journal_paths(base: str | Path) -> list[Path]:
+    """Журналы всех воркеров на диске: base (один процесс) и base.<воркер>."""
+    base = Path(base)
+    if not base.parent.is_dir():
+        return []
+    prefix = base.name + "."
+    return sorted(
+        path
+        for path in base.parent.iterdir()
+        if path.name == base.name
+        or (
+            path.name.startswith(prefix)
+            and "." not in path.name[len(prefix) :]
+            and path.name[len(prefix) :] not in _SIDECARS
+        )
+    )
+
+
+def _lock_orphan_sync(path: Path):
+    """Открытый и заблокированный журнал без владельца или None."""
+    try:
+        file = open(path, "rb")
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Журнал мог забрать и удалить другой воркер, пока мы его открывали
+        if os.stat(path).st_ino == os.fstat(file.fileno()).st_ino:
+            return file
+    except (BlockingIOError, FileNotFoundError):
+        pass
+    file.close()
+    return None
+
+
+def _pending_records_sync(path: Path) -> list[dict]:
+    """Записи журнала после его checkpoint (без недописанной строки)."""
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return []
+    checkpoint_path = path.with_name(path.name + ".checkpoint")
+    offset = int(checkpoint_path.read_text()) if checkpoint_path.exists() else 0
+    return [
+        json.loads(line)
+        for line in data[offset:].splitlines(keepends=True)
+        if line.endswith(b"\n")
+    ]
+
+
+class WebhookJournal:
+    """
+    Append-only журнал принятых вебхуков в формате JSON Lines.
+
+    Записи копятся в памяти и сбрасываются на диск одной операцией
+    write + fsync раз в fsync_interval секунд (групповой коммит):
+    append() возвращает управление только после fsync своей записи.
+    Рядом лежит файл <path>.checkpoint со смещением, до которого все
+    записи уже зафиксированы в Postgres. Пока журнал открыт, на нем
+    держится flock: так другие воркеры отличают его от брошенного.
+    """
+
+    def __init__(self, path: str | Path, fsync_interval: float, max_bytes: int):
+        self.path = Path(path)
+        self.checkpoint_path = self.path.with_name(self.path.name + ".checkpoint")
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+
+        self.size = 0  # байт на диске (после fsync)
+        self.checkpoint = 0  # байт, уже примененных к БД
+        self.generation = 0  # растет при каждом обнулении журнала
+        self._lock = asyncio.Lock()
+        self._pending: list[bytes] = []
+        self._waiters: list[asyncio.Future] = []
+        self._wakeup = asyncio.Event()
+        self._written = asyncio.Condition()
+        self._flusher: asyncio.Task | None = None
+        self._file = None
+
+    async def open(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = await asyncio.to_thread(self._open_locked_sync)
+        self.size = await asyncio.to_thread(self._repair_tail_sync)
+        if self.checkpoint_path.exists():
+            self.checkpoint = min(int(self.checkpoint_path.read_text()), self.size)
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        await self._flush()
+        if self._file is not None:
+            self._file.close()
+
+    async def append(self, record: dict) -> None:
+        """Добавляет запись и ждет, пока она окажется на диске."""
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        waiter = asyncio.get_running_loop().create_future()
+        self._pending.append(line)
+        self._waiters.append(waiter)
+        self._wakeup.set()
+        await waiter
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            # Даем накопиться соседним записям, чтобы заплатить за один fsync
+            await asyncio.sleep(self.fsync_interval)
+            self._wakeup.clear()
+            await self._flush()
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        chunk, self._pending = b"".join(self._pending), []
+        waiters, self._waiters = self._waiters, []
+        async with self._lock:
+            try:
+                await asyncio.to_thread(self._write_sync, chunk)
+            except Exception as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                return
+            self.size += len(chunk)
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        async with self._written:
+            self._written.notify_all()
+
+    def _open_locked_sync(self):
+        while True:
+            file = open(self.path, "ab")
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            # Пока ждали блокировку, журнал мог забрать и удалить другой
+            # воркер (WebhookIngest.adopt) - тогда открываем новый файл
+            try:
+                if os.stat(self.path).st_ino == os.fstat(file.fileno()).st_ino:
+                    return file
+            except FileNotFoundError:
+                pass
+            file.close()
+
+    def _repair_tail_sync(self) -> int:
+        """Отрезает недописанную последнюю строку после аварийного останова."""
+        size = self._file.tell()
+        if size == 0:
+            return 0
+        with open(self.path, "rb") as f:
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+        if tail.endswith(b"\n"):
+            return size
+        size -= len(tail) - (tail.rfind(b"\n") + 1)
+        self._file.truncate(size)
+        return size
+
+    def _write_sync(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    async def wait_for_data(self, offset: int, generation: int) -> None:
+        """Ждет новых данных после offset или обнуления журнала."""
+        async with self._written:
+            await self._written.wait_for(
+                lambda: self.size > offset or self.generation != generation
+            )
+
+    async def read(self, offset: int, limit: int) -> list[tuple[int, dict]]:
+        """Читает до limit записей начиная с offset; возвращает (конец, запись)."""
+        return await asyncio.to_thread(self._read_sync, offset, limit)
+
+    def _read_sync(self, offset: int, limit: int) -> list[tuple[int, dict]]:
+        records = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while len(records) < limit and offset < self.size:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                records.append((offset, json.loads(line)))
+        return records
+
+    async def count_from(self, offset: int) -> int:
+        return await asyncio.to_thread(self._count_sync, offset)
+
+    def _count_sync(self, offset: int) -> int:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return sum(1 for _ in f)
+
+    async def save_checkpoint(self, offset: int) -> None:
+        """Сохраняет смещение и обнуляет журнал, если он целиком применен."""
+        async with self._lock:
+            self.checkpoint = offset
+            if offset == self.size >= self.max_bytes:
+                await asyncio.to_thread(self._truncate_sync)
+                self.size = self.checkpoint = 0
+                self.generation += 1
+            await asyncio.to_thread(self._save_checkpoint_sync, self.checkpoint)
+        async with self._written:
+            self._written.notify_all()
+
+    def _truncate_sync(self) -> None:
+        self._file.truncate(0)
+        os.fsync(self._file.fileno())
+
+    def _save_checkpoint_sync(self, offset: int) -> None:
+        tmp = self.checkpoint_path.with_name(self.checkpoint_path.name + ".tmp")
+        tmp.write_text(str(offset))
+        os.replace(tmp, self.checkpoint_path)
+
+
+class WebhookIngest:
+    """
+    Режим отложенной записи вебхуков (write-behind).
+
+    Обработчик только дописывает событие в журнал и сразу отвечает 200.
+    Фоновый диспетчер читает журнал микропачками, а пул дренеров применяет
+    их через PaymentService. Смещение в журнале продвигается только по
+    непрерывному префиксу примененных пачек, поэтому после рестарта
+    незафиксированные записи проигрываются заново; повтор безопасен, т.к.
+    платежи дедуплицируются по transaction_id.
+
+    Событие, которое Postgres отвергает (нет секции payments, гонка с
+    внешним ключом и т.п.), не теряется: оно переносится в журнал
+    отложенных событий dead_letters, и раз в retry_interval секунд
+    они применяются заново, пока не пройдут. Событие, которое отклонено
+    (счет принадлежит другому пользователю или пользователя нет), не
+    пройдет никогда: оно пишется в журнал rejected для разбора вручную.
+    """
+
+    def __init__(
+        self,
+        journal: WebhookJournal,
+        dead_letters: WebhookJournal,
+        rejected: WebhookJournal,
+        session_maker: async_sessionmaker[AsyncSession],
+        workers: int,
+        batch_size: int,
+        retry_interval: float,
+    ):
+        self.journal = journal
+        self.dead_letters = dead_letters
+        self.rejected = rejected
+        self.session_maker = session_maker
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+
+        self.depth = 0  # записей в журнале после checkpoint
+        self.dead_depth = 0  # отложенных событий после checkpoint их журнала
+        self.appended_total = 0
+        self.committed_total = 0
+        self.failed_batches = 0
+        self.dead_lettered_total = 0
+        self.replayed_total = 0
+        self.rejected_total = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+        self._done: dict[int, tuple[int, int]] = {}  # начало -> (конец, записей)
+        self._inflight: dict[int, float] = {}  # начало пачки -> время первой записи
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        await self.journal.open()
+        await self.dead_letters.open()
+        await self.rejected.open()
+        self.depth = await self.journal.count_from(self.journal.checkpoint)
+        if self.depth:
+            logger.info("Replaying %s uncommitted webhook events", self.depth)
+        self.dead_depth = await self.dead_letters.count_from(
+            self.dead_letters.checkpoint
+        )
+        if self.dead_depth:
+            logger.warning("%s webhook events in dead-letter journal", self.dead_depth)
+        registry.add_collector(self._collect_metrics)
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._drain()))
+        self._tasks.append(asyncio.create_task(self._retry_dead_letters()))
+
+    async def adopt(self, paths: list[Path]) -> None:
+        """
+        Забирает журналы воркеров, которых больше нет (уменьшили
+        SERVER_WORKERS, воркеры переименованы): события в них уже
+        подтверждены провайдеру. Непримененные записи, отложенные и
+        отклоненные события дописываются в журналы этого воркера, затем
+        файлы брошенного журнала удаляются. Журналы живых воркеров
+        заблокированы и пропускаются. Сбой посередине дает только
+        повторы, а они дедуплицируются по transaction_id.
+        """
+        for path in paths:
+            if path == self.journal.path:
+                continue
+            lock = await asyncio.to_thread(_lock_orphan_sync, path)
+            if lock is None:
+                continue
+            try:
+                moved = []
+                for suffix, target in (
+                    ("", self.journal),
+                    (".dead", self.dead_letters),
+                    (".rejected", self.rejected),
+                ):
+                    source = path.with_name(path.name + suffix)
+                    records = await asyncio.to_thread(_pending_records_sync, source)
+                    await asyncio.gather(*(target.append(r) for r in records))
+                    moved.append(len(records))
+                self.depth += moved[0]
+                self.dead_depth += moved[1]
+                # Сам журнал удаляется последним: пока он есть, он будет
+                # забран снова
+                for suffix in (".checkpoint", ".dead", ".dead.checkpoint", ".rejected"):
+                    path.with_name(path.name + suffix).unlink(missing_ok=True)
+                path.unlink()
+            finally:
+                lock.close()
+            logger.warning(
+                "Adopted orphaned webhook journal %s: %s pending,"
+                " %s dead-letter, %s rejected events",
+                path,
+                *moved,
+            )
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.journal.close()
+        await self.dead_letters.close()
+        await self.rejected.close()
+
+    async def submit(self, payload: dict) -> None:
+        """Надежно сохраняет уже проверенное событие для последующей записи в БД."""
+        await self.journal.append({"ts": time.time(), "event": payload})
+        self.depth += 1
+        self.appended_total += 1
+
+    def stats(self) -> dict:
+        oldest = min(self._inflight.values(), default=None)
+        return {
+            "queue_depth": self.depth,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest else 0.0,
+            "appended_total": self.appended_total,
+            "committed_total": self.committed_total,
+            "failed_batches": self.failed_batches,
+            "dead_letter_depth": self.dead_depth,
+            "dead_lettered_total": self.dead_lettered_total,
+            "replayed_total": self.replayed_total,
+            "rejected_total": self.rejected_total,
+            "journal_bytes": self.journal.size,
+            "checkpoint": self.journal.checkpoint,
+        }
+
+    def _collect_metrics(self) -> None:
+        webhook_ingest_depth.set(value=self.depth)
+        webhook_ingest_dead_letters.set(value=self.dead_depth)
+
+    async def _dispatch(self) -> None:
+        offset = self.journal.checkpoint
+        generation = self.journal.generation
+        while True:
+            await self.journal.wait_for_data(offset, generation)
+            if generation != self.journal.generation:
+                # Журнал был обнулен после полного применения - читаем с начала
+                offset, generation = 0, self.journal.generation
+                continue
+            records = await self.journal.read(offset, self.batch_size)
+            if not records:
+                continue
+            self._inflight[offset] = records[0][1]["ts"]
+            await self._queue.put((offset, records))
+            offset = records[-1][0]
+
+    async def _drain(self) -> None:
+        while True:
+            start, records = await self._queue.get()
+            await self._apply([record["event"] for _, record in records])
+            await self._commit(start, records[-1][0], len(records))
+
+    async def _apply(self, events: list[dict]) -> None:
+        delay = 0.1
+        while True:
+            try:
+                async with self.session_maker() as session:
+                    statuses = await PaymentService(session).apply_batch(events)
+                break
+            except (DataError, IntegrityError) as e:
+                # Ошибка в данных не исчезнет при немедленном повторе:
+                # изолируем событие и откладываем его
+                if len(events) == 1:
+                    await self._dead_letter(events[0], e)
+                    return
+                for event in events:
+                    await self._apply([event])
+                return
+            except Exception as e:
+                # БД недоступна и т.п.: пачка остается незафиксированной
+                self.failed_batches += 1
+                webhook_ingest_failed_batches.inc()
+                logger.warning("Failed to apply webhook batch: %s", e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+        for event in events:
+            if statuses.get(str(event["transaction_id"])) is WebhookStatus.REJECTED:
+                await self._reject(event)
+
+    async def _append(self, journal: WebhookJournal, record: dict) -> None:
+        """Дописывает запись в журнал, повторяя до успешного fsync."""
+        delay = 0.1
+        while True:
+            try:
+                await journal.append(record)
+                return
+            except OSError as e:
+                logger.warning("Failed to write %s: %s", journal.path, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5.0)
+
+    async def _reject(self, event: dict) -> None:
+        """Сохраняет отклоненное событие: ответ 200 провайдеру уже отправлен."""
+        await self._append(self.rejected, {"ts": time.time(), "event": event})
+        self.rejected_total += 1
+        webhook_events.inc("rejected")
+        logger.error(
+            "Webhook event %s rejected: account %s does not belong to user %s",
+            event.get("transaction_id"),
+            event.get("account_id"),
+            event.get("user_id"),
+        )
+
+    async def _dead_letter(self, event: dict, error: Exception) -> None:
+        """Переносит событие в журнал отложенных."""
+        record = {"ts": time.time(), "event": event, "error": str(error)}
+        await self._append(self.dead_letters, record)
+        self.dead_depth += 1
+        self.dead_lettered_total += 1
+        webhook_ingest_dead_lettered.inc()
+        logger.error(
+            "Webhook event %s deferred to dead-letter journal: %s",
+            event.get("transaction_id"),
+            error,
+        )
+
+    async def _retry_dead_letters(self) -> None:
+        while True:
+            await asyncio.sleep(self.retry_interval)
+            if self.dead_depth:
+                await self._replay_dead_letters()
+
+    async def _replay_dead_letters(self) -> None:
+        """
+        Применяет отложенные события заново по одному.
+
+        Checkpoint продвигается по непрерывному префиксу прошедших;
+        прошедшие после застрявшего применятся еще раз на следующем
+        проходе и окажутся дубликатами.
+        """
+        offset = checkpoint = self.dead_letters.checkpoint
+        replayed, stuck = 0, False
+        while records := await self.dead_letters.read(offset, self.batch_size):
+            for end, record in records:
+                event = record["event"]
+                try:
+                    async with self.session_maker() as session:
+                        statuses = await PaymentService(session).apply_batch([event])
+                except Exception as e:
+                    stuck = True
+                    logger.warning(
+                        "Dead-letter webhook event %s still fails: %s",
+                        event.get("transaction_id"),
+                        e,
+                    )
+                    continue
+                if statuses.get(str(event["transaction_id"])) is WebhookStatus.REJECTED:
+                    await self._reject(event)
+                if not stuck:
+                    checkpoint = end
+                    replayed += 1
+            offset = records[-1][0]
+        if replayed:
+            self.dead_depth -= replayed
+            self.replayed_total += replayed
+            await self.dead_letters.save_checkpoint(checkpoint)
+
+    async def _commit(self, start: int, end: int, count: int) -> None:
+        self._done[start] = (end, count)
+        self._inflight.pop(start, None)
+        checkpoint = self.journal.checkpoint
+        advanced = False
+        while checkpoint in self._done:
+            checkpoint, count = self._done.pop(checkpoint)
+            self.depth -= count
+            self.committed_total += count
+            advanced = True
+        if advanced:
+            await self.journal.save_checkpoint(checkpoint)
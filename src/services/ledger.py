@@ -0,0 +1,221 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, literal, select, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from src.models.tables import NEGATIVE_INFINITY, Account, BalanceSnapshot, Payment
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_try_advisory_xact_lock: снимки пишет один воркер за раз
+SNAPSHOT_LOCK_KEY = 0x1ED_6E25
+# Ключ pg_try_advisory_lock на весь проход фоновой задачи: счета
+# проходит один воркер, а не каждый по очереди
+SNAPSHOT_RUNNER_LOCK_KEY = 0x1ED_6E26
+
+
+class LedgerService:
+    """Снимки балансов по журналу платежей и баланс на момент времени."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def snapshot_cutoff(self, settle: float) -> datetime:
+        """Момент, до которого все платежи уже закоммичены (now() - settle)."""
+        return await self.session.scalar(
+            select(func.localtimestamp() - timedelta(seconds=settle))
+        )
+
+    async def take_snapshots(
+        self, as_of: datetime, after: int, limit: int
+    ) -> tuple[int, int | None]:
+        """
+        Пишет снимки на момент as_of для до limit счетов с id > after.
+
+        Возвращает (число снимков, последний просмотренный id); id None -
+        счета кончились или снимки сейчас пишет другой воркер. Снимок
+        появляется, только если после предыдущего были платежи.
+        """
+        locked = await self.session.scalar(
+            select(func.pg_try_advisory_xact_lock(SNAPSHOT_LOCK_KEY))
+        )
+        if not locked:
+            await self.session.rollback()
+            return 0, None
+        chunk = (
+            select(Account.id)
+            .where(Account.id > after)
+            .order_by(Account.id)
+            .limit(limit)
+            .subquery()
+        )
+        upper = await self.session.scalar(select(func.max(chunk.c.id)))
+        if upper is None:
+            await self.session.rollback()
+            return 0, None
+        written = await self.session.execute(self._snapshot_stmt(as_of, after, upper))
+        count = len(written.all())
+        await self.session.commit()
+        return count, upper
+
+    @staticmethod
+    def _snapshot_stmt(as_of: datetime, after: int, upper: int):
+        """
+        INSERT INTO balance_snapshots (account_id, as_of, balance)
+        SELECT a.id, :as_of, coalesce(last.balance, 0) + tail.total
+        FROM accounts a
+        LEFT JOIN LATERAL (последний снимок до :as_of) last ON true
+        CROSS JOIN LATERAL (SELECT sum(amount) AS total FROM payments
+                            WHERE created_at >= last.as_of
+                            AND created_at < :as_of) tail
+        WHERE a.id > :after AND a.id <= :upper AND tail.total IS NOT NULL
+        ON CONFLICT DO NOTHING
+
+        Оба подзапроса - поиск по индексу на счет; платежи читаются
+        только из ix_payments_account_id_created_at_id (INCLUDE amount).
+        """
+        last = (
+            select(BalanceSnapshot.as_of, BalanceSnapshot.balance)
+            .where(
+                BalanceSnapshot.account_id == Account.id,
+                BalanceSnapshot.as_of <= as_of,
+            )
+            .order_by(BalanceSnapshot.as_of.desc())
+            .limit(1)
+            .lateral("last")
+        )
+        tail = (
+            select(func.sum(Payment.amount).label("total"))
+            .where(
+                Payment.account_id == Account.id,
+                Payment.created_at >= func.coalesce(last.c.as_of, NEGATIVE_INFINITY),
+                Payment.created_at < as_of,
+            )
+            .lateral("tail")
+        )
+        rows = (
+            select(
+                Account.id,
+                literal(as_of, BalanceSnapshot.as_of.type),
+                func.coalesce(last.c.balance, 0) + tail.c.total,
+            )
+            .select_from(Account)
+            .outerjoin(last, true())
+            .join(tail, true())
+            .where(Account.id > after, Account.id <= upper, tail.c.total.is_not(None))
+        )
+        return (
+            pg_insert(BalanceSnapshot)
+            .from_select(["account_id", "as_of", "balance"], rows)
+            .on_conflict_do_nothing()
+            .returning(BalanceSnapshot.account_id)
+        )
+
+    async def balance_at(
+        self, user_id: int, account_id: int, at: datetime
+    ) -> Decimal | None:
+        """
+        Баланс счета пользователя на момент at (None - счета у него нет).
+
+        Ближайший снимок не позже at плюс платежи после него; если такого
+        снимка нет - ближайший более поздний снимок минус платежи до него.
+        Стоимость не зависит от длины истории счета: читаются только
+        платежи между двумя соседними снимками.
+        """
+        snapshot = select(BalanceSnapshot.as_of, BalanceSnapshot.balance).where(
+            BalanceSnapshot.account_id == Account.id
+        )
+        before = (
+            snapshot.where(BalanceSnapshot.as_of <= at)
+            .order_by(BalanceSnapshot.as_of.desc())
+            .limit(1)
+            .lateral("before")
+        )
+        later = (
+            snapshot.where(BalanceSnapshot.as_of > at)
+            .order_by(BalanceSnapshot.as_of)
+            .limit(1)
+            .lateral("later")
+        )
+        row = (
+            await self.session.execute(
+                select(before.c.as_of, before.c.balance, later.c.as_of, later.c.balance)
+                .select_from(Account)
+                .outerjoin(before, true())
+                .outerjoin(later, true())
+                .where(Account.id == account_id, Account.user_id == user_id)
+            )
+        ).one_or_none()
+        if row is None:
+            return None
+        before_at, before_balance, later_at, later_balance = row
+
+        payments = select(func.coalesce(func.sum(Payment.amount), 0)).where(
+            Payment.account_id == account_id
+        )
+        if before_at is not None:
+            total = await self.session.scalar(
+                payments.where(Payment.created_at >= before_at, Payment.created_at < at)
+            )
+            return before_balance + total
+        if later_at is not None:
+            total = await self.session.scalar(
+                payments.where(Payment.created_at >= at, Payment.created_at < later_at)
+            )
+            return later_balance - total
+        return await self.session.scalar(payments.where(Payment.created_at < at))
+
+
+async def snapshot_balances_periodically(
+    engine: AsyncEngine,
+    session_maker: async_sessionmaker[AsyncSession],
+    interval: float,
+    settle: float,
+    batch_size: int,
+) -> None:
+    """
+    Фоновая задача воркера: раз в interval секунд проходит все счета
+    пачками по batch_size (каждая - отдельная транзакция) и пишет снимки.
+
+    Проход делает один воркер: он держит pg_try_advisory_lock на своем
+    соединении до конца прохода, остальные в это время проход пропускают.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with engine.connect() as conn:
+                # Блокировка уровня сессии: транзакция на все время
+                # прохода не нужна
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                runner = select(func.pg_try_advisory_lock(SNAPSHOT_RUNNER_LOCK_KEY))
+                if not await conn.scalar(runner):
+                    continue
+                try:
+                    written, as_of = await _take_all_snapshots(
+                        session_maker, settle, batch_size
+                    )
+                finally:
+                    # Соединение закрывается вместо pg_advisory_unlock:
+                    # блокировка не вернется в пул, даже если проход прерван
+                    await conn.invalidate()
+            if written:
+                logger.debug("Wrote %s balance snapshots as of %s", written, as_of)
+        except Exception as e:
+            logger.warning("Failed to write balance snapshots: %s", e)
+
+
+async def _take_all_snapshots(
+    session_maker: async_sessionmaker[AsyncSession], settle: float, batch_size: int
+) -> tuple[int, datetime]:
+    written, after = 0, 0
+    async with session_maker() as session:
+        ledger = LedgerService(session)
+        as_of = await ledger.snapshot_cutoff(settle)
+        while after is not None:
+            count, after = await ledger.take_snapshots(as_of, after, batch_size)
+            written += count
+    return written, as_of
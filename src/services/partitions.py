@@ -0,0 +1,279 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.core.metrics import payments_partitions_missing
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_try_advisory_xact_lock: секции создает один воркер за раз
+PARTITIONS_LOCK_KEY = 0x9A_7715
+
+PARENT = "payments"
+# Секция по умолчанию: платеж вне месячных секций не теряется, а ждет,
+# пока ensure() создаст его месяц и перенесет его туда
+DEFAULT = "payments_default"
+# Схема для отсоединенных секций по умолчанию (detach без --drop)
+ARCHIVE_SCHEMA = "payments_archive"
+
+
+class PartitionError(RuntimeError):
+    """Секцию нельзя отсоединить (текущая, будущая или нужна балансам)."""
+
+
+class Partition(NamedTuple):
+    """Месячная секция payments: [lower, upper)."""
+
+    name: str
+    lower: datetime
+    upper: datetime
+    detach_pending: bool = False
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def month_partition(value: datetime) -> Partition:
+    """Секция, в которую попадает платеж с created_at = value."""
+    lower = datetime(value.year, value.month, 1)
+    return Partition(f"{PARENT}_{lower:%Y_%m}", lower, add_months(lower, 1))
+
+
+def _parse_name(name: str, detach_pending: bool = False) -> Partition | None:
+    try:
+        lower = datetime.strptime(name.removeprefix(f"{PARENT}_"), "%Y_%m")
+    except ValueError:
+        return None  # секция, созданная вручную, - не трогаем
+    return Partition(name, lower, add_months(lower, 1), detach_pending)
+
+
+def is_partition(name: str) -> bool:
+    """Таблица - секция payments, которую создает PaymentPartitions."""
+    return name == DEFAULT or _parse_name(name) is not None
+
+
+class PaymentPartitions:
+    """
+    Обслуживание месячных секций payments без долгих блокировок.
+
+    Новая секция создается отдельной таблицей и присоединяется через
+    ATTACH PARTITION: он берет на payments только SHARE UPDATE EXCLUSIVE
+    (вставки и чтения идут), а CHECK с границами секции избавляет от
+    проверочного прохода. Старые секции отсоединяются через
+    DETACH PARTITION ... CONCURRENTLY и переносятся в архивную схему
+    или удаляются. payment_transactions при этом не чистится: повтор
+    старого вебхука по-прежнему получит DUPLICATE.
+
+    Платеж, для месяца которого секции нет, попадает в секцию по
+    умолчанию (DEFAULT). ensure() создает секции и для таких месяцев:
+    перед ATTACH их платежи переносятся из DEFAULT в новую секцию под
+    ACCESS EXCLUSIVE на DEFAULT (ее ATTACH все равно проверяет целиком,
+    поэтому она должна оставаться почти пустой).
+    """
+
+    def __init__(self, engine: AsyncEngine, lock_timeout_ms: int):
+        self.engine = engine
+        self.lock_timeout_ms = lock_timeout_ms
+
+    async def list_partitions(self) -> list[Partition]:
+        async with self.engine.connect() as conn:
+            return await self._partitions(conn)
+
+    async def ensure(self, ahead: int, since: datetime | None = None) -> list[str]:
+        """
+        Создает недостающие секции от месяца since (по умолчанию -
+        текущего) до ahead месяцев вперед и для платежей, попавших в
+        секцию по умолчанию; возвращает имена созданных.
+        """
+        created = []
+        for partition in await self.missing(ahead, since):
+            if await self._create(partition):
+                created.append(partition.name)
+        return created
+
+    async def missing(
+        self, ahead: int, since: datetime | None = None
+    ) -> list[Partition]:
+        """Секции, которых не хватает ensure(), по возрастанию."""
+        async with self.engine.connect() as conn:
+            now = await conn.scalar(text("SELECT localtimestamp"))
+            stray = await conn.scalars(
+                text(f"SELECT DISTINCT date_trunc('month', created_at) FROM {DEFAULT}")
+            )
+            wanted = {month_partition(month) for month in stray}
+            existing = {p.name for p in await self._partitions(conn)}
+        month = month_partition(since or now).lower
+        last = add_months(month_partition(now).lower, ahead)
+        while month <= last:
+            partition = month_partition(month)
+            wanted.add(partition)
+            month = partition.upper
+        return sorted(p for p in wanted if p.name not in existing)
+
+    async def _create(self, partition: Partition) -> bool:
+        name, lower, upper = partition.name, partition.lower, partition.upper
+        async with self.engine.begin() as conn:
+            locked = await conn.scalar(
+                text("SELECT pg_try_advisory_xact_lock(:key)"),
+                {"key": PARTITIONS_LOCK_KEY},
+            )
+            if not locked:
+                return False  # секции сейчас создает другой воркер
+            if any(p.name == name for p in await self._partitions(conn)):
+                return False
+            await self._set_lock_timeout(conn, local=True)
+            lower, upper = f"'{lower:%Y-%m-%d}'", f"'{upper:%Y-%m-%d}'"
+            await conn.exec_driver_sql(
+                f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS)"
+            )
+            await conn.exec_driver_sql(
+                f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds"
+                f" CHECK (created_at >= {lower} AND created_at < {upper})"
+            )
+            # Блокировку DEFAULT ATTACH взял бы все равно; взятая заранее,
+            # она не дает новым платежам месяца попасть туда после переноса
+            await conn.exec_driver_sql(f"LOCK TABLE {DEFAULT} IN ACCESS EXCLUSIVE MODE")
+            await conn.exec_driver_sql(
+                f"WITH moved AS (DELETE FROM {DEFAULT}"
+                f" WHERE created_at >= {lower} AND created_at < {upper}"
+                f" RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+            )
+            await conn.exec_driver_sql(
+                f"ALTER TABLE {PARENT} ATTACH PARTITION {name}"
+                f" FOR VALUES FROM ({lower}) TO ({upper})"
+            )
+            await conn.exec_driver_sql(
+                f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"
+            )
+        logger.info("Created partition %s", name)
+        return True
+
+    async def detach(
+        self,
+        name: str,
+        archive_schema: str | None = None,
+        force: bool = False,
+    ) -> None:
+        """
+        Отсоединяет секцию и переносит ее в archive_schema (None - удаляет).
+
+        Без force секция отсоединяется, только если снимки балансов
+        (balance_snapshots) всех ее счетов сделаны не раньше ее верхней
+        границы: иначе баланс в режиме журнала и баланс на момент времени
+        считались бы без этих платежей.
+        """
+        async with self.engine.connect() as conn:
+            partition = next(
+                (p for p in await self._partitions(conn) if p.name == name), None
+            )
+            if partition is None:
+                raise PartitionError(f"{name} is not a partition of {PARENT}")
+            now = await conn.scalar(text("SELECT localtimestamp"))
+            if partition.upper > month_partition(now).lower:
+                raise PartitionError(f"{name} is the current or a future partition")
+            if not force and not partition.detach_pending:
+                uncovered = await conn.scalar(
+                    text(f"""
+                        SELECT p.account_id FROM {name} p
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM balance_snapshots s
+                            WHERE s.account_id = p.account_id
+                              AND s.as_of >= :upper)
+                        LIMIT 1
+                        """),
+                    {"upper": partition.upper},
+                )
+                if uncovered is not None:
+                    raise PartitionError(
+                        f"{name}: account {uncovered} has no balance snapshot"
+                        f" as of {partition.upper:%Y-%m-%d} or later"
+                    )
+            await conn.commit()
+
+            # DETACH ... CONCURRENTLY нельзя выполнять внутри транзакции.
+            # Прерванное отсоединение остается в состоянии pending, его
+            # завершает FINALIZE
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await self._set_lock_timeout(conn)
+            try:
+                mode = "FINALIZE" if partition.detach_pending else "CONCURRENTLY"
+                await conn.exec_driver_sql(
+                    f"ALTER TABLE {PARENT} DETACH PARTITION {name} {mode}"
+                )
+                if archive_schema is None:
+                    await conn.exec_driver_sql(f"DROP TABLE {name}")
+                else:
+                    await conn.exec_driver_sql(
+                        f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"'
+                    )
+                    await conn.exec_driver_sql(
+                        f'ALTER TABLE {name} SET SCHEMA "{archive_schema}"'
+                    )
+            finally:
+                await conn.exec_driver_sql("RESET lock_timeout")
+        logger.info("Detached partition %s", name)
+
+    async def expired(self, keep_months: int) -> list[Partition]:
+        """Секции целиком старше keep_months месяцев до текущего."""
+        async with self.engine.connect() as conn:
+            now = await conn.scalar(text("SELECT localtimestamp"))
+            partitions = await self._partitions(conn)
+        cutoff = add_months(month_partition(now).lower, -keep_months)
+        return [p for p in partitions if p.upper <= cutoff]
+
+    @staticmethod
+    async def _partitions(conn: AsyncConnection) -> list[Partition]:
+        rows = await conn.execute(
+            text("""
+                SELECT c.relname, i.inhdetachpending
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = CAST(:parent AS regclass)
+                ORDER BY c.relname
+                """),
+            {"parent": PARENT},
+        )
+        partitions = [_parse_name(name, pending) for name, pending in rows]
+        return [p for p in partitions if p is not None]
+
+    async def _set_lock_timeout(
+        self, conn: AsyncConnection, local: bool = False
+    ) -> None:
+        # Не ждем блокировку бесконечно: ожидающий ALTER TABLE задерживал
+        # бы все последующие запросы к таблице
+        scope = "LOCAL " if local else ""
+        await conn.exec_driver_sql(
+            f"SET {scope}lock_timeout = {int(self.lock_timeout_ms)}"
+        )
+
+
+async def ensure_partitions_periodically(
+    partitions: PaymentPartitions, interval: float, ahead: int
+) -> None:
+    """
+    Фоновая задача воркера: держит секции на ahead месяцев вперед.
+
+    Секции, которых после прохода все еще нет (БД недоступна, не
+    дождались блокировки), попадают в метрику payments_partitions_missing
+    и в лог.
+    """
+    while True:
+        try:
+            created = await partitions.ensure(ahead)
+            if created:
+                logger.info("Created payment partitions: %s", ", ".join(created))
+            missing = await partitions.missing(ahead)
+            payments_partitions_missing.set(value=len(missing))
+            if missing:
+                logger.warning(
+                    "Payment partitions are missing: %s",
+                    ", ".join(p.name for p in missing),
+                )
+        except Exception as e:
+            logger.warning("Failed to create payment partitions: %s", e)
+        await asyncio.sleep(interval)
@@ -1,69 +1,721 @@
+import functools
 import hashlib
+import hmac
+import zlib
+from datetime import datetime
 from decimal import Decimal
+from enum import Enum
+from typing import Sequence
+
 from sqlalchemy import select  # <--- ДОБАВЛЕНО
+from sqlalchemy import (
+    BigInteger,
+    Integer,
+    Row,
+    String,
+    TextualSelect,
+    and_,
+    bindparam,
+    case,
+    column,
+    extract,
+    func,
+    null,
+    or_,
+    tuple_,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # from sqlalchemy.orm import selectinload <--- УДАЛЕНО
 
+from src.api.schemas import (
+    TRANSACTION_ID_MAX_LENGTH,
+    WebhookEvent,
+    WebhookEventIn,
+    check_money,
+)
 from src.core.config import settings
-from src.models.tables import Account, Payment, User
+from src.core.database import compiled_text
+from src.core.routing import read_router
+from src.core.warmup import hot_statements
+from src.models.tables import (
+    Account,
+    AccountStripe,
+    Money,
+    Payment,
+    PaymentTransaction,
+    User,
+)
+from src.services.balances import (
+    BALANCE_CHANNEL,
+    NOTIFY_PAYLOAD_LIMIT,
+    BalanceChange,
+    balance_cache,
+    encode_changes,
+)
+from src.services.dedup import (
+    TRANSACTION_CHANNEL,
+    RecentPayment,
+    already_committed,
+    encode_payments,
+    recent_transactions,
+)
 from src.services.repository import SQLAlchemyRepository
 
 
+class WebhookStatus(str, Enum):
+    """Результат обработки одного события вебхука."""
+
+    ACCEPTED = "accepted"
+    DUPLICATE = "duplicate"
+    INVALID_SIGNATURE = "invalid_signature"
+    REJECTED = "rejected"
+
+
+class InvalidSignature(ValueError):
+    """Подпись события отсутствует или не совпадает."""
+
+
+class MalformedEvent(ValueError):
+    """Событие не соответствует схеме WebhookEvent."""
+
+
+# Обычный состав события: подписываемые поля уже в порядке сортировки
+SIGNED_FIELDS = ("account_id", "amount", "transaction_id", "user_id")
+_EVENT_KEYS = frozenset(SIGNED_FIELDS) | {"signature"}
+
+
+def sign_payload(payload: dict) -> str:
+    """
+    Подпись события: sha256 от значений всех полей, кроме signature,
+    в порядке сортировки ключей, плюс SECRET_KEY.
+    """
+    if payload.keys() == _EVENT_KEYS:
+        values = [str(payload[key]) for key in SIGNED_FIELDS]
+    else:
+        values = [str(payload[key]) for key in sorted(payload) if key != "signature"]
+    message = "".join(values) + settings.SECRET_KEY
+    return hashlib.sha256(message.encode()).hexdigest()
+
+
+_webhook_event = TypeAdapter(WebhookEventIn)
+
+
+def parse_webhook(payload: object) -> WebhookEvent:
+    """
+    Проверяет подпись и типы уже разобранного JSON события.
+
+    Подпись сравнивается за постоянное время; поля приводятся к типам
+    один раз, дальше событие передается только в виде WebhookEvent.
+    """
+    if not isinstance(payload, dict):
+        raise MalformedEvent("Webhook event must be a JSON object")
+    signature = payload.get("signature")
+    try:
+        valid = hmac.compare_digest(signature, sign_payload(payload))
+    except TypeError:  # подписи нет, она не строка или не ASCII
+        valid = False
+    if not valid:
+        raise InvalidSignature("Invalid signature")
+
+    tid = payload.get("transaction_id")
+    user_id = payload.get("user_id")
+    account_id = payload.get("account_id")
+    amount = payload.get("amount")
+    try:
+        # Обычное событие: id - числа JSON, сумма - число. Такие поля
+        # проверяются напрямую, без общего валидатора схемы
+        if (
+            type(tid) is str
+            and 0 < len(tid) <= TRANSACTION_ID_MAX_LENGTH
+            and type(user_id) is int
+            and type(account_id) is int
+            and (type(amount) is float or type(amount) is int)
+        ):
+            amount = check_money(Decimal(repr(amount)))
+            return WebhookEvent(tid, user_id, account_id, amount)
+        return WebhookEvent(**_webhook_event.validate_python(payload))
+    except ValueError as e:  # в т.ч. ValidationError
+        raise MalformedEvent(f"Malformed webhook event: {e}") from e
+
+
+def normalize_event(event: WebhookEvent) -> dict:
+    """Событие в виде JSON-совместимого dict (журнал ingest, apply_batch)."""
+    return {
+        "transaction_id": event.transaction_id,
+        "user_id": event.user_id,
+        "account_id": event.account_id,
+        "amount": str(event.amount),
+    }
+
+
 class PaymentService:
     def __init__(self, session: AsyncSession):
         self.session = session
         self.payment_repo = SQLAlchemyRepository(model=Payment, session=session)
         self.account_repo = SQLAlchemyRepository(model=Account, session=session)
 
-    def verify_signature(self, data: dict) -> bool:
-        """Проверяет подпись вебхука."""
-        signature = data.pop("signature")
-        sorted_keys = sorted(data.keys())
-        message = "".join(str(data[key]) for key in sorted_keys)
-        message += settings.SECRET_KEY
-        expected_signature = hashlib.sha256(message.encode()).hexdigest()
-        return signature == expected_signature
-
-    async def process_webhook(self, data: dict) -> None:
-        """Обрабатывает входящий платеж."""
-        # 1. Проверяем, была ли уже такая транзакция
-        existing_payment = await self.payment_repo.get_one_or_none(
-            transaction_id=data["transaction_id"]
-        )
-        if existing_payment:
-            return
-
-        # 2. Находим пользователя и его счет
-        # Используем JOIN, чтобы убедиться, что счет принадлежит пользователю
+    async def process_webhook(self, event: WebhookEvent) -> WebhookStatus:
+        """
+        Обрабатывает входящий платеж.
+
+        Зачисление делается одним запросом (см. _build_credit_stmt), без чтения
+        баланса в Python: параллельные вебхуки на один счет не теряют
+        обновлений, а гонка повторов одной транзакции дает DUPLICATE, а не 500.
+        """
+        account_id = event.account_id
+        user_id = event.user_id
+        stmt, params = self._credit_stmt(), self._credit_params(event)
+
+        row = (await self.session.execute(stmt, params)).one_or_none()
+        created: list[BalanceChange] = []
+        if row is None:
+            # Счета у пользователя нет - создаем его.
+            # ВАЖНО: Как мы обсуждали, эта логика может быть спорной.
+            # Оставляем ее, т.к. она соответствует ТЗ.
+            owners, created = await self._ensure_accounts({account_id: user_id})
+            if owners.get(account_id) != user_id:
+                await self.session.rollback()
+                return WebhookStatus.REJECTED
+            row = (await self.session.execute(stmt, params)).one()
+
+        # Транзакция в любом случае есть в payments: либо зачислена сейчас
+        # (NOTIFY уже отправлен самим запросом), либо раньше
+        payment = RecentPayment(event.transaction_id, user_id, account_id)
+        if row.deferred:
+            # Зачислено в полосу счета или в журнал: новый полный баланс
+            # запросом не читается
+            credited = BalanceChange(user_id, account_id, None, 0)
+        elif row.balance is None:
+            # balance равен NULL, если транзакция уже была зачислена ранее
+            await self._commit_balances(created)
+            recent_transactions.add([payment])
+            return WebhookStatus.DUPLICATE
+        else:
+            credited = BalanceChange(user_id, account_id, row.balance, row.version)
+        await self._commit_balances(created, notified=(credited,))
+        recent_transactions.add([payment])
+        return WebhookStatus.ACCEPTED
+
+    async def process_webhooks_batch(self, payloads: list[dict]) -> list[dict]:
+        """
+        Обрабатывает пачку вебхуков в одной транзакции.
+
+        Подпись проверяется для каждого события отдельно, а запись в БД
+        делается фиксированным числом запросов независимо от размера пачки.
+        Возвращает статус для каждого события в порядке поступления.
+        """
+        statuses: list[WebhookStatus] = []
+        tids: list[str | None] = []
+        events: dict[str, dict] = {}
+
+        # 1. Проверяем каждое событие и отбрасываем повторы внутри пачки
+        for payload in payloads:
+            try:
+                event = parse_webhook(payload)
+            except InvalidSignature:
+                statuses.append(WebhookStatus.INVALID_SIGNATURE)
+                tids.append(None)
+                continue
+            except MalformedEvent:
+                statuses.append(WebhookStatus.REJECTED)
+                tids.append(None)
+                continue
+            tids.append(event.transaction_id)
+            if event.transaction_id in events or already_committed(event):
+                statuses.append(WebhookStatus.DUPLICATE)
+            else:
+                events[event.transaction_id] = normalize_event(event)
+                statuses.append(WebhookStatus.ACCEPTED)
+
+        if events:
+            applied = await self.apply_batch(list(events.values()))
+            for i, tid in enumerate(tids):
+                if statuses[i] is WebhookStatus.ACCEPTED:
+                    statuses[i] = applied.get(tid, WebhookStatus.DUPLICATE)
+
+        return [
+            {
+                "transaction_id": (
+                    payload.get("transaction_id") if isinstance(payload, dict) else None
+                ),
+                "status": status.value,
+            }
+            for payload, status in zip(payloads, statuses)
+        ]
+
+    async def apply_batch(self, events: list[dict]) -> dict[str, WebhookStatus]:
+        """
+        Зачисляет уже проверенные события одной транзакцией.
+
+        Возвращает статусы зачисленных и отклоненных событий; события,
+        которых нет в результате, оказались дубликатами.
+        """
+        result: dict[str, WebhookStatus] = {}
+        changes: list[BalanceChange] = []
+        payments: list[RecentPayment] = []
+        owners, created = await self._ensure_accounts(
+            {int(e["account_id"]): int(e["user_id"]) for e in events}
+        )
+
+        rows = []
+        for e in events:
+            tid = str(e["transaction_id"])
+            if owners.get(int(e["account_id"])) != int(e["user_id"]):
+                # Счет принадлежит другому пользователю (или пользователя нет)
+                result[tid] = WebhookStatus.REJECTED
+                continue
+            # После коммита транзакция будет в payments - новая или повтор
+            payments.append(RecentPayment(tid, int(e["user_id"]), int(e["account_id"])))
+            rows.append(
+                {
+                    "transaction_id": tid,
+                    "amount": Decimal(str(e["amount"])),
+                    "account_id": int(e["account_id"]),
+                }
+            )
+
+        if rows:
+            # 2. Один INSERT на всю пачку; уже известные транзакции пропускаются
+            inserted = (
+                await self.session.execute(self._insert_payments_stmt(rows))
+            ).all()
+
+            # 3. Одно UPDATE со сгруппированными суммами по счетам
+            deltas: dict[int, Decimal] = {}
+            for tid, account_id, amount in inserted:
+                deltas[account_id] = deltas.get(account_id, Decimal("0")) + amount
+                result[tid] = WebhookStatus.ACCEPTED
+            if deltas and settings.LEDGER_MODE:
+                # Режим журнала: строки счетов не меняются, баланс
+                # пересчитается при следующем чтении
+                changes = [
+                    BalanceChange(owners[account_id], account_id, None, 0)
+                    for account_id in deltas
+                ]
+            elif deltas:
+                credited = await self.session.execute(
+                    self._credit_accounts_stmt(deltas)
+                )
+                # Полный баланс полосатого счета мог измениться параллельно
+                # (зачисления в полосы не блокируют строку) - сбрасываем кэш
+                changes = [
+                    (
+                        BalanceChange(user_id, account_id, None, 0)
+                        if stripes > 1
+                        else BalanceChange(user_id, account_id, balance, version)
+                    )
+                    for user_id, account_id, balance, version, stripes in credited
+                ]
+
+        await self._commit_balances(created + changes, payments=payments)
+        return result
+
+    async def _ensure_accounts(
+        self, pairs: dict[int, int]
+    ) -> tuple[dict[int, int], list[BalanceChange]]:
+        """
+        Создает недостающие счета; возвращает владельцев и созданные счета.
+
+        Строки счетов блокируются в порядке id, чтобы параллельные пачки
+        не взаимоблокировались на последующем UPDATE.
+        """
+        requested = values(
+            column("account_id", Integer),
+            column("user_id", Integer),
+            name="requested",
+        ).data(list(pairs.items()))
+        create_stmt = (
+            pg_insert(Account)
+            .from_select(
+                ["id", "user_id"],
+                select(requested.c.account_id, requested.c.user_id).join(
+                    User, User.id == requested.c.user_id
+                ),
+            )
+            .on_conflict_do_nothing(index_elements=[Account.id])
+            .returning(Account.user_id, Account.id, Account.balance, Account.version)
+        )
+        created = await self.session.execute(create_stmt)
+        created = [BalanceChange(*row) for row in created]
+
+        owners_stmt = (
+            select(Account.id, Account.user_id)
+            .where(Account.id.in_(list(pairs)))
+            .order_by(Account.id)
+        )
+        if not settings.LEDGER_MODE:
+            # В режиме журнала UPDATE accounts нет - блокировать нечего
+            owners_stmt = owners_stmt.with_for_update()
+        owners = {
+            account_id: user_id
+            for account_id, user_id in await self.session.execute(owners_stmt)
+        }
+        return owners, created
+
+    async def _commit_balances(
+        self,
+        changes: list[BalanceChange],
+        notified: tuple[BalanceChange, ...] = (),
+        payments: Sequence[RecentPayment] = (),
+    ) -> None:
+        """
+        Коммитит транзакцию и обновляет кэш балансов и фильтр повторов.
+
+        Для changes и payments в той же транзакции отправляется NOTIFY
+        (доставляется другим воркерам только после коммита); notified -
+        изменения, о которых запрос уже уведомил сам. Свои кэши
+        обновляются сразу после коммита.
+        """
+        if changes and settings.BALANCE_CACHE_NOTIFY:
+            for payload in encode_changes(changes):
+                await self.session.execute(
+                    select(func.pg_notify(BALANCE_CHANNEL, payload))
+                )
+        if payments and settings.DEDUP_NOTIFY:
+            for payload in encode_payments(payments):
+                await self.session.execute(
+                    select(func.pg_notify(TRANSACTION_CHANNEL, payload))
+                )
+        await self.session.commit()
+        balance_cache.apply([*changes, *notified])
+        recent_transactions.add(payments)
+        read_router.mark_written(
+            change.user_id for change in (*changes, *notified, *payments)
+        )
+
+    async def get_user_payments(
+        self,
+        user_id: int,
+        limit: int,
+        before: tuple[datetime, int] | None = None,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+        account_id: int | None = None,
+    ) -> list[Row]:
+        """
+        История платежей пользователя, от новых к старым, одним запросом.
+
+        Keyset-пагинация: before - (created_at, id) последнего платежа
+        предыдущей страницы. Запрос идет по индексу
+        ix_payments_account_id_created_at_id, поэтому стоимость страницы
+        не зависит от общего числа платежей пользователя.
+        """
         query = (
-            select(Account)
-            .join(User)
-            .where(User.id == data["user_id"], Account.id == data["account_id"])
+            select(
+                Payment.id,
+                Payment.transaction_id,
+                Payment.amount,
+                Payment.account_id,
+                Payment.created_at,
+            )
+            .join(Account, Account.id == Payment.account_id)
+            .where(Account.user_id == user_id)
+            .order_by(Payment.created_at.desc(), Payment.id.desc())
+            .limit(limit)
         )
+        if account_id is not None:
+            query = query.where(Payment.account_id == account_id)
+        if date_from is not None:
+            query = query.where(Payment.created_at >= date_from)
+        if date_to is not None:
+            query = query.where(Payment.created_at < date_to)
+        if before is not None:
+            # Отдельное условие на created_at - для отсечения секций:
+            # по сравнению кортежей планировщик секции не отбрасывает
+            query = query.where(
+                tuple_(Payment.created_at, Payment.id) < before,
+                Payment.created_at <= before[0],
+            )
         result = await self.session.execute(query)
-        account = result.scalar_one_or_none()
+        return list(result.all())
+
+    @staticmethod
+    def _credit_stmt() -> TextualSelect:
+        """
+        Запрос зачисления для текущих настроек (см. _build_credit_stmt).
+
+        Значения передаются параметрами (см. _credit_params): SQL один на
+        набор настроек и компилируется один раз.
+        """
+        return _credit_sql(
+            settings.LEDGER_MODE, settings.BALANCE_CACHE_NOTIFY, settings.DEDUP_NOTIFY
+        )
+
+    @staticmethod
+    def _credit_params(event: WebhookEvent) -> dict:
+        return {
+            "transaction_id": event.transaction_id,
+            "amount": event.amount,
+            "account_id": event.account_id,
+            "user_id": event.user_id,
+            "stripe_key": zlib.crc32(event.transaction_id.encode()),
+        }
 
-        # 3. Если счета нет - создаем его
-        # ВАЖНО: Как мы обсуждали, эта логика может быть спорной.
-        # Оставляем ее, т.к. она соответствует ТЗ.
-        if not account:
-            # Создаем счет для пользователя, но без коммита.
-            # Коммит будет один общий в конце.
-            account = await self.account_repo.create(
-                user_id=data["user_id"],
-                id=data["account_id"],  # Попробуем создать с нужным ID
-                balance=Decimal("0.00"),
+    @staticmethod
+    def _build_credit_stmt(ledger: bool, balance_notify: bool, dedup_notify: bool):
+        """
+        Атомарное зачисление одного платежа одним запросом:
+
+            WITH acc AS (SELECT id, stripes FROM accounts
+                         WHERE id = :account_id AND user_id = :user_id),
+                 tx AS (INSERT INTO payment_transactions ... SELECT ... FROM acc
+                        ON CONFLICT (transaction_id) DO NOTHING RETURNING ...),
+                 ins AS (INSERT INTO payments ... SELECT ... FROM tx
+                         RETURNING account_id, amount),
+                 upd AS (UPDATE accounts SET balance = balance + ins.amount,
+                         version = version + 1 FROM ins, acc
+                         WHERE ... AND acc.stripes <= 1
+                         RETURNING id, balance, version),
+                 stripe AS (INSERT INTO account_stripes ...
+                            SELECT ..., mod(:stripe_key, acc.stripes), ins.amount
+                            FROM ins, acc WHERE acc.stripes > 1
+                            ON CONFLICT (account_id, stripe)
+                            DO UPDATE SET balance = balance + excluded.balance)
+            SELECT acc.id, upd.balance, upd.version, stripe.account_id AS deferred
+            FROM acc LEFT JOIN upd ... LEFT JOIN stripe ...
+
+        Нет строки - счета нет; deferred - платеж зачислен в полосу;
+        balance IS NULL - дубликат; иначе - платеж зачислен, balance
+        содержит новый баланс. Строка счета блокируется только на время
+        UPDATE и COMMIT, а у счета с полосами - не блокируется вовсе:
+        параллельные зачисления расходятся по stripes строкам account_stripes
+        по crc32 от transaction_id (stripe_key).
+        В режиме журнала (ledger) остаются только acc и ins: зачисление -
+        один INSERT в payments, deferred = ins.account_id.
+        С balance_notify тот же запрос вызывает pg_notify() с новым
+        балансом, а с dedup_notify - с transaction_id, без лишнего
+        обращения к БД.
+        """
+        transaction_id = bindparam("transaction_id", type_=String)
+        user_id = bindparam("user_id", type_=Integer)
+        acc = (
+            select(Account.id, Account.stripes)
+            .where(
+                Account.id == bindparam("account_id", type_=Integer),
+                Account.user_id == user_id,
+            )
+            .cte("acc")
+        )
+        # Уникальность transaction_id - в payment_transactions: у
+        # секционированной payments уникальны только ключи с created_at
+        tx = (
+            pg_insert(PaymentTransaction)
+            .from_select(
+                ["transaction_id", "account_id"], select(transaction_id, acc.c.id)
+            )
+            .on_conflict_do_nothing(index_elements=[PaymentTransaction.transaction_id])
+            .returning(PaymentTransaction.transaction_id, PaymentTransaction.account_id)
+            .cte("tx")
+        )
+        ins = (
+            pg_insert(Payment)
+            .from_select(
+                ["transaction_id", "amount", "account_id"],
+                select(
+                    tx.c.transaction_id,
+                    bindparam("amount", type_=Money),
+                    tx.c.account_id,
+                ),
             )
+            .returning(Payment.account_id, Payment.amount)
+            .cte("ins")
+        )
+        notify = (balance_notify, dedup_notify, transaction_id, user_id)
+        if ledger:
+            query = select(acc.c.id, null().label("balance"), null().label("version"))
+            return PaymentService._with_notify(
+                query.outerjoin(ins, ins.c.account_id == acc.c.id),
+                acc,
+                None,
+                ins.c.account_id,
+                *notify,
+            )
+        upd = (
+            update(Account)
+            .where(
+                Account.id == ins.c.account_id,
+                acc.c.id == ins.c.account_id,
+                acc.c.stripes <= 1,
+            )
+            .values(
+                folded_balance=Account.folded_balance + ins.c.amount,
+                version=Account.version + 1,
+            )
+            .returning(Account.id, Account.balance.label("balance"), Account.version)
+            .cte("upd")
+        )
+        stripe_insert = pg_insert(AccountStripe).from_select(
+            ["account_id", "stripe", "balance"],
+            select(
+                ins.c.account_id,
+                func.mod(bindparam("stripe_key", type_=BigInteger), acc.c.stripes),
+                ins.c.amount,
+            ).where(acc.c.id == ins.c.account_id, acc.c.stripes > 1),
+        )
+        stripe = (
+            stripe_insert.on_conflict_do_update(
+                index_elements=[AccountStripe.account_id, AccountStripe.stripe],
+                set_={
+                    "balance": AccountStripe.balance + stripe_insert.excluded.balance
+                },
+            )
+            .returning(AccountStripe.account_id)
+            .cte("stripe")
+        )
+        query = (
+            select(acc.c.id, upd.c.balance, upd.c.version)
+            .outerjoin(upd, upd.c.id == acc.c.id)
+            .outerjoin(stripe, stripe.c.account_id == acc.c.id)
+        )
+        return PaymentService._with_notify(
+            query, acc, upd, stripe.c.account_id, *notify
+        )
 
-        # 4. Начисляем средства и сохраняем платеж в ОДНОЙ транзакции
-        account.balance += Decimal(data["amount"])
-        self.session.add(account)
+    @staticmethod
+    def _with_notify(
+        query,
+        acc,
+        upd,
+        deferred,
+        balance_notify: bool,
+        dedup_notify: bool,
+        transaction_id,
+        user_id,
+    ):
+        """
+        Дополняет SELECT _build_credit_stmt колонкой deferred и вызовами
+        pg_notify() (если они включены). upd - CTE с новым балансом, None в
+        режиме журнала; transaction_id и user_id - bindparam() запроса.
+        """
+        columns = [deferred.label("deferred")]
+        credited = deferred.is_not(None)
+        if upd is not None:
+            credited = or_(upd.c.balance.is_not(None), credited)
+        if balance_notify:
+            # Для полосы и журнала - пустой баланс: другие воркеры сбросят запись
+            invalidate = func.pg_notify(
+                BALANCE_CHANNEL,
+                func.format(
+                    "%s|%s:%s::",
+                    extract("epoch", func.clock_timestamp()),
+                    user_id,
+                    acc.c.id,
+                ),
+            )
+            whens = [(deferred.is_not(None), invalidate)]
+            if upd is not None:
+                payload = func.format(
+                    "%s|%s:%s:%s:%s",
+                    extract("epoch", func.clock_timestamp()),
+                    user_id,
+                    acc.c.id,
+                    upd.c.balance,
+                    upd.c.version,
+                )
+                notify = func.pg_notify(BALANCE_CHANNEL, payload)
+                whens.insert(0, (upd.c.balance.is_not(None), notify))
+            columns.append(case(*whens).label("notify"))
+        if dedup_notify:
+            payload = func.format("%s:%s:%s", user_id, acc.c.id, transaction_id)
+            notify = func.pg_notify(TRANSACTION_CHANNEL, payload)
+            # transaction_id с переводом строки не разобрать на приеме -
+            # такой повтор просто дойдет до БД. Слишком длинный payload
+            # pg_notify() отверг бы ошибкой и откатил бы само зачисление
+            sendable = and_(
+                func.strpos(transaction_id, "\n") == 0,
+                func.octet_length(payload) <= NOTIFY_PAYLOAD_LIMIT,
+            )
+            columns.append(
+                case((and_(credited, sendable), notify)).label("notify_payment")
+            )
+        return query.add_columns(*columns)
 
-        await self.payment_repo.create(
-            transaction_id=data["transaction_id"],
-            amount=Decimal(data["amount"]),
-            account_id=account.id,
+    @staticmethod
+    def _insert_payments_stmt(rows: list[dict]):
+        """
+        WITH batch AS (VALUES ...),
+             new AS (INSERT INTO payment_transactions SELECT ... FROM batch
+                     ON CONFLICT (transaction_id) DO NOTHING RETURNING ...)
+        INSERT INTO payments SELECT ... FROM batch JOIN new ...
+        RETURNING transaction_id, account_id, amount
+        """
+        data = values(
+            column("transaction_id", String),
+            column("amount", Money),
+            column("account_id", Integer),
+            name="data",
+        ).data([(r["transaction_id"], r["amount"], r["account_id"]) for r in rows])
+        batch = select(data).cte("batch")
+        new = (
+            pg_insert(PaymentTransaction)
+            .from_select(
+                ["transaction_id", "account_id"],
+                select(batch.c.transaction_id, batch.c.account_id),
+            )
+            .on_conflict_do_nothing(index_elements=[PaymentTransaction.transaction_id])
+            .returning(PaymentTransaction.transaction_id)
+            .cte("new")
+        )
+        return (
+            pg_insert(Payment)
+            .from_select(
+                ["transaction_id", "amount", "account_id"],
+                select(batch.c.transaction_id, batch.c.amount, batch.c.account_id).join(
+                    new, new.c.transaction_id == batch.c.transaction_id
+                ),
+            )
+            .returning(Payment.transaction_id, Payment.account_id, Payment.amount)
         )
 
-        await self.session.commit()
+    @staticmethod
+    def _credit_accounts_stmt(deltas: dict[int, Decimal]):
+        """
+        UPDATE accounts SET balance = balance + delta, version = version + 1
+        FROM (VALUES ...) RETURNING user_id, id, balance, version, stripes.
+
+        Пачка зачисляет сумму по счету одним UPDATE и для счетов с полосами:
+        строка блокируется один раз на пачку, а не на каждое событие.
+        """
+        credited = values(
+            column("account_id", Integer),
+            column("delta", Money),
+            name="credited",
+        ).data(list(deltas.items()))
+        return (
+            update(Account)
+            .where(Account.id == credited.c.account_id)
+            .values(
+                folded_balance=Account.folded_balance + credited.c.delta,
+                version=Account.version + 1,
+            )
+            .returning(
+                Account.user_id,
+                Account.id,
+                Account.balance,
+                Account.version,
+                Account.stripes,
+            )
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def _credit_sql(ledger: bool, balance_notify: bool, dedup_notify: bool):
+    # pg insert ... ON CONFLICT SQLAlchemy не кэширует: без text() запрос
+    # компилировался бы заново (миллисекунды) на каждый вебхук
+    return compiled_text(
+        PaymentService._build_credit_stmt(ledger, balance_notify, dedup_notify)
+    )
+
+
+# Зачисление вебхука - готовится при прогреве пула
+# (счета 0 нет, так что пробное выполнение ничего не вставляет)
+hot_statements.register(
+    "credit_payment",
+    PaymentService._credit_stmt,
+    PaymentService._credit_params(WebhookEvent("", 0, 0, Decimal(0))),
+)
@@ -0,0 +1,43 @@
+from typing import NamedTuple
+
+from src.core.cache import TTLCache
+from src.core.config import settings
+from src.core.notify import NotifyListener
+from src.core.routing import read_router
+
+# Канал для межворкерной инвалидации; payload - id пользователя
+PRINCIPAL_CHANNEL = "principal_invalidate"
+
+
+class Principal(NamedTuple):
+    """Компактная неизменяемая запись аутентифицированного пользователя."""
+
+    id: int
+    email: str
+    full_name: str | None
+    is_admin: bool
+
+
+# Кэш принципалов текущего воркера, ключ - subject токена (email)
+principal_cache: TTLCache[str, Principal] = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """
+    Удаляет пользователя из кэша текущего воркера; его чтения ближайшие
+    READ_YOUR_WRITES_SECONDS идут в основную базу.
+    """
+    principal_cache.discard_where(lambda principal: principal.id == user_id)
+    read_router.mark_written((user_id,))
+
+
+def listen_principal_invalidations(listener: NotifyListener) -> None:
+    """Подписывает кэш на инвалидации, сделанные другими воркерами."""
+    listener.subscribe(
+        PRINCIPAL_CHANNEL,
+        lambda payload: invalidate_principal(int(payload)),
+        on_reset=principal_cache.clear,
+    )
@@ -0,0 +1,264 @@
+import asyncio
+from decimal import Decimal
+from typing import Callable, NamedTuple
+
+from sqlalchemy import and_, func, literal, select, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.orm import aliased
+
+from src.core.config import settings
+from src.models.tables import Account, BalanceSnapshot, Money, Payment
+from src.services.balances import BALANCE_CHANNEL, BalanceChange, encode_changes
+from src.services.ledger import SNAPSHOT_LOCK_KEY
+
+
+class Drift(NamedTuple):
+    """Счет, баланс которого не сходится с платежами."""
+
+    account_id: int
+    user_id: int
+    balance: Decimal
+    expected: Decimal
+
+    @property
+    def drift(self) -> Decimal:
+        return self.balance - self.expected
+
+
+class ReconcileStats(NamedTuple):
+    accounts: int
+    drifted: int
+    repaired: int
+    total_drift: Decimal
+
+
+class Reconciler:
+    """
+    Сверка балансов счетов с платежами.
+
+    Ожидаемый баланс - начальный баланс плюс сумма всех платежей счета.
+    Начальный баланс (деньги, пришедшие не платежами: счета до ведения
+    payments, загрузка счетов с балансом) - это самый ранний снимок
+    счета минус платежи до него; с from_payments он считается нулевым.
+    Ошибка в самом раннем снимке поэтому видна только с from_payments.
+    Сравнивается полный баланс Account.balance: в обычном режиме - строка
+    счета с полосами, в режиме журнала - последний снимок с хвостом.
+
+    Счета идут пачками по id (keyset); каждая пачка - один запрос
+    с группировкой платежей по счету, читаемый серверным курсором, и
+    concurrency пачек обрабатываются параллельно на своих соединениях
+    пула. В памяти - только очередь границ пачек.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        chunk_size: int,
+        concurrency: int,
+        from_payments: bool = False,
+    ):
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.from_payments = from_payments
+
+    async def run(
+        self, on_drift: Callable[[Drift], None], repair: bool = False
+    ) -> ReconcileStats:
+        """
+        Проверяет (или исправляет, repair) все счета; каждое расхождение
+        передается в on_drift сразу, как найдено.
+        """
+        chunks: asyncio.Queue[tuple[int, int, int] | None] = asyncio.Queue(
+            maxsize=self.concurrency * 2
+        )
+        totals = {"accounts": 0, "drifted": 0, "repaired": 0, "drift": Decimal(0)}
+
+        async def worker() -> None:
+            async with self.engine.connect() as conn:
+                while (chunk := await chunks.get()) is not None:
+                    after, upper, count = chunk
+                    drifts = await self._check_chunk(conn, after, upper, repair)
+                    for drift in drifts:
+                        on_drift(drift)
+                        totals["drift"] += drift.drift
+                    totals["accounts"] += count
+                    totals["drifted"] += len(drifts)
+                    if repair:
+                        totals["repaired"] += len(drifts)
+
+        async def producer() -> None:
+            async with self.engine.connect() as conn:
+                after = 0
+                while True:
+                    bounds = (await conn.execute(self._chunk_bounds_stmt(after))).one()
+                    if bounds.upper is None:
+                        break
+                    await chunks.put((after, bounds.upper, bounds.count))
+                    after = bounds.upper
+            for _ in range(self.concurrency):
+                await chunks.put(None)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(producer()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # Ошибка в одной задаче останавливает остальные
+            for task in tasks:
+                task.cancel()
+        return ReconcileStats(
+            totals["accounts"], totals["drifted"], totals["repaired"], totals["drift"]
+        )
+
+    def _chunk_bounds_stmt(self, after: int):
+        chunk = (
+            select(Account.id)
+            .where(Account.id > after)
+            .order_by(Account.id)
+            .limit(self.chunk_size)
+            .subquery()
+        )
+        return select(func.max(chunk.c.id).label("upper"), func.count().label("count"))
+
+    async def _check_chunk(
+        self, conn: AsyncConnection, after: int, upper: int, repair: bool
+    ) -> list[Drift]:
+        drifted = self._drift_query(after, upper)
+        if not repair:
+            result = await conn.stream(drifted)
+            drifts = [Drift(*row[:4]) async for row in result]
+            await conn.rollback()
+            return drifts
+
+        async with conn.begin():
+            if settings.LEDGER_MODE:
+                # Снимки пишет и фоновая задача - не пересекаемся с ней
+                await conn.execute(
+                    select(func.pg_advisory_xact_lock(SNAPSHOT_LOCK_KEY))
+                )
+                rows = (await conn.execute(drifted)).all()
+                for row in rows:
+                    # Без начального баланса пересчитываются все снимки
+                    first_as_of = None if self.from_payments else row.first_as_of
+                    await conn.execute(
+                        self._repair_snapshots_stmt(row.id, row.opening, first_as_of)
+                    )
+                drifts = [Drift(*row[:4]) for row in rows]
+            else:
+                drifts = [
+                    Drift(*row)
+                    for row in await conn.execute(self._repair_accounts_stmt(drifted))
+                ]
+            if drifts and settings.BALANCE_CACHE_NOTIFY:
+                changes = [
+                    BalanceChange(d.user_id, d.account_id, None, 0) for d in drifts
+                ]
+                for payload in encode_changes(changes):
+                    await conn.execute(select(func.pg_notify(BALANCE_CHANNEL, payload)))
+        return drifts
+
+    def _drift_query(self, after: int, upper: int):
+        """
+        WITH first AS (самый ранний снимок каждого счета пачки),
+             sums AS (SELECT account_id, sum(amount),
+                             sum(amount) FILTER (WHERE created_at < first.as_of)
+                      FROM payments LEFT JOIN first ...
+                      WHERE account_id > :after AND account_id <= :upper
+                      GROUP BY account_id)
+        SELECT id, user_id, balance, expected, opening, first.as_of
+        FROM accounts LEFT JOIN first ... LEFT JOIN sums ...
+        WHERE id > :after AND id <= :upper AND balance <> expected
+
+        Платежи пачки читаются одним проходом по индексу
+        ix_payments_account_id_created_at_id (INCLUDE amount) в каждой секции.
+        """
+        first = (
+            select(
+                BalanceSnapshot.account_id,
+                BalanceSnapshot.as_of,
+                BalanceSnapshot.balance,
+            )
+            .distinct(BalanceSnapshot.account_id)
+            .where(
+                BalanceSnapshot.account_id > after,
+                BalanceSnapshot.account_id <= upper,
+            )
+            .order_by(BalanceSnapshot.account_id, BalanceSnapshot.as_of)
+            .cte("first")
+        )
+        sums = (
+            select(
+                Payment.account_id,
+                func.sum(Payment.amount).label("total"),
+                func.sum(Payment.amount)
+                .filter(Payment.created_at < first.c.as_of)
+                .label("before_first"),
+            )
+            .outerjoin(first, first.c.account_id == Payment.account_id)
+            .where(Payment.account_id > after, Payment.account_id <= upper)
+            .group_by(Payment.account_id)
+            .cte("sums")
+        )
+        if self.from_payments:
+            opening = literal(Decimal(0), Money)
+        else:
+            opening = func.coalesce(
+                first.c.balance - func.coalesce(sums.c.before_first, 0), 0
+            )
+        # Своя копия accounts: запрос встраивается в UPDATE accounts
+        acc = aliased(Account, name="acc")
+        expected = opening + func.coalesce(sums.c.total, 0)
+        return (
+            select(
+                acc.id,
+                acc.user_id,
+                acc.balance.label("balance"),
+                expected.label("expected"),
+                opening.label("opening"),
+                first.c.as_of.label("first_as_of"),
+            )
+            .outerjoin(first, first.c.account_id == acc.id)
+            .outerjoin(sums, sums.c.account_id == acc.id)
+            .where(acc.id > after, acc.id <= upper, acc.balance != expected)
+            .order_by(acc.id)
+        )
+
+    @staticmethod
+    def _repair_accounts_stmt(drifted):
+        """
+        UPDATE accounts SET balance = balance + (expected - balance),
+        version = version + 1 FROM (расхождения пачки) ...
+
+        Исправление - разница, а не новое значение: зачисление, успевшее
+        изменить строку после чтения пачки, этой разницы не меняет.
+        """
+        d = drifted.subquery("d")
+        return (
+            update(Account)
+            .where(Account.id == d.c.id)
+            .values(
+                folded_balance=Account.folded_balance + d.c.expected - d.c.balance,
+                version=Account.version + 1,
+            )
+            .returning(Account.id, Account.user_id, d.c.balance, d.c.expected)
+        )
+
+    @staticmethod
+    def _repair_snapshots_stmt(account_id: int, opening: Decimal, first_as_of):
+        """
+        Режим журнала: пересчитывает снимки счета после самого раннего -
+        начальный баланс плюс платежи до момента снимка.
+        """
+        paid = (
+            select(func.coalesce(func.sum(Payment.amount), 0))
+            .where(
+                Payment.account_id == BalanceSnapshot.account_id,
+                Payment.created_at < BalanceSnapshot.as_of,
+            )
+            .scalar_subquery()
+        )
+        condition = BalanceSnapshot.account_id == account_id
+        if first_as_of is not None:
+            condition = and_(condition, BalanceSnapshot.as_of > first_as_of)
+        return update(BalanceSnapshot).where(condition).values(balance=opening + paid)
@@ -1,13 +1,21 @@
 from abc import ABC, abstractmethod
-from typing import Any, Generic, Type, TypeVar
+from functools import lru_cache
+from typing import Any, Generic, Iterable, Sequence, Type, TypeVar
 
-from sqlalchemy import delete, insert, select, update
+from sqlalchemy import and_, any_, bindparam, delete, insert, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Executable
 
 from src.core.database import Base
 
 ModelType = TypeVar("ModelType", bound=Base)
 
+# Готовых конструкций на каждый сборщик (модель и форма аргументов);
+# форм столько, сколько вызовов в коде, предел - на случай динамических
+STATEMENT_CACHE_SIZE = 256
+
 
 class AbstractRepository(ABC):
     @abstractmethod
@@ -18,52 +26,211 @@ class AbstractRepository(ABC):
     async def get_all(self, **filter_by):
         raise NotImplementedError
 
+    @abstractmethod
+    async def get_many(self, ids: Sequence[Any]):
+        raise NotImplementedError
+
     @abstractmethod
     async def create(self, **data):
         raise NotImplementedError
 
+    @abstractmethod
+    async def create_many(self, rows: list[dict], returning: bool = True):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def upsert_many(
+        self,
+        rows: list[dict],
+        conflict_cols: Sequence[str],
+        update_cols: Sequence[str] = (),
+    ):
+        raise NotImplementedError
+
     @abstractmethod
     async def update(self, pk: Any, **data):
         raise NotImplementedError
 
+    @abstractmethod
+    async def update_many(self, rows: list[dict]):
+        raise NotImplementedError
+
     @abstractmethod
     async def delete(self, **filter_by):
         raise NotImplementedError
 
 
 class SQLAlchemyRepository(AbstractRepository, Generic[ModelType]):
+    """
+    Типовые запросы к одной модели.
+
+    Конструкции запросов собираются один раз на модель и форму аргументов
+    (какие поля в фильтре, какие обновляются) и дальше переиспользуются
+    с bindparam: сборка select(...).filter_by(...) и расчет ее ключа для
+    кэша компиляции SQLAlchemy стоят десятки микросекунд на вызов, а для
+    готовой конструкции ключ уже посчитан.
+    """
+
     def __init__(self, model: Type[ModelType], session: AsyncSession):
         self.model = model
         self.session = session
 
+    # Сборщики конструкций: lru_cache на classmethod - ключ включает класс,
+    # так что у подклассов свои записи, а размер кэша ограничен
+
+    @classmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _filtered_stmt(cls, model: Type[Base], kind: str, shape: tuple) -> Executable:
+        conditions = [
+            (
+                getattr(model, key).is_(None)
+                if is_null
+                else getattr(model, key) == bindparam(f"w_{key}")
+            )
+            for key, is_null in shape
+        ]
+        base = select(model) if kind == "select" else delete(model)
+        return base.where(and_(*conditions)) if conditions else base
+
+    @classmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _get_many_stmt(cls, model: Type[Base]) -> Executable:
+        return (
+            select(model)
+            .where(model.id == any_(bindparam("ids", type_=ARRAY(model.id.type))))
+            .order_by(model.id)
+        )
+
+    @classmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _insert_stmt(cls, model: Type[Base], returning: bool) -> Executable:
+        return insert(model).returning(model) if returning else insert(model)
+
+    @classmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _update_stmt(cls, model: Type[Base], shape: tuple) -> Executable:
+        return (
+            update(model)
+            .where(model.id == bindparam("pk"))
+            .values({key: bindparam(f"v_{key}") for key in shape})
+            .returning(model)
+            # Объект в сессии получает значения из RETURNING
+            .execution_options(populate_existing=True)
+        )
+
+    @classmethod
+    @lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+    def _update_many_stmt(cls, model: Type[Base]) -> Executable:
+        return update(model)
+
+    def _filtered(self, kind: str, filter_by: dict) -> tuple[Executable, dict]:
+        """
+        select/delete с условием filter_by; None в фильтре - IS NULL,
+        как в filter_by, поэтому он тоже часть формы.
+        """
+        shape = tuple(sorted((key, value is None) for key, value in filter_by.items()))
+        params = {f"w_{k}": v for k, v in filter_by.items() if v is not None}
+        return self._filtered_stmt(self.model, kind, shape), params
+
     async def get_one_or_none(self, **filter_by) -> ModelType | None:
-        stmt = select(self.model).filter_by(**filter_by)
-        result = await self.session.execute(stmt)
+        stmt, params = self._filtered("select", filter_by)
+        result = await self.session.execute(stmt, params)
         return result.scalar_one_or_none()
 
     async def get_all(self, **filter_by) -> list[ModelType]:
-        stmt = select(self.model).filter_by(**filter_by)
-        result = await self.session.execute(stmt)
+        stmt, params = self._filtered("select", filter_by)
+        result = await self.session.execute(stmt, params)
         return [row[0] for row in result.all()]
 
+    async def get_many(self, ids: Sequence[Any]) -> list[ModelType]:
+        """
+        Объекты с id из ids (в порядке id; отсутствующие пропускаются).
+
+        id = ANY(:ids) с массивом - один и тот же SQL при любом числе id,
+        поэтому и подготовленный запрос asyncpg у всех вызовов общий.
+        """
+        stmt = self._get_many_stmt(self.model)
+        result = await self.session.execute(stmt, {"ids": list(ids)})
+        return list(result.scalars())
+
     async def create(self, **data) -> ModelType:
-        stmt = insert(self.model).values(**data).returning(self.model)
-        result = await self.session.execute(stmt)
+        result = await self.session.execute(self._insert_stmt(self.model, True), data)
         # await self.session.commit()
         return result.scalar_one()
 
+    async def create_many(
+        self, rows: list[dict], returning: bool = True
+    ) -> list[ModelType]:
+        """
+        Вставляет rows (ключи - атрибуты модели) пачкой.
+
+        С returning вставка идет через insertmanyvalues (многострочные
+        VALUES ... RETURNING) и возвращает созданные объекты; без него -
+        через executemany и возвращает пустой список.
+        """
+        if not rows:
+            return []
+        stmt = self._insert_stmt(self.model, returning)
+        if not returning:
+            await self.session.execute(stmt, rows)
+            return []
+        return list(await self.session.scalars(stmt, rows))
+
+    async def upsert_many(
+        self,
+        rows: list[dict],
+        conflict_cols: Sequence[str],
+        update_cols: Sequence[str] = (),
+    ) -> list[ModelType]:
+        """
+        INSERT ... ON CONFLICT (conflict_cols) DO UPDATE SET update_cols
+        (без update_cols - DO NOTHING) для пачки rows.
+
+        Возвращает вставленные и обновленные объекты (уже загруженные в
+        сессию - с новыми значениями).
+
+        Конструкция собирается заново и в кэш сборщиков не попадает:
+        у ON CONFLICT нет ключа кэша SQLAlchemy, и запрос все равно
+        компилируется на каждый вызов - один раз на пачку, так что готовая
+        конструкция ничего бы не сэкономила.
+        """
+        if not rows:
+            return []
+        columns = self.model.__mapper__.columns
+        stmt = pg_insert(self.model)
+        targets = [columns[name] for name in conflict_cols]
+        if update_cols:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=targets,
+                set_={
+                    columns[name].name: stmt.excluded[columns[name].name]
+                    for name in update_cols
+                },
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=targets)
+        stmt = stmt.returning(self.model).execution_options(populate_existing=True)
+        return list(await self.session.scalars(stmt, rows))
+
     async def update(self, pk: Any, **data) -> ModelType | None:
-        stmt = (
-            update(self.model)
-            .where(self.model.id == pk)
-            .values(**data)
-            .returning(self.model)
-        )
-        result = await self.session.execute(stmt)
+        stmt = self._update_stmt(self.model, tuple(sorted(data)))
+        params = {f"v_{key}": value for key, value in data.items()}
+        result = await self.session.execute(stmt, {"pk": pk, **params})
         # await self.session.commit()
         return result.scalar_one_or_none()
 
+    async def update_many(self, rows: Iterable[dict]) -> None:
+        """
+        Обновляет объекты по первичному ключу: в каждой строке - ключ
+        (id) и новые значения. Строки с одинаковым набором полей уходят
+        одним executemany.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        await self.session.execute(self._update_many_stmt(self.model), rows)
+
     async def delete(self, **filter_by) -> None:
-        stmt = delete(self.model).filter_by(**filter_by)
-        await self.session.execute(stmt)
+        stmt, params = self._filtered("delete", filter_by)
+        await self.session.execute(stmt, params)
         # await self.session.commit()
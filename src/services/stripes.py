@@ -0,0 +1,129 @@
+import asyncio
+import logging
+
+from sqlalchemy import Row, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.models.tables import Account, AccountStripe
+
+logger = logging.getLogger(__name__)
+
+# Ключ pg_try_advisory_xact_lock: сворачивает полосы один воркер за раз,
+# иначе UPDATE accounts из разных воркеров могли бы взаимоблокироваться
+FOLD_LOCK_KEY = 0x5_7121_9E5
+
+
+class StripeService:
+    """Полосы (sub-balance) горячих счетов: настройка и сворачивание."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def set_stripes(self, account_id: int, stripes: int) -> Row | None:
+        """
+        Меняет число полос счета; возвращает (id, user_id, stripes, balance).
+
+        Полный баланс при этом не меняется. При переходе на одну полосу
+        остаток полос сразу сворачивается в строку счета.
+        """
+        # Та же блокировка, что у fold(): иначе встречное сворачивание
+        # (полосы, затем accounts) и этот запрос (accounts, затем полосы)
+        # могли бы взаимоблокироваться
+        await self.session.execute(select(func.pg_advisory_xact_lock(FOLD_LOCK_KEY)))
+        changed = await self.session.execute(
+            update(Account)
+            .where(Account.id == account_id)
+            .values(stripes=stripes)
+            .returning(Account.id)
+        )
+        if changed.first() is None:
+            return None
+        if stripes == 1:
+            await self.session.execute(self._fold_stmt(account_id=account_id))
+        row = (
+            await self.session.execute(
+                select(
+                    Account.id, Account.user_id, Account.stripes, Account.balance
+                ).where(Account.id == account_id)
+            )
+        ).one()
+        await self.session.commit()
+        return row
+
+    async def fold(self, limit: int) -> int:
+        """
+        Переносит до limit ненулевых полос в accounts; возвращает число счетов.
+
+        Полосы, занятые идущими сейчас зачислениями, пропускаются
+        (SKIP LOCKED) и будут свернуты в следующий раз. Полный баланс
+        (Account.balance) при сворачивании не меняется, поэтому кэши
+        балансов не трогаются.
+        """
+        locked = await self.session.scalar(
+            select(func.pg_try_advisory_xact_lock(FOLD_LOCK_KEY))
+        )
+        if not locked:
+            await self.session.rollback()
+            return 0
+        folded = await self.session.execute(self._fold_stmt(limit=limit))
+        count = len(folded.all())
+        await self.session.commit()
+        return count
+
+    @staticmethod
+    def _fold_stmt(limit: int | None = None, account_id: int | None = None):
+        """
+        WITH pending AS (SELECT ... FROM account_stripes WHERE balance <> 0
+                         FOR UPDATE SKIP LOCKED LIMIT :limit),
+             moved AS (UPDATE account_stripes SET balance = balance - pending.balance
+                       ... RETURNING account_id, pending.balance),
+             totals AS (SELECT account_id, sum(balance) ... GROUP BY account_id)
+        UPDATE accounts SET balance = balance + totals.total ... RETURNING id
+
+        С account_id - все полосы одного счета, с ожиданием блокировок.
+        """
+        pending = (
+            select(AccountStripe.id, AccountStripe.account_id, AccountStripe.balance)
+            .where(AccountStripe.balance != 0)
+            .order_by(AccountStripe.id)
+        )
+        if account_id is None:
+            pending = pending.limit(limit).with_for_update(skip_locked=True)
+        else:
+            pending = pending.where(AccountStripe.account_id == account_id)
+            pending = pending.with_for_update()
+        pending = pending.cte("pending")
+        moved = (
+            update(AccountStripe)
+            .where(AccountStripe.id == pending.c.id)
+            .values(balance=AccountStripe.balance - pending.c.balance)
+            .returning(pending.c.account_id, pending.c.balance)
+            .cte("moved")
+        )
+        totals = (
+            select(moved.c.account_id, func.sum(moved.c.balance).label("total"))
+            .group_by(moved.c.account_id)
+            .cte("totals")
+        )
+        return (
+            update(Account)
+            .where(Account.id == totals.c.account_id)
+            .values(folded_balance=Account.folded_balance + totals.c.total)
+            .returning(Account.id)
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def fold_stripes_periodically(
+    session_maker: async_sessionmaker[AsyncSession], interval: float, limit: int
+) -> None:
+    """Фоновая задача воркера: сворачивает полосы раз в interval секунд."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with session_maker() as session:
+                folded = await StripeService(session).fold(limit)
+            if folded:
+                logger.debug("Folded stripes of %s accounts", folded)
+        except Exception as e:
+            logger.warning("Failed to fold account stripes: %s", e)
@@ -1,10 +1,21 @@
-from sqlalchemy import select  # <--- ДОБАВЛЕНО
+from typing import AsyncIterator
+
+from sqlalchemy import func, select  # <--- ДОБАВЛЕНО
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from src.api.schemas import UserUpdate
-from src.core.security import hash_password
-from src.models.tables import User
+from src.core.config import settings
+from src.core.security import hash_password_async
+from src.core.warmup import hot_statements
+from src.models.tables import Account, User
+from src.services.balances import AccountBalance, balance_cache
+from src.services.principals import (
+    PRINCIPAL_CHANNEL,
+    Principal,
+    invalidate_principal,
+    principal_cache,
+)
 from src.services.repository import SQLAlchemyRepository
 
 
@@ -19,10 +30,45 @@ class UserService:
     async def get_user_by_email(self, email: str) -> User | None:
         return await self.repo.get_one_or_none(email=email)
 
+    async def load_principal(self, email: str) -> Principal | None:
+        """
+        Пользователь для аутентификации из БД (при промахе кэша воркера
+        principal_cache); прочитанный сохраняется в кэш.
+        """
+        row = (await self.session.execute(self._principal_query(email))).one_or_none()
+        if row is None:
+            return None
+        principal = Principal(*row)
+        principal_cache.set(email, principal)
+        return principal
+
+    @staticmethod
+    def _principal_query(email: str):
+        # Читаем только нужные колонки, без hashed_password
+        return select(User.id, User.email, User.full_name, User.is_admin).where(
+            User.email == email
+        )
+
+    async def get_user_accounts(self, user_id: int) -> list[AccountBalance]:
+        """Счета пользователя из БД, без загрузки ORM-объектов."""
+        query = (
+            select(Account.id, Account.balance, Account.version)
+            .where(Account.user_id == user_id)
+            .order_by(Account.id)
+        )
+        result = await self.session.execute(query)
+        return [AccountBalance(*row) for row in result]
+
+    async def get_user_balances(self, user_id: int) -> tuple[AccountBalance, ...]:
+        """Счета пользователя: из кэша балансов воркера или из БД."""
+        return await balance_cache.get_or_load(
+            user_id, lambda: self.get_user_accounts(user_id)
+        )
+
     async def create_user(
         self, email: str, password: str, full_name: str | None = None
     ) -> User:
-        hashed_pwd = hash_password(password)
+        hashed_pwd = await hash_password_async(password)
         new_user = await self.repo.create(
             email=email,
             full_name=full_name,
@@ -32,26 +78,86 @@ class UserService:
         await self.session.commit()  # <--- ДОБАВЛЕН КОММИТ
         return new_user
 
-    async def get_all_users(self) -> list[User]:
+    async def get_all_users(
+        self, limit: int = 100, after: int | None = None
+    ) -> list[User]:
+        """Страница пользователей со счетами, keyset-пагинация по users.id."""
         # query = select(User).options(selectinload(User.accounts))
         # result = await self.repo.session.execute(query) <-- было так, но repo.session устарело
-        query = select(User).options(selectinload(User.accounts))
+        query = (
+            select(User)
+            .options(selectinload(User.accounts))
+            .order_by(User.id)
+            .limit(limit)
+        )
+        if after is not None:
+            query = query.where(User.id > after)
         result = await self.session.execute(query)  # <--- используем self.session
         users = result.scalars().unique().all()
         return list(users)
 
+    async def stream_users_with_accounts(
+        self, chunk_size: int = 1000
+    ) -> AsyncIterator[dict]:
+        """
+        Все пользователи со счетами, по одному, через серверный курсор.
+
+        Один LEFT JOIN, упорядоченный по users.id: строки одного пользователя
+        идут подряд и собираются в словарь, так что в памяти одновременно
+        находятся только текущий пользователь и пачка из chunk_size строк.
+        """
+        query = (
+            select(User.id, User.email, User.full_name, Account.id, Account.balance)
+            .outerjoin(Account, Account.user_id == User.id)
+            .order_by(User.id, Account.id)
+            .execution_options(yield_per=chunk_size)
+        )
+        result = await self.session.stream(query)
+        current: dict | None = None
+        async for user_id, email, full_name, account_id, balance in result:
+            if current is None or current["id"] != user_id:
+                if current is not None:
+                    yield current
+                current = {
+                    "id": user_id,
+                    "email": email,
+                    "full_name": full_name,
+                    "accounts": [],
+                }
+            if account_id is not None:
+                current["accounts"].append({"id": account_id, "balance": balance})
+        if current is not None:
+            yield current
+
     async def update_user(self, user_id: int, update_data: UserUpdate) -> User | None:
         update_dict = update_data.model_dump(exclude_unset=True)
         if "password" in update_dict:
-            update_dict["hashed_password"] = hash_password(update_dict.pop("password"))
+            update_dict["hashed_password"] = await hash_password_async(
+                update_dict.pop("password")
+            )
 
         if not update_dict:
             return await self.get_user_by_id(user_id)
 
         updated_user = await self.repo.update(pk=user_id, **update_dict)
+        await self._notify_principal_changed(user_id)
         await self.session.commit()  # <--- ДОБАВЛЕН КОММИТ
+        invalidate_principal(user_id)
         return updated_user
 
     async def delete_user(self, user_id: int) -> None:
         await self.repo.delete(id=user_id)
+        await self._notify_principal_changed(user_id)
         await self.session.commit()  # <--- ДОБАВЛЕН КОММИТ
+        invalidate_principal(user_id)
+
+    async def _notify_principal_changed(self, user_id: int) -> None:
+        """NOTIFY в той же транзакции: другие воркеры узнают после коммита."""
+        if settings.PRINCIPAL_CACHE_NOTIFY:
+            await self.session.execute(
+                select(func.pg_notify(PRINCIPAL_CHANNEL, str(user_id)))
+            )
+
+
+# Запросы каждого аутентифицированного запроса - готовятся при прогреве пула
+hot_statements.register("principal_by_email", lambda: UserService._principal_query(""))
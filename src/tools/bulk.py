@@ -0,0 +1,201 @@
+"""
+Массовая загрузка и выгрузка платежей и счетов через COPY.
+
+    python -m src.tools.bulk import payments payments.csv [--chunk-size 50000]
+    python -m src.tools.bulk import accounts accounts.ndjson
+    python -m src.tools.bulk export payments out.csv [--since 2025-01-01]
+    python -m src.tools.bulk export accounts - --format ndjson
+
+Формат - CSV с заголовком или NDJSON (по расширению .ndjson/.jsonl или
+--format). Платежи: transaction_id, user_id, account_id, amount и
+необязательный created_at (ISO; без него - момент загрузки). Счета: id,
+user_id, balance (начальный). Выгрузка пишет те же поля, ее можно
+загрузить обратно.
+
+Загрузка идет пачками по --chunk-size строк, каждая - своя транзакция.
+После каждой пачки номер последней строки пишется в контрольную точку
+(--checkpoint, по умолчанию <файл>.checkpoint); повторный запуск
+продолжает с нее. Уже загруженные transaction_id пропускаются, так что
+повтор пачки безопасен.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+
+from src.core.config import settings
+from src.core.database import engines
+from src.services.bulk import (
+    BulkError,
+    BulkImport,
+    account_record,
+    copy_out,
+    export_query,
+    payment_record,
+    read_rows,
+)
+from src.services.partitions import PaymentPartitions, month_partition
+
+DEFAULT_CHUNK_SIZE = 50_000
+
+
+def _format(path: str, fmt: str | None) -> str:
+    if fmt:
+        return fmt
+    return "ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv"
+
+
+def _load_checkpoint(path: str, source: str, kind: str) -> dict:
+    empty = {"source": source, "kind": kind, "rows": 0}
+    empty.update(imported=0, duplicates=0, rejected=0)
+    if not os.path.exists(path):
+        return empty
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("source") != source or checkpoint.get("kind") != kind:
+        raise BulkError(f"checkpoint {path} belongs to another import")
+    return checkpoint
+
+
+def _save_checkpoint(path: str, checkpoint: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+class _Partitions:
+    """Секции payments, покрывающие даты загружаемых платежей."""
+
+    def __init__(self):
+        self.keeper = PaymentPartitions(
+            engines.primary, settings.PAYMENTS_PARTITIONS_LOCK_TIMEOUT_MS
+        )
+        self.since: datetime | None = None
+
+    async def cover(self, records: list[tuple]) -> None:
+        if self.since is None:
+            await self.keeper.ensure(settings.PAYMENTS_PARTITIONS_AHEAD)
+            partitions = await self.keeper.list_partitions()
+            self.since = min(p.lower for p in partitions)
+        oldest = min((r[-1] for r in records if r[-1] is not None), default=None)
+        if oldest is not None and oldest < self.since:
+            await self.keeper.ensure(settings.PAYMENTS_PARTITIONS_AHEAD, since=oldest)
+            self.since = month_partition(oldest).lower
+
+
+async def run_import(args: argparse.Namespace) -> dict:
+    source = os.path.abspath(args.path)
+    checkpoint_path = args.checkpoint or f"{args.path}.checkpoint"
+    checkpoint = _load_checkpoint(checkpoint_path, source, args.kind)
+    to_record = payment_record if args.kind == "payments" else account_record
+    partitions = _Partitions() if args.kind == "payments" else None
+
+    rows = read_rows(args.path, _format(args.path, args.format), checkpoint["rows"])
+    started, done = time.perf_counter(), 0
+    async with engines.primary.connect() as conn:
+        bulk = BulkImport(conn)
+        await bulk.prepare()
+        while chunk := list(islice(rows, args.chunk_size)):
+            records = [to_record(number, row) for number, row in chunk]
+            if partitions is not None:
+                await partitions.cover(records)
+                result = await bulk.import_payments(records)
+            else:
+                result = await bulk.import_accounts(records)
+            for key, value in result._asdict().items():
+                checkpoint[key] += value
+            checkpoint["rows"] = chunk[-1][0]
+            _save_checkpoint(checkpoint_path, checkpoint)
+
+            done += len(records)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{args.kind}: line {checkpoint['rows']},"
+                f" {done / elapsed:,.0f} rows/s",
+                file=sys.stderr,
+            )
+    elapsed = time.perf_counter() - started
+    return {
+        **checkpoint,
+        "rows_this_run": done,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(done / elapsed) if elapsed else 0,
+    }
+
+
+async def run_export(args: argparse.Namespace) -> dict:
+    query = export_query(
+        args.kind,
+        since=datetime.fromisoformat(args.since) if args.since else None,
+        until=datetime.fromisoformat(args.until) if args.until else None,
+        account_id=args.account_id,
+    )
+    to_stdout = args.path == "-"
+    out = sys.stdout.buffer if to_stdout else open(args.path, "wb")
+
+    async def write(data: bytes) -> None:
+        out.write(data)
+
+    started = time.perf_counter()
+    try:
+        async with engines.primary.connect() as conn:
+            rows = await copy_out(conn, query, _format(args.path, args.format), write)
+    finally:
+        if to_stdout:
+            out.flush()
+        else:
+            out.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "kind": args.kind,
+        "rows": rows,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else 0,
+    }
+
+
+async def run(args: argparse.Namespace) -> int:
+    engines.start()
+    try:
+        if args.command == "import":
+            result = await run_import(args)
+        else:
+            result = await run_export(args)
+    except BulkError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        await engines.dispose()
+    # Сводка - в stdout, если туда не идет сама выгрузка
+    summary = sys.stderr if getattr(args, "path", None) == "-" else sys.stdout
+    print(json.dumps(result, indent=2), file=summary)
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("import")
+    load.add_argument("kind", choices=["payments", "accounts"])
+    load.add_argument("path")
+    load.add_argument("--format", choices=["csv", "ndjson"])
+    load.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    load.add_argument("--checkpoint", help="default: <path>.checkpoint")
+    dump = commands.add_parser("export")
+    dump.add_argument("kind", choices=["payments", "accounts"])
+    dump.add_argument("path", help="output file or - for stdout")
+    dump.add_argument("--format", choices=["csv", "ndjson"])
+    dump.add_argument("--since", help="ISO date, payments only")
+    dump.add_argument("--until", help="ISO date (exclusive), payments only")
+    dump.add_argument("--account-id", type=int)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
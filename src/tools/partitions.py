@@ -0,0 +1,81 @@
+"""
+Обслуживание месячных секций payments (для cron или ручного запуска).
+
+    python -m src.tools.partitions list
+    python -m src.tools.partitions ensure --ahead 3 [--since 2025-01-01]
+    python -m src.tools.partitions detach --keep-months 24 [--drop] [--force]
+
+ensure создает недостающие секции (воркеры делают то же раз в
+PAYMENTS_PARTITIONS_CHECK_INTERVAL_SECONDS), detach отсоединяет секции
+старше keep-months месяцев и переносит их в схему --archive-schema
+(или удаляет с --drop). Без --force секция не отсоединяется, пока
+снимки балансов ее счетов не покрывают ее целиком.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+
+from src.core.config import settings
+from src.core.database import engines
+from src.services.partitions import (
+    ARCHIVE_SCHEMA,
+    PartitionError,
+    PaymentPartitions,
+)
+
+
+async def run(args: argparse.Namespace) -> int:
+    partitions = PaymentPartitions(
+        engines.start(), settings.PAYMENTS_PARTITIONS_LOCK_TIMEOUT_MS
+    )
+    try:
+        if args.command == "list":
+            result = [
+                {
+                    "name": p.name,
+                    "from": p.lower.isoformat(),
+                    "to": p.upper.isoformat(),
+                    "detach_pending": p.detach_pending,
+                }
+                for p in await partitions.list_partitions()
+            ]
+        elif args.command == "ensure":
+            since = datetime.fromisoformat(args.since) if args.since else None
+            result = {"created": await partitions.ensure(args.ahead, since)}
+        else:
+            result = {"detached": [], "errors": []}
+            archive_schema = None if args.drop else args.archive_schema
+            for partition in await partitions.expired(args.keep_months):
+                try:
+                    await partitions.detach(partition.name, archive_schema, args.force)
+                except PartitionError as e:
+                    result["errors"].append(str(e))
+                    # Более новые секции тем более не покрыты снимками
+                    break
+                result["detached"].append(partition.name)
+    finally:
+        await engines.dispose()
+    print(json.dumps(result, indent=2))
+    return 1 if isinstance(result, dict) and result.get("errors") else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list")
+    ensure = commands.add_parser("ensure")
+    ensure.add_argument("--ahead", type=int, default=settings.PAYMENTS_PARTITIONS_AHEAD)
+    ensure.add_argument("--since", help="ISO date: also create partitions back to it")
+    detach = commands.add_parser("detach")
+    detach.add_argument("--keep-months", type=int, required=True)
+    detach.add_argument("--archive-schema", default=ARCHIVE_SCHEMA)
+    detach.add_argument("--drop", action="store_true")
+    detach.add_argument("--force", action="store_true")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
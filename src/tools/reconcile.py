@@ -0,0 +1,81 @@
+"""
+Сверка балансов счетов с суммой их платежей.
+
+    python -m src.tools.reconcile [--report drift.ndjson] [--concurrency 4]
+    python -m src.tools.reconcile --repair [--from-payments]
+
+Каждое расхождение - строка NDJSON в --report (account_id, user_id,
+balance, expected, drift); в stdout - итог. С --repair расхождения
+исправляются по ходу сверки, пачка - одна транзакция. --from-payments
+считает начальный баланс нулевым: ожидаемый баланс - только сумма
+платежей (иначе начальный баланс берется из самого раннего снимка).
+Код выхода 2 - найдены неисправленные расхождения.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from src.core.database import engines
+from src.services.reconcile import Drift, Reconciler
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+
+async def run(args: argparse.Namespace) -> int:
+    reconciler = Reconciler(
+        engines.start(),
+        chunk_size=args.chunk_size,
+        concurrency=args.concurrency,
+        from_payments=args.from_payments,
+    )
+    started = time.perf_counter()
+    with open(args.report, "w") as report:
+
+        def write(drift: Drift) -> None:
+            line = {
+                "account_id": drift.account_id,
+                "user_id": drift.user_id,
+                "balance": str(drift.balance),
+                "expected": str(drift.expected),
+                "drift": str(drift.drift),
+            }
+            report.write(json.dumps(line) + "\n")
+
+        try:
+            stats = await reconciler.run(write, repair=args.repair)
+        finally:
+            await engines.dispose()
+    elapsed = time.perf_counter() - started
+    result = {
+        "accounts": stats.accounts,
+        "drifted": stats.drifted,
+        "repaired": stats.repaired,
+        "total_drift": str(stats.total_drift),
+        "report": args.report,
+        "seconds": round(elapsed, 3),
+        "accounts_per_second": round(stats.accounts / elapsed) if elapsed else 0,
+    }
+    print(json.dumps(result, indent=2))
+    return 2 if stats.drifted > stats.repaired else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--report", default="reconcile-report.ndjson")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="parallel chunks, each on its own pool connection",
+    )
+    parser.add_argument("--repair", action="store_true")
+    parser.add_argument("--from-payments", action="store_true")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()